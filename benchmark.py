@@ -0,0 +1,191 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from repair_dataset import RePAIRDataset
+from repair_dataset.reconstruct import reassemble_2d
+from repair_dataset.synthetic import make_synthetic_dataset, default_puzzle_names, FLIPPED_V2_PUZZLES
+from repair_dataset.patches import patch_2ds_v2_0_1, patch_2ds_v2_0_2, patch_2ds_v3_b1, patch_2ds_v3_b1_randrot
+
+from evaluate import evaluate_puzzle
+
+
+@contextlib.contextmanager
+def _quiet():
+    # datasets and patches print progress, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def _timeit(fn, repeat, setup=None, n_items=None):
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        with _quiet():
+            t0 = time.perf_counter()
+            fn(arg) if setup is not None else fn()
+            times.append(time.perf_counter() - t0)
+
+    times = np.array(times)
+    res = {
+        'n': repeat,
+        'mean_s': float(times.mean()),
+        'min_s': float(times.min()),
+        'max_s': float(times.max()),
+        'std_s': float(times.std()),
+    }
+    if n_items is not None:
+        res['items_per_s'] = float(n_items / times.mean())
+    return res
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=Path(__file__).parent)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _dataset(path, version, **kwargs):
+    with _quiet():
+        return RePAIRDataset(path, version=version, variant='2D_SOLVED', managed_mode=False, **kwargs)
+
+
+def run_benchmarks(work_dir, n_puzzles=8, n_fragments=(4, 12), fragment_size=(64, 160), repeat=5, seed=0):
+
+    work_dir = Path(work_dir)
+    names = sorted(set(default_puzzle_names(n_puzzles)) | set(FLIPPED_V2_PUZZLES))
+
+    v2_path = make_synthetic_dataset(work_dir / 'v2', names=names, n_fragments=n_fragments,
+                                     fragment_size=fragment_size, metadata_version=2, seed=seed)
+    v3_path = make_synthetic_dataset(work_dir / 'v3', names=names, n_fragments=n_fragments,
+                                     fragment_size=fragment_size, metadata_version=3, seed=seed)
+
+    results = {}
+
+    ################### Dataset ###################
+
+    for ver, path in [('2', v2_path), ('3-beta.1', v3_path)]:
+        results[f'construct_v{ver}'] = _timeit(lambda: _dataset(path, ver), repeat)
+
+        unsup = _dataset(path, ver)
+        sup = _dataset(path, ver, supervised_mode=True)
+        n = len(unsup)
+
+        results[f'getitem_unsupervised_v{ver}'] = _timeit(lambda: [unsup[i] for i in range(n)], repeat, n_items=n)
+        results[f'getitem_supervised_v{ver}'] = _timeit(lambda: [sup[i] for i in range(n)], repeat, n_items=n)
+
+        n_frags = sum(len(unsup[i]['fragments']) for i in range(n))
+        results[f'iterate_supervised_v{ver}'] = _timeit(lambda: [x for x in sup], repeat, n_items=n_frags)
+
+    rot = _dataset(v3_path, '3-beta.1', supervised_mode=True, apply_random_rotations=True)
+    results['getitem_supervised_randrot_v3-beta.1'] = _timeit(lambda: [rot[i] for i in range(len(rot))], repeat, n_items=len(rot))
+
+    ################### Patches ###################
+
+    def fresh_copy(src):
+        def setup():
+            dst = Path(tempfile.mkdtemp(dir=work_dir))
+            shutil.rmtree(dst)
+            shutil.copytree(src, dst)
+            return dst
+        return setup
+
+    results['patch_2ds_v2_0_1'] = _timeit(patch_2ds_v2_0_1, repeat, setup=fresh_copy(v2_path))
+    results['patch_2ds_v2_0_2'] = _timeit(patch_2ds_v2_0_2, repeat, setup=fresh_copy(v2_path))
+    results['patch_2ds_v3_b1'] = _timeit(patch_2ds_v3_b1, repeat, setup=fresh_copy(v2_path))
+
+    v3_b1_path = fresh_copy(v2_path)()
+    with _quiet():
+        patch_2ds_v3_b1(v3_b1_path)
+    results['patch_2ds_v3_b1_randrot'] = _timeit(patch_2ds_v3_b1_randrot, repeat, setup=fresh_copy(v3_b1_path))
+
+    ################### Reconstruction and evaluation ###################
+
+    samples = []
+    for x, data in _dataset(v3_path, '3-beta.1', supervised_mode=True):
+        for frag, frag_gt in zip(x['fragments'], data['fragments']):
+            frag['position_2d'] = frag_gt['position_2d']
+        samples.append(x['fragments'])
+    results['reassemble_2d'] = _timeit(lambda: [reassemble_2d(s) for s in samples], repeat, n_items=len(samples))
+
+    metadata = [_dataset(v2_path, '2')._get_metadata(i) for i in range(len(names))]
+    results['evaluate_puzzle'] = _timeit(lambda: [evaluate_puzzle(d) for d in metadata], repeat, n_items=len(metadata))
+
+    return results
+
+
+def compare(results, baseline):
+    print(f"{'benchmark':45s} {'mean [ms]':>12s} {'baseline [ms]':>14s} {'ratio':>8s}")
+    for name, res in results.items():
+        base = baseline.get(name)
+        line = f"{name:45s} {res['mean_s'] * 1e3:12.2f}"
+        if base is not None:
+            line += f" {base['mean_s'] * 1e3:14.2f} {res['mean_s'] / base['mean_s']:8.2f}"
+        print(line)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark RePAIRDataset on synthetic data")
+    parser.add_argument('--output', default='bench_results.json', help='Output JSON file')
+    parser.add_argument('--baseline', default=None, help='Previous results JSON to compare against')
+    parser.add_argument('--work-dir', default=None, help='Where to generate the synthetic data (default: temporary folder)')
+    parser.add_argument('--puzzles', type=int, default=8, help='Number of synthetic puzzles (plus the ones patched by v2.0.1)')
+    parser.add_argument('--fragments', type=int, nargs=2, default=(4, 12), help='Min and max fragments per puzzle')
+    parser.add_argument('--size', type=int, nargs=2, default=(64, 160), help='Min and max fragment size in pixels')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions of every benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic data')
+    args = parser.parse_args()
+
+    config = {
+        'puzzles': args.puzzles,
+        'fragments': list(args.fragments),
+        'size': list(args.size),
+        'repeat': args.repeat,
+        'seed': args.seed,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(args.work_dir) if args.work_dir is not None else Path(tmp)
+        results = run_benchmarks(work_dir,
+                                 n_puzzles=args.puzzles,
+                                 n_fragments=tuple(args.fragments),
+                                 fragment_size=tuple(args.size),
+                                 repeat=args.repeat,
+                                 seed=args.seed)
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'results': results,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+
+    compare(results, baseline)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
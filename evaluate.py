@@ -7,7 +7,10 @@ import numpy as np
 from PIL import Image
 
 from repair_dataset import RePAIRDataset
-from repair_dataset.utils import centroid_rgba
+from repair_dataset.utils import centroid_rgba, alpha_channel
+from repair_dataset.poses import get_poses, centroid_to_topleft
+from repair_dataset.reconstruct import TiledSolution, join_tiles, reduced_size, write_bands, image_bands, coverage_rows
+from repair_dataset.png import PNGStreamWriter
 
 
 def save_resized(image, path, downsize_factor=4):
@@ -15,6 +18,13 @@ def save_resized(image, path, downsize_factor=4):
     new_size = (width // downsize_factor, height // downsize_factor)
     image.resize(new_size, Image.LANCZOS).save(str(path))
 
+def _fragment_path(path, frag):
+    # v3 metadata comes with resolved image paths
+    if 'image_path' in frag:
+        return Path(frag['image_path'])
+    return path / frag['filename'].replace('.obj', '.png')
+
+
 def evaluate_puzzle(data):
 
     path = Path(data['path'])
@@ -38,17 +48,17 @@ def evaluate_puzzle(data):
         if position_key not in fragments[0]:
             raise RuntimeError("Fragment does not contain position key 'pixel_position' nor 'position_2d'")
 
+    images = []
     for frag in fragments:
-        img_path = path / frag['filename'].replace('.obj', '.png')
+        img_path = _fragment_path(path, frag)
         img_pil = Image.open(img_path).convert('RGBA')
-        img_cropped_pil = img_pil.crop((img_pil.split()[-1]).getbbox())
-        
-        # pixel_position refers to the position of the centroids, but we want the position of the images
-        d_x,d_y = centroid_rgba(img_cropped_pil)
-        x = int(frag[position_key][0] - d_x)
-        y = int(frag[position_key][1] - d_y)
+        images.append(img_pil.crop((img_pil.split()[-1]).getbbox()))
+
+    # pixel_position refers to the position of the centroids, but we want the position of the images
+    topleft = centroid_to_topleft(get_poses(fragments, position_key), [centroid_rgba(img) for img in images]).astype(int)
 
-        solution_pil.paste(img_cropped_pil, (x, y), img_cropped_pil)
+    for img_cropped_pil, (x, y) in zip(images, topleft):
+        solution_pil.paste(img_cropped_pil, (int(x), int(y)), img_cropped_pil)
 
     a = np.array(solution_pil.split()[-1])
     b = np.array(gt_pil.split()[-1])
@@ -65,6 +75,69 @@ def evaluate_puzzle(data):
     return delta, solution_pil, gt_pil, mask_pil
 
 
+def evaluate_puzzle_tiled(data, tile_size=512, output_prefix=None, downsize_factor=4):
+    """
+    Same difference as `evaluate_puzzle`, with the solution composited and compared tile by tile: only the alpha
+    of the preview is kept, fragments are loaded when their tiles are rendered. With `output_prefix`, the GT,
+    solution and difference images are saved as by `evaluate_gt`, streamed band by band (reduced by a box filter).
+
+    Returns the difference, in percent.
+    """
+    path = Path(data['path'])
+    fragments = data['fragments']
+
+    position_key = 'pixel_position' if 'pixel_position' in fragments[0] else 'position_2d'
+    if position_key not in fragments[0]:
+        raise RuntimeError("Fragment does not contain position key 'pixel_position' nor 'position_2d'")
+
+    if output_prefix is not None and tile_size % downsize_factor != 0:
+        raise RuntimeError(f"The tile size {tile_size} must be a multiple of the downsize factor {downsize_factor}.")
+
+    # decoded once, only the alpha plane is kept for the comparison
+    gt_pil = Image.open(path / "preview.png")
+    gt_pil.load()
+    gt_alpha = alpha_channel(gt_pil)
+    size = reduced_size(gt_pil.size, downsize_factor)
+    if output_prefix is not None:
+        write_bands(f"{output_prefix}_gt.png", image_bands(gt_pil, tile_size, 'RGBA', downsize_factor), size, 'RGBA')
+    del gt_pil
+
+    def loader(frag):
+        def load():
+            img_pil = Image.open(_fragment_path(path, frag))
+            if img_pil.mode != 'RGBA':
+                img_pil = img_pil.convert('RGBA')
+            return img_pil.crop(img_pil.getchannel('A').getbbox())
+        return load
+
+    # fragments are pasted unrotated, as in evaluate_puzzle
+    poses = get_poses(fragments, position_key)
+    poses[:, 2] = 0.0
+    solution = TiledSolution([loader(frag) for frag in fragments], poses, gt_alpha.size, tile_size, crop=False)
+
+    writers = None
+    if output_prefix is not None:
+        writers = (PNGStreamWriter(f"{output_prefix}_solution.png", *size, mode='RGBA'),
+                   PNGStreamWriter(f"{output_prefix}_diff.png", *size, mode='L'))
+
+    mismatches = 0
+    try:
+        for row, alphas in coverage_rows(solution, gt_alpha):
+            diff_row = []
+            for box, alpha_a, alpha_b in alphas:
+                mask_ab = (alpha_a > 0) != (alpha_b > 0)
+                mismatches += int(mask_ab.sum())
+                diff_row.append((box, Image.fromarray((mask_ab * 255).astype(np.uint8), mode='L')))
+            if writers is not None:
+                # downsized with a box filter, band by band
+                writers[0].write(join_tiles(row, 'RGBA', downsize_factor))
+                writers[1].write(join_tiles(diff_row, 'L', downsize_factor))
+    finally:
+        if writers is not None:
+            for writer in writers:
+                writer.close()
+
+    return mismatches / (gt_alpha.width * gt_alpha.height) * 100
 
 
 def evaluate_gt(dataset_path,
@@ -72,7 +145,8 @@ def evaluate_gt(dataset_path,
                 filter=None,
                 version=None,
                 from_scratch=False,
-                save_images=False):
+                save_images=False,
+                tile_size=None):
     
     if filter is None:
         filter = []
@@ -100,6 +174,12 @@ def evaluate_gt(dataset_path,
         for i, data in enumerate(tqdm(dataset, desc="Evaluating puzzles")):
             if len(filter) > 0 and data['name'] not in filter:
                 continue
+            if tile_size is not None:
+                # bounded memory on very large canvases
+                delta = evaluate_puzzle_tiled(data, tile_size, base_path / data['name'] if save_images else None)
+                f.write(f"{data['name']} {delta:06.2f}\n")
+                deltas[i] = delta
+                continue
             delta, img_sol, gt_pil, delta_img = evaluate_puzzle(data)
             f.write(f"{data['name']} {delta:06.2f}\n")
             deltas[i] = delta
@@ -125,6 +205,7 @@ def main():
     parser.add_argument('--filter', nargs='*', help='List of puzzle names to include')
     parser.add_argument('--version', required=True, help='Dataset version')
     parser.add_argument('--save-images', action='store_true', default=False, help='Save solution and diff images')
+    parser.add_argument('--tile-size', type=int, default=None, help='Composite and compare in tiles of this size, for very large puzzles')
     parser.add_argument('--no-managed-mode', dest='managed_mode', action='store_false', help='Do not use managed_mode dataset')
     parser.add_argument('--from-scratch', dest='from_scratch', action='store_true', help='Force fresh extraction (only in managed mode)')
     args = parser.parse_args()
@@ -135,6 +216,7 @@ def main():
                 filter=args.filter,
                 version=args.version,
                 save_images=args.save_images,
+                tile_size=args.tile_size,
                 )
 
 
@@ -1,3 +1,4 @@
 from .dataset import RePAIRDataset
+from .records import Puzzle, Fragment
 
-__all__ = ['RePAIRDataset']
\ No newline at end of file
+__all__ = ['RePAIRDataset', 'Puzzle', 'Fragment']
\ No newline at end of file
@@ -0,0 +1,92 @@
+from typing import AsyncIterator, Dict, Iterable, Optional, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+
+
+class _Load:
+    """A puzzle load in flight, shared by all the requests for the same puzzle."""
+
+    __slots__ = ('future', 'stop', 'waiters')
+
+    def __init__(self, future: asyncio.Future, stop: threading.Event) -> None:
+        self.future = future
+        self.stop = stop
+        self.waiters = 0
+
+
+class AsyncLoader:
+    """
+    asyncio front-end of a `RePAIRDataset`.
+
+    Loads run in a bounded thread pool, so that file reads and PNG decode never block the event loop.
+    Concurrent requests for the same puzzle share a single load (and receive the same sample object).
+    When all the requests for a load are cancelled, the load is dropped if still queued, or stopped at the
+    next fragment if running.
+    """
+
+    def __init__(self, dataset, max_workers: Optional[int] = None) -> None:
+        self.dataset = dataset
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='repair_aio')
+        self._inflight: Dict[str, _Load] = {}
+
+    def _done(self, name: str, load: _Load) -> None:
+        if self._inflight.get(name) is load:
+            del self._inflight[name]
+
+    async def get(self, key: Union[int, str]):
+        name = self.dataset._get_puzzle_folder(key).name
+
+        load = self._inflight.get(name)
+        if load is None:
+            stop = threading.Event()
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self.dataset._getitem, name, stop.is_set)
+            load = _Load(future, stop)
+            self._inflight[name] = load
+            future.add_done_callback(lambda _, name=name, load=load: self._done(name, load))
+
+        load.waiters += 1
+        try:
+            # shielded, cancelling one request must not cancel the load of the others
+            return await asyncio.shield(load.future)
+        except asyncio.CancelledError:
+            if load.waiters == 1 and not load.future.done():
+                load.stop.set()
+                load.future.cancel()
+                self._done(name, load)
+            raise
+        finally:
+            load.waiters -= 1
+
+    async def iterate(self, keys: Optional[Iterable[Union[int, str]]] = None, concurrency: int = 4) -> AsyncIterator:
+        """Samples of `keys` (all the puzzles by default) in order, with up to `concurrency` loads in flight."""
+        if concurrency < 1:
+            raise RuntimeError("Concurrency must be at least 1.")
+        if keys is None:
+            keys = range(len(self.dataset))
+
+        pending = deque()
+        try:
+            for key in keys:
+                pending.append(asyncio.ensure_future(self.get(key)))
+                if len(pending) >= concurrency:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            # the consumer stopped early (break, error or cancellation)
+            for task in pending:
+                task.cancel()
+
+    async def aclose(self) -> None:
+        """Stop the loads in flight (queued ones are dropped, running ones stop at the next fragment) and wait for them."""
+        loads = list(self._inflight.values())
+        for load in loads:
+            load.stop.set()
+            load.future.cancel()
+        await asyncio.gather(*(load.future for load in loads), return_exceptions=True)
+        # cancelled asyncio futures do not wait for their thread, the pool does
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
@@ -0,0 +1,293 @@
+from typing import List, Optional, Union
+from pathlib import Path
+import math
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from .dedup import FragmentHashIndex
+from .utils import alpha_channel
+
+# cell corners, as bits of the marching squares case index
+_TL, _TR, _BR, _BL = 1, 2, 4, 8
+
+# edge midpoints and corners in cell coordinates (x, y), y pointing down
+_EDGES = {'T': (0.5, 0.0), 'R': (1.0, 0.5), 'B': (0.5, 1.0), 'L': (0.0, 0.5)}
+_CORNERS = {_TL: (0.0, 0.0), _TR: (1.0, 0.0), _BR: (1.0, 1.0), _BL: (0.0, 1.0)}
+
+# (x, y) corners at the two ends of every edge, in the order 'T', 'R', 'B', 'L'
+_EDGE_C0 = np.array([(0, 0), (1, 0), (0, 1), (0, 0)])
+_EDGE_C1 = np.array([(1, 0), (1, 1), (1, 1), (0, 1)])
+
+# segments of every case, saddles (5 and 10) are always resolved as separated corners
+_CASES = {
+    1: [('L', 'T')], 2: [('T', 'R')], 3: [('L', 'R')], 4: [('R', 'B')],
+    5: [('L', 'T'), ('R', 'B')], 6: [('T', 'B')], 7: [('L', 'B')], 8: [('B', 'L')],
+    9: [('T', 'B')], 10: [('T', 'R'), ('B', 'L')], 11: [('R', 'B')], 12: [('L', 'R')],
+    13: [('T', 'R')], 14: [('L', 'T')],
+}
+
+
+def _oriented_table():
+    # orient every segment with the foreground on its left, so that loops can be chained end to start
+    table = np.full((16, 2, 2), -1, dtype=np.int8)
+    names = list(_EDGES)
+    for case, segments in _CASES.items():
+        for k, (a, b) in enumerate(segments):
+            (ax, ay), (bx, by) = _EDGES[a], _EDGES[b]
+            # the segment cuts off the corners on the side with fewer of them
+            sides = {c: (bx - ax) * (cy - ay) - (by - ay) * (cx - ax) for c, (cx, cy) in _CORNERS.items()}
+            neg = [c for c, v in sides.items() if v < 0]
+            pos = [c for c, v in sides.items() if v > 0]
+            cut = neg if len(neg) <= len(pos) else pos
+            foreground_neg = (cut is neg) == bool(case & cut[0])
+            if not foreground_neg:
+                a, b = b, a
+            table[case, k] = (names.index(a), names.index(b))
+    return table
+
+
+_TABLE = _oriented_table()
+
+
+def marching_squares(alpha: np.ndarray, level: float = 127.5) -> List[np.ndarray]:
+    """
+    Closed iso-contours of `alpha` at `level`, fully vectorized.
+
+    Returns:
+        list of (n, 2) float arrays: (x, y) vertices in pixel-center coordinates, one per closed loop,
+        with the foreground on the left of the walking direction. Outer boundaries come first.
+    """
+    a = np.pad(np.asarray(alpha, dtype=np.float64), 1)
+    h, w = a.shape
+    inside = a > level
+
+    case = (inside[:-1, :-1] * _TL + inside[:-1, 1:] * _TR + inside[1:, 1:] * _BR + inside[1:, :-1] * _BL)
+
+    segs = []
+    for k in range(2):
+        cells = _TABLE[case, k]
+        ii, jj = np.nonzero(cells[..., 0] >= 0)
+        segs.append((ii, jj, cells[ii, jj, 0], cells[ii, jj, 1]))
+    ii, jj, e0, e1 = (np.concatenate(x) for x in zip(*segs))
+
+    if len(ii) == 0:
+        return []
+
+    # global id of every edge of the grid: horizontal edges first, then vertical ones
+    def edge_id(i, j, e):
+        # e indexes 'T', 'R', 'B', 'L'
+        row = np.where(e == 2, i + 1, i)
+        col = np.where(e == 1, j + 1, j)
+        horizontal = (e == 0) | (e == 2)
+        return np.where(horizontal, row * (w - 1) + col, h * (w - 1) + row * w + col)
+
+    start, end = edge_id(ii, jj, e0), edge_id(ii, jj, e1)
+
+    # successor of every segment: the one starting where it ends
+    order = np.argsort(start)
+    nxt = order[np.searchsorted(start[order], end)]
+
+    n = len(nxt)
+    steps = max(1, math.ceil(math.log2(n)) + 1)
+
+    # label every loop with its smallest segment index, by pointer jumping
+    label = np.arange(n)
+    ptr = nxt.copy()
+    for _ in range(steps):
+        label = np.minimum(label, label[ptr])
+        ptr = ptr[ptr]
+
+    # break every loop before its root and rank the segments along the resulting lists
+    root = label == np.arange(n)
+    succ = nxt.copy()
+    pred = np.empty(n, dtype=np.int64)
+    pred[nxt] = np.arange(n)
+    succ[pred[root]] = -1
+
+    dist = (succ != -1).astype(np.int64)
+    ptr = succ.copy()
+    for _ in range(steps):
+        valid = ptr != -1
+        dist[valid] += dist[ptr[valid]]
+        ptr[valid] = ptr[ptr[valid]]
+
+    seq = np.lexsort((-dist, label))
+
+    # vertex of every segment: interpolated crossing on its start edge
+    c0x, c0y = _EDGE_C0[e0].T
+    c1x, c1y = _EDGE_C1[e0].T
+    v0 = a[ii + c0y, jj + c0x]
+    v1 = a[ii + c1y, jj + c1x]
+    t = np.clip((level - v0) / np.where(v1 != v0, v1 - v0, 1), 0, 1)
+    # back to unpadded coordinates
+    xs = jj + c0x + t * (c1x - c0x) - 1
+    ys = ii + c0y + t * (c1y - c0y) - 1
+    points = np.stack([xs, ys], axis=-1)[seq]
+
+    labels = label[seq]
+    splits = np.nonzero(np.diff(labels))[0] + 1
+    loops = np.split(points, splits)
+
+    # outer boundaries (negative shoelace area with y down) first, larger first, then holes
+    areas = [polygon_area(loop) for loop in loops]
+    return [loops[k] for k in sorted(range(len(loops)), key=lambda k: areas[k])]
+
+
+def polygon_area(points: np.ndarray) -> float:
+    """Signed shoelace area of a closed polyline."""
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def douglas_peucker(points: np.ndarray, epsilon: float, closed: bool = True) -> np.ndarray:
+    """Douglas-Peucker simplification, every step is vectorized over the points of the current span."""
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n < 3 or epsilon <= 0:
+        return points
+
+    if closed:
+        # split the loop at the point farthest from the first one
+        far = int(np.argmax(np.sum((points - points[0]) ** 2, axis=1)))
+        a = douglas_peucker(points[:far + 1], epsilon, closed=False)
+        b = douglas_peucker(np.concatenate([points[far:], points[:1]]), epsilon, closed=False)
+        return np.concatenate([a[:-1], b[:-1]])
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        p, q = points[i], points[j]
+        d = q - p
+        seg = points[i + 1:j] - p
+        norm = math.hypot(d[0], d[1])
+        if norm == 0:
+            dist = np.hypot(seg[:, 0], seg[:, 1])
+        else:
+            dist = np.abs(seg[:, 0] * d[1] - seg[:, 1] * d[0]) / norm
+        k = int(np.argmax(dist))
+        if dist[k] > epsilon:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+
+    return points[keep]
+
+
+def resample(points: np.ndarray, n_samples: int, closed: bool = True) -> np.ndarray:
+    """Resample a polyline with `n_samples` points uniformly spaced in arc length."""
+    points = np.asarray(points, dtype=np.float64)
+    if closed:
+        points = np.concatenate([points, points[:1]])
+    seglen = np.hypot(*np.diff(points, axis=0).T)
+    s = np.concatenate([[0.0], np.cumsum(seglen)])
+    if s[-1] == 0:
+        return np.repeat(points[:1], n_samples, axis=0)
+    t = np.linspace(0.0, s[-1], n_samples, endpoint=not closed)
+    return np.stack([np.interp(t, s, points[:, 0]), np.interp(t, s, points[:, 1])], axis=-1)
+
+
+def fragment_contour(image: Union[Image.Image, np.ndarray],
+                     epsilon: Optional[float] = None,
+                     n_samples: Optional[int] = None,
+                     level: float = 127.5) -> np.ndarray:
+    """
+    Outer boundary of a fragment as an (n, 2) float array of (x, y) pixel coordinates of `image`.
+
+    Args:
+        image (PIL.Image or np.ndarray): fragment with an alpha channel, an 'L' alpha plane or an (unpacked) mask.
+        epsilon (float, optional): Douglas-Peucker tolerance in pixels.
+        n_samples (int, optional): resample the contour with this many points uniformly spaced in arc length.
+        level (float): alpha iso-level of the boundary.
+    """
+    if isinstance(image, np.ndarray):
+        alpha = image.astype(np.uint8) * 255 if image.dtype == bool else image
+    else:
+        alpha = np.asarray(image if image.mode == 'L' else alpha_channel(image))
+    loops = marching_squares(alpha, level)
+    if len(loops) == 0:
+        raise ValueError("Image has no foreground pixels")
+    contour = loops[0]
+    if epsilon is not None:
+        contour = douglas_peucker(contour, epsilon)
+    if n_samples is not None:
+        contour = resample(contour, n_samples)
+    return contour
+
+
+def rotate_points(points: np.ndarray, angle: float, center=(0.0, 0.0)) -> np.ndarray:
+    """Apply to contour points the same rotation as `image.rotate(angle)`, about `center` (the image center)."""
+    c = np.asarray(center, dtype=np.float64)
+    rad = math.radians(angle)
+    cos, sin = math.cos(rad), math.sin(rad)
+    d = points - c
+    # PIL rotates counter-clockwise on screen, with y pointing down
+    return np.stack([d[:, 0] * cos + d[:, 1] * sin, -d[:, 0] * sin + d[:, 1] * cos], axis=-1) + c
+
+
+def image_center(size: tuple) -> np.ndarray:
+    """Center of an image of `size` (w, h) in pixel-center coordinates, i.e. the fragment centroid once centered and padded."""
+    w, h = size
+    return np.array([(w - 1) / 2, (h - 1) / 2])
+
+
+class ContourCache:
+    """
+    Contours of the centered and padded fragments, cached as .npy per content hash and parameter set.
+
+    Contours are stored relative to the image center, which `center_and_pad_rgba` places on the fragment
+    centroid (the point `position_2d` refers to), so they do not depend on the padding or on the resolution.
+    """
+
+    def __init__(self,
+                 cache_dir: Union[str, Path],
+                 hashes: FragmentHashIndex,
+                 epsilon: Optional[float] = None,
+                 n_samples: Optional[int] = None,
+                 level: float = 127.5) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.hashes = hashes
+        self.epsilon = epsilon
+        self.n_samples = n_samples
+        self.level = level
+        self.param_key = f"l{level:g}_e{'none' if epsilon is None else f'{epsilon:g}'}_n{'none' if n_samples is None else n_samples}"
+
+    def path(self, frag: dict) -> Path:
+        digest = self.hashes[frag['full_name']]
+        return self.cache_dir / self.param_key / digest[:2] / f"{digest}.npy"
+
+    def get(self, frag: dict, image_loader) -> np.ndarray:
+        """
+        Contour of `frag` relative to the image center, at full resolution. If missing, it is computed
+        on `image_loader(frag)`, the full resolution centered and padded fragment, and stored.
+        """
+        path = self.path(frag)
+        if path.exists():
+            return np.load(path)
+
+        image = image_loader(frag)
+        contour = fragment_contour(image, self.epsilon, self.n_samples, self.level) - image_center(image.size)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npy")
+        np.save(tmp, contour)
+        tmp.replace(path)
+        return contour
+
+
+def place_contour(contour: np.ndarray, size: tuple, downscale: int = 1, angle: float = 0.0) -> np.ndarray:
+    """
+    Map a cached contour (relative to the fragment centroid, full resolution) to the pixel coordinates of
+    a returned image of `size`, downscaled by `downscale` and rotated with `image.rotate(angle)`.
+    """
+    points = contour / downscale
+    if angle != 0.0:
+        points = rotate_points(points, angle)
+    return points + image_center(size)
@@ -1,5 +1,9 @@
 from pathlib import Path
 from typing import Union
+import copy
+import heapq
+
+import numpy as np
 
 from .splits.splits import train_split, test_split
 
@@ -7,7 +11,27 @@ from datman import DataManager
 from .variant_version import VariantVersion, Version
 
 from .getters.solved2d_getter import getmetadata_2dsolved, getitem_2dsolved
-from .getters.solved3d_getter import getitem_3dsolved
+from .getters.solved3d_getter import getitem_3dsolved, load_index_3dsolved
+from .spatial import find_contacts
+from .lod import MeshLODCache, LOD_TARGETS
+from .stats import LoadStats, NULL_SAMPLE_STATS
+from .records import Puzzle
+from .pyramid import FragmentPyramid, scale_to_factor
+from .dedup import FragmentHashIndex, DecodedCache
+from .getters.solved2d_getter import load_fragment_2dsolved, CHANNELS
+from .features import FeatureStore, compute_feature, feature_store_path
+from .contour import ContourCache
+from .graph import AdjacencyIndex
+from .rotation import RotationEngine
+from .utils import alpha_channel
+from .aio import AsyncLoader
+from .shm import SharedDatasetClient, SharedDatasetServer
+from .sizes import SizeIndex
+from .sampler import BucketBatchSampler
+from .sdf import SDFCache
+from .managed import prepare_dataset, prepared_here
+from .poses import PoseTable
+from .pairs import PairIndex, PairCropStore
 
 from .info import (
     VARIANTS,
@@ -28,19 +52,50 @@ class RePAIRDataset:
                  supervised_mode=False,
                  load_images=True,
                  from_scratch=False,
-                 skip_verify=False) -> None:
+                 skip_verify=False,
+                 cache_dir=None,
+                 collect_stats=False,
+                 stats_callback=None,
+                 return_records=False,
+                 scale=None,
+                 memory_cache_mb=0,
+                 channels='rgba',
+                 contours=None,
+                 rotation_seed=None,
+                 rotation_step=None,
+                 rotation_mode='nearest',
+                 cache_rotations=False,
+                 async_workers=None,
+                 shared_memory=None,
+                 mirrors=None,
+                 connections=None,
+                 puzzles=None,
+                 partial_extract=False,
+                 extract_workers=8,
+                 lod=None,
+                 lod_targets=LOD_TARGETS) -> None:
         
         
         self.root = Path(root)
         
         self._split = split
+        self._puzzles = None if puzzles is None else list(puzzles)
         self.supervised_mode = supervised_mode
         self.load_images = load_images
         self.apply_random_rotations = apply_random_rotations
+        self.return_records = return_records
+        self.channels = channels
 
         # iterator state
         self._iter_idx = 0
 
+        # asyncio API, the thread pool is created on first use
+        self._async_workers = async_workers
+        self._async_loader = None
+
+        # loading statistics, disabled unless requested
+        self._stats = LoadStats(stats_callback) if (collect_stats or stats_callback is not None) else None
+
         if variant is None or variant == '':
             raise RuntimeError("Dataset type must be specified.")
         
@@ -80,9 +135,51 @@ class RePAIRDataset:
             if not supervised_mode:
                 raise RuntimeError("Random rotations can only be applied in supervised mode.")
 
+        if return_records and variant != '2D_SOLVED':
+            raise RuntimeError("Records can only be returned for '2D_SOLVED' dataset type.")
+
+        if scale is not None:
+            if variant != '2D_SOLVED':
+                raise RuntimeError("Scale can only be set for '2D_SOLVED' dataset type.")
+
+            if not (supervised_mode and load_images):
+                raise RuntimeError("Scale can only be set in supervised mode with load_images=True.")
+
+        if channels != 'rgba':
+            if channels not in CHANNELS:
+                raise RuntimeError(f"Unsupported channels: {channels}. Supported channels are: {list(CHANNELS)}")
+
+            if variant != '2D_SOLVED' or not (supervised_mode and load_images):
+                raise RuntimeError("Channels can only be selected for '2D_SOLVED' dataset type in supervised mode with load_images=True.")
+
+        use_rotation_engine = rotation_seed is not None or rotation_step is not None or rotation_mode != 'nearest' or cache_rotations
+        if use_rotation_engine and not apply_random_rotations:
+            raise RuntimeError("Rotation seed, step, mode and cache can only be set with apply_random_rotations=True.")
+
+        if cache_rotations and rotation_step is None:
+            raise RuntimeError("Rotations can only be cached with a rotation_step.")
+
+        if contours:
+            if variant != '2D_SOLVED' or not (supervised_mode and load_images):
+                raise RuntimeError("Contours can only be returned for '2D_SOLVED' dataset type in supervised mode with load_images=True.")
+
+            if contours is not True and not (isinstance(contours, dict) and set(contours) <= {'epsilon', 'n_samples'}):
+                raise RuntimeError("Contours must be True or a dict with optional 'epsilon' and 'n_samples' keys.")
+
         #################### DataManager setup ###################
 
         self.datamanager = None
+        managed_data_path = None
+
+        if (mirrors is not None or connections is not None or partial_extract) and not managed_mode:
+            raise RuntimeError("Mirrors, connections and partial extraction can only be set in managed mode.")
+
+        extract_subpath = f"{self.variant_version.variant}/v{self.variant_version.version}"
+
+        # the in-repo fetcher can also extract only the puzzles of the split (and of `puzzles`). A folder stays with
+        # the backend that prepared it, neither reads (or deletes) the other's status
+        native_fetch = (mirrors is not None or connections is not None or partial_extract
+                        or prepared_here(self.root / extract_subpath))
 
         if managed_mode:
             
@@ -91,11 +188,27 @@ class RePAIRDataset:
             if remote is None:
                 raise RuntimeError(f"Remote missing for base dataset variant {self.variant_version.variant} and version {base}.")
 
+        if managed_mode and native_fetch:
+            # in-repo fetcher: mirrors, parallel ranged and resumable download, incremental extraction
+            managed_data_path = prepare_dataset(
+                root=self.root,
+                dataset_id=str(self.variant_version),
+                remote=remote,
+                extract_subpath=extract_subpath,
+                patches=version_dict.get('patches', []),
+                from_scratch=from_scratch,
+                skip_verify=skip_verify,
+                mirrors=mirrors,
+                connections=connections if connections is not None else 4,
+                puzzles=self._selected_puzzles() if partial_extract else None,
+                max_workers=extract_workers,
+            )
+        elif managed_mode:
             self.datamanager = DataManager(
                 root=self.root,
                 dataset_id=str(self.variant_version),
                 remote=remote,
-                extract_subpath= f"{self.variant_version.variant}/v{self.variant_version.version}",
+                extract_subpath=extract_subpath,
                 from_scratch=from_scratch,
                 skip_verify=skip_verify,
                 patches=version_dict.get('patches',[])
@@ -103,7 +216,13 @@ class RePAIRDataset:
 
         ################### Load dataset ###################
 
-        self.data_path = self.datamanager.data_path if self.datamanager is not None else self.root
+        if managed_data_path is not None:
+            self.data_path = managed_data_path
+        else:
+            self.data_path = self.datamanager.data_path if self.datamanager is not None else self.root
+
+        # derived data (indexes, precomputed arrays, ...) lives here
+        self.cache_path = Path(cache_dir) if cache_dir is not None else self.data_path / '.cache'
         
         err_msg = "Check the specified root folder is correct. If the error persist, try to recreate the dataset running with from_scratch=True or delete the STATUS file inside the folder."
         if not self.data_path.exists():
@@ -121,9 +240,80 @@ class RePAIRDataset:
                 raise RuntimeError(f"No data found after extraction. The dataset may be corrupted. {err_msg}")
             else:
                 raise RuntimeError("No data found in the specified root folder.")
-    
-    def _make_split(self) -> None:
 
+        # fragment content hashes, computed lazily when a cache layer needs them
+        self._hashes = None
+
+        # CSR adjacency of the puzzles, built lazily
+        self._adjacency = None
+
+        # ground truth poses of the puzzles, built lazily
+        self._poses = None
+
+        # per-puzzle decode costs used by `shard`, read lazily
+        self._shard_costs = None
+
+        # derived features registry, name -> (function, version)
+        self._features = {}
+
+        # multi-resolution fragments, built once in the cache folder
+        self.scale = scale
+        self._pyramid = None
+        self._downscale = 1
+        if scale is not None:
+            self._downscale = scale_to_factor(scale)
+            self._pyramid = FragmentPyramid(self.cache_path / 'pyramid', self.fragment_hashes())
+            self._pyramid.build(self._iter_fragments_2d(self.puzzle_folders_list))
+
+        # decoded fragments shared by all the puzzles, keyed by content hash
+        self._decoded_cache = None
+        if memory_cache_mb > 0:
+            if not (variant == '2D_SOLVED' and supervised_mode and load_images):
+                raise RuntimeError("Memory cache can only be used for '2D_SOLVED' dataset type in supervised mode with load_images=True.")
+            self.fragment_hashes()
+            self._decoded_cache = DecodedCache(int(memory_cache_mb * 2**20))
+
+        # fragment outlines, cached per content hash and simplification parameters
+        self._contours = None
+        if contours:
+            params = contours if isinstance(contours, dict) else {}
+            self._contours = ContourCache(self.cache_path / 'contours', self.fragment_hashes(), **params)
+
+        # seeded, quantized and possibly cached random rotations, the global `random` module is used otherwise
+        self._rotator = None
+        if use_rotation_engine:
+            self._rotator = RotationEngine(seed=rotation_seed, step=rotation_step, mode=rotation_mode,
+                                           cache_dir=self.cache_path / 'rotations' if cache_rotations else None,
+                                           hashes=self.fragment_hashes() if cache_rotations else None)
+
+        # decoded samples published by a SharedDatasetServer of this node
+        self._shared = None
+        if shared_memory is not None:
+            if not (variant == '2D_SOLVED' and supervised_mode and load_images) or apply_random_rotations:
+                raise RuntimeError("Shared memory can only be used for '2D_SOLVED' dataset type in supervised mode with load_images=True and without random rotations.")
+            self._shared = SharedDatasetClient(shared_memory)
+            theirs = (self._shared.variant_version, self._shared.manifest['options'])
+            ours = (str(self.variant_version), self.sample_options())
+            if theirs != ours:
+                raise RuntimeError(f"Shared dataset {shared_memory} holds {theirs[0]} with options {theirs[1]}, not {ours[0]} with options {ours[1]}.")
+
+        self._index_3d = None
+        if self.variant_version.variant == '3D_SOLVED':
+            self._index_3d = load_index_3dsolved(self.puzzle_folders_list, self.cache_path / 'index_3dsolved.json')
+
+        # simplified meshes, built once in the cache folder
+        self.lod = lod
+        self._lods = None
+        if lod is not None:
+            if self.variant_version.variant != '3D_SOLVED':
+                raise RuntimeError("Levels of detail can only be used for '3D_SOLVED' dataset type.")
+            self._lods = MeshLODCache(self.cache_path / 'lod', lod_targets)
+            if not 0 <= lod < len(self._lods):
+                raise RuntimeError(f"Unsupported LOD: {lod}. Supported levels are 0 to {len(self._lods) - 1}.")
+            self._lods.build(self._iter_objs_3d())
+    
+    def _selected_puzzles(self):
+        # names of the puzzles of the split, restricted to `puzzles`, None for all
         split = None
 
         if self._split is not None:
@@ -133,8 +323,15 @@ class RePAIRDataset:
                 split = test_split
             else:
                 raise RuntimeError(f"Unsupported split name: {self._split}. Supported splits are: 'train', 'test'")
-        
-        self._filter(split)
+
+        if self._puzzles is not None:
+            selected = set(self._puzzles)
+            split = self._puzzles if split is None else [p for p in split if p in selected]
+
+        return split
+
+    def _make_split(self) -> None:
+        self._filter(self._selected_puzzles())
 
     def _filter(self, filter_list) -> None:
 
@@ -147,6 +344,85 @@ class RePAIRDataset:
         # after the split, use a dict to map string to index for faster access by name
         self.puzzle_folders_map = {p.name: k for k,p in enumerate(self.puzzle_folders_list)}
 
+    ################### sharding and pickling ###################
+
+    BALANCE = ('pixels', 'bytes', 'fragments', None)
+
+    def shard_costs(self, balance : str = 'pixels') -> np.ndarray:
+        """
+        Decode cost of every puzzle of this dataset (in order): decoded source 'pixels', file 'bytes' or number of
+        'fragments'. Read from the image headers once and persisted in the cache, see `fragment_sizes`.
+        """
+        if balance not in self.BALANCE or balance is None:
+            raise RuntimeError(f"Unsupported balance: {balance}. Supported values are: {list(self.BALANCE)}")
+        key = 'n_fragments' if balance == 'fragments' else balance
+        if self._shard_costs is None:
+            self._shard_costs = self.fragment_sizes().puzzle_table([p.name for p in self.puzzle_folders_list])
+        return self._shard_costs[key]
+
+    def shard(self, num_shards : int, rank : int, balance : str = 'pixels', seed : int = 0, epoch : int = 0) -> 'RePAIRDataset':
+        """
+        Dataset restricted to the puzzles of shard `rank` out of `num_shards`.
+
+        With `balance`, puzzles are assigned by LPT (largest cost first, to the least loaded shard) using
+        `shard_costs(balance)`, so that every shard has about the same decode work. With `balance=None`,
+        puzzles are dealt round-robin. Ties (and the round-robin order) are broken by a permutation drawn
+        from (`seed`, `epoch`): all ranks compute the same partition, which changes with the epoch.
+        """
+        if not 0 <= rank < num_shards:
+            raise RuntimeError(f"Invalid rank {rank} for {num_shards} shards.")
+        if balance not in self.BALANCE:
+            raise RuntimeError(f"Unsupported balance: {balance}. Supported values are: {list(self.BALANCE)}")
+
+        n = len(self.puzzle_folders_list)
+        perm = np.random.default_rng([seed, epoch]).permutation(n)
+        if balance is None:
+            assigned = perm[rank::num_shards]
+        else:
+            costs = self.shard_costs(balance)
+            # stable sort on the permuted order, equal costs are spread differently every epoch
+            order = perm[np.argsort(-costs[perm], kind='stable')]
+            loads = [(0, k) for k in range(num_shards)]
+            owner = np.empty(n, dtype=np.int64)
+            for i in order:
+                load, k = heapq.heappop(loads)
+                owner[i] = k
+                heapq.heappush(loads, (load + int(costs[i]), k))
+            assigned = np.nonzero(owner == rank)[0]
+
+        shard = copy.copy(self)
+        shard.puzzle_folders_list = [self.puzzle_folders_list[i] for i in sorted(assigned)]
+        shard.puzzle_folders_map = {p.name: k for k, p in enumerate(shard.puzzle_folders_list)}
+        shard._iter_idx = 0
+        shard._adjacency = None
+        shard._poses = None
+        shard._shard_costs = None
+        shard._async_loader = None
+        return shard
+
+    def __getstate__(self) -> dict:
+        # only what can cross a process boundary: thread pools, locks and shared memory mappings are recreated
+        state = self.__dict__.copy()
+        state['_async_loader'] = None
+        state['datamanager'] = None
+        if self._stats is not None:
+            state['_stats'] = True
+        if self._decoded_cache is not None:
+            state['_decoded_cache'] = self._decoded_cache.max_bytes
+        if self._shared is not None:
+            state['_shared'] = self._shared.name
+        return state
+
+    def __setstate__(self, state : dict) -> None:
+        # statistics and memory cache start empty in the new process
+        if state['_stats'] is not None:
+            state['_stats'] = LoadStats()
+        if state['_decoded_cache'] is not None:
+            state['_decoded_cache'] = DecodedCache(state['_decoded_cache'])
+        if state['_shared'] is not None:
+            state['_shared'] = SharedDatasetClient(state['_shared'])
+        self.__dict__.update(state)
+
     # iterator protocol
     def __iter__(self) -> 'RePAIRDataset':
         self._iter_idx = 0
@@ -178,16 +454,329 @@ class RePAIRDataset:
         return puzzle_folder
 
     def __getitem__(self, key : Union[int, str]) -> Union[dict, tuple]:
+        return self._getitem(key)
+
+    def _getitem(self, key : Union[int, str], cancelled=None) -> Union[dict, tuple]:
+        # `cancelled()` is polled between fragments by the async API, to stop abandoned loads early
         puzzle_folder = self._get_puzzle_folder(key)
+        stats = self._stats.begin_sample(puzzle_folder.name) if self._stats is not None else NULL_SAMPLE_STATS
         # this should not happen, but just in case
-        if self.variant_version.variant == '2D_SOLVED' :
-            return getitem_2dsolved(puzzle_folder, self.supervised_mode, self.load_images, self.apply_random_rotations)
+        if self._shared is not None and puzzle_folder.name in self._shared:
+            # zero-copy views, images are numpy arrays
+            item = self._shared[puzzle_folder.name]
+            if self.return_records:
+                item = Puzzle.from_dict(item[1], item[0])
+        elif self.variant_version.variant == '2D_SOLVED' :
+            item = getitem_2dsolved(puzzle_folder, self.supervised_mode, self.load_images, self.apply_random_rotations,
+                                    stats=stats, image_loader=self._image_loader(), downscale=self._downscale,
+                                    channels=self.channels, contour_loader=self._contour_loader(),
+                                    rotator=self._rotator, cancelled=cancelled)
+            if self.return_records:
+                item = Puzzle.from_dict(item[1], item[0]) if self.supervised_mode else Puzzle.from_dict(item)
         elif self.variant_version.variant == '3D_SOLVED':
-            return getitem_3dsolved(puzzle_folder, self.supervised_mode)
+            lod_loader = (lambda obj: self._lods.load(obj, self.lod)) if self._lods is not None else None
+            item = getitem_3dsolved(puzzle_folder, self.supervised_mode, self._index_3d[puzzle_folder.name], lod_loader)
         else:
             raise NotImplementedError(f"Dataset type {self.variant_version.variant} not implemented yet.")
+        stats.end()
+        return item
+
+    def sample_options(self) -> dict:
+        """The options that change the content of a sample (besides the version), e.g. to check a shared dataset."""
+        contours = None
+        if self._contours is not None:
+            contours = {'epsilon': self._contours.epsilon, 'n_samples': self._contours.n_samples, 'level': self._contours.level}
+        return {
+            'channels': self.channels,
+            'downscale': self._downscale,
+            'contours': contours,
+            'apply_random_rotations': self.apply_random_rotations,
+        }
+
+    def serve(self, name=None, segment_bytes : int = 256 * 2**20, max_workers : int = 8) -> SharedDatasetServer:
+        """
+        Decode the whole dataset once into shared memory. Other processes of the node get zero-copy samples with
+        `RePAIRDataset(..., shared_memory=server.name)`. Use as a context manager or call `close()` when done.
+        """
+        return SharedDatasetServer(self, name, segment_bytes=segment_bytes).start(max_workers=max_workers)
+
+    ################### asyncio API ###################
+
+    def _aloader(self) -> AsyncLoader:
+        if self._async_loader is None:
+            self._async_loader = AsyncLoader(self, self._async_workers)
+        return self._async_loader
+
+    async def aget(self, key : Union[int, str]) -> Union[dict, tuple]:
+        """
+        Same as `dataset[key]`, without blocking the event loop. Concurrent calls for the same puzzle share one load
+        and receive the same object.
+        """
+        return await self._aloader().get(key)
+
+    def aiter(self, concurrency : int = 4, keys=None):
+        """Async iterator over the samples (of `keys`, or all), in order, loading up to `concurrency` puzzles ahead."""
+        return self._aloader().iterate(keys, concurrency)
+
+    async def aclose(self) -> None:
+        """Stop the async API thread pool, once the loads in flight are stopped (at their next fragment)."""
+        if self._async_loader is not None:
+            loader, self._async_loader = self._async_loader, None
+            await loader.aclose()
+
+    def _image_loader(self):
+        if self._pyramid is None and self._decoded_cache is None:
+            return None
+
+        if self._pyramid is not None:
+            pyramid, factor = self._pyramid, self._downscale
+            loader = lambda frag, stats: pyramid.load(frag, factor, stats)
+        else:
+            channels = self.channels
+            loader = lambda frag, stats: load_fragment_2dsolved(frag, stats, channels)
+
+        if self._decoded_cache is None:
+            return loader
+
+        cache, hashes, factor, channels = self._decoded_cache, self._hashes, self._downscale, self.channels
+
+        def cached_loader(frag, stats):
+            key = (hashes[frag['full_name']], factor, channels)
+            image = cache.get(key)
+            if image is None:
+                image = loader(frag, stats)
+                cache.put(key, image)
+            # callers own the returned image
+            return image.copy()
+
+        return cached_loader
+
+    def _contour_loader(self):
+        if self._contours is None:
+            return None
+        contours = self._contours
+        # always traced on the full resolution image, whatever the returned scale and channels
+        image_loader = lambda frag: load_fragment_2dsolved(frag, channels='alpha')
+        return lambda frag: contours.get(frag, image_loader)
+
+    def _iter_fragments_2d(self, puzzle_folders):
+        for puzzle_folder in puzzle_folders:
+            yield from getitem_2dsolved(puzzle_folder, False, False)['fragments']
+
+    def _iter_objs_3d(self):
+        for puzzle_folder in self.puzzle_folders_list:
+            for frag in self._index_3d[puzzle_folder.name]['fragments']:
+                yield puzzle_folder / frag['obj']
+
+    def _all_puzzle_folders(self) -> list:
+        return sorted(p for p in self.data_path.iterdir() if p.is_dir() and p.name.startswith("puzzle_"))
+
+    def fragment_hashes(self) -> FragmentHashIndex:
+        """Content hash of every fragment of this version (all splits), computed once and persisted in the cache."""
+        if self.variant_version.variant != '2D_SOLVED':
+            raise NotImplementedError(f"Fragment hashes not implemented for dataset type {self.variant_version.variant}.")
+        if self._hashes is None:
+            fragments = self._iter_fragments_2d(self._all_puzzle_folders())
+            self._hashes = FragmentHashIndex.build(fragments, self.cache_path / 'fragment_hashes.json')
+        return self._hashes
+
+    def duplicates(self, across_splits : bool = False) -> Union[dict, list]:
+        """
+        Fragments with identical content. With `across_splits=True`, only the ones shared by train and test puzzles.
+        """
+        hashes = self.fragment_hashes()
+        if across_splits:
+            return hashes.cross_split_duplicates(train_split, test_split)
+        return hashes.duplicates()
+
+    def fragment_sizes(self, exact : bool = False) -> SizeIndex:
+        """
+        Fragment sizes of the puzzles of this dataset, from the image headers (no decode), persisted in the cache.
+        With `exact=True` the padded sizes are computed exactly, decoding every fragment once.
+        """
+        if self.variant_version.variant != '2D_SOLVED':
+            raise NotImplementedError(f"Fragment sizes not implemented for dataset type {self.variant_version.variant}.")
+        puzzles = {}
+        for p in self.puzzle_folders_list:
+            # v2 metadata (no 'metadata_version') comes with full canvas fragments
+            full_canvas = 'metadata_version' not in getmetadata_2dsolved(p)
+            puzzles[p.name] = [dict(frag, full_canvas=full_canvas) for frag in getitem_2dsolved(p, False, False)['fragments']]
+        return SizeIndex.build(puzzles, self.cache_path / 'fragment_sizes.json', exact=exact)
+
+    def batch_sampler(self, budget : int, exact_sizes : bool = False, **kwargs) -> BucketBatchSampler:
+        """Size-bucketed batch sampler over the puzzles of this dataset, see `sampler.BucketBatchSampler` for `kwargs`."""
+        return BucketBatchSampler(self.fragment_sizes(exact_sizes), budget, **kwargs)
+
+    def sdf_cache(self, step : int = 1, margin : int = 16, n_boundary : int = 256) -> SDFCache:
+        """
+        Signed distance fields of the fragments for collision queries (penetration, gap, overlap) at `position_2d`
+        poses, see `sdf.SDFCache`. Fields are computed on a grid of `step` pixels and cached per content hash.
+        """
+        if self.variant_version.variant != '2D_SOLVED':
+            raise NotImplementedError(f"SDFs not implemented for dataset type {self.variant_version.variant}.")
+        image_loader = lambda frag: load_fragment_2dsolved(frag, channels='alpha')
+        return SDFCache(self.cache_path / 'sdf', self.fragment_hashes(), image_loader, step=step, margin=margin, n_boundary=n_boundary)
+
+    def set_epoch(self, epoch : int) -> None:
+        """Draw a new set of random rotation angles. Needs a rotation engine (e.g. `rotation_seed`)."""
+        self._require_rotator().set_epoch(epoch)
+
+    def save_rotations(self, path) -> None:
+        """Write the random rotation angles drawn so far (per epoch and fragment) as JSON, see `replay_rotations`."""
+        self._require_rotator().save_log(path)
+
+    def replay_rotations(self, path) -> None:
+        """Use the angles saved with `save_rotations`, so that the same samples are returned again."""
+        self._require_rotator().load_log(path)
+
+    def precompute_rotations(self, max_workers : int = 8) -> None:
+        """Store all the rotated variants of the fragments of this dataset, so that random rotations become a lookup."""
+        rotator = self._require_rotator()
+        loader = self._image_loader()
+        if loader is None:
+            loader = lambda frag, stats: load_fragment_2dsolved(frag, stats, self.channels)
+
+        def image_loader(frag):
+            image = loader(frag, NULL_SAMPLE_STATS)
+            return alpha_channel(image) if self.channels != 'rgba' and image.mode != 'L' else image
+
+        rotator.precompute(self._iter_fragments_2d(self.puzzle_folders_list), image_loader,
+                           variant=f"{self._downscale}_{self.channels}", max_workers=max_workers)
+
+    def _require_rotator(self) -> RotationEngine:
+        if self._rotator is None:
+            raise RuntimeError("No rotation engine, create the dataset with apply_random_rotations=True and a rotation_seed, rotation_step, rotation_mode or cache_rotations.")
+        return self._rotator
+
+    def adjacency(self) -> AdjacencyIndex:
+        """
+        Fragment adjacency of the puzzles of this dataset (split order) as a CSR graph, see `graph.AdjacencyIndex`.
+        Parsed once for all the puzzles of the version and persisted in the cache.
+        """
+        if self.variant_version.variant != '2D_SOLVED':
+            raise NotImplementedError(f"Adjacency not implemented for dataset type {self.variant_version.variant}.")
+        if self._adjacency is None:
+            index = AdjacencyIndex.build(self._all_puzzle_folders(), self.cache_path / 'adjacency_2dsolved.npz')
+            self._adjacency = index.subset([p.name for p in self.puzzle_folders_list])
+        return self._adjacency
+
+    def pose_table(self) -> PoseTable:
+        """
+        Ground truth poses of the puzzles of this dataset (split order) as one `(n_fragments, 3)` array with puzzle
+        offsets, in the `position_2d` convention, see `poses.PoseTable`. Parsed once for all the puzzles of the
+        version and persisted in the cache.
+        """
+        if self.variant_version.variant != '2D_SOLVED':
+            raise NotImplementedError(f"Pose table not implemented for dataset type {self.variant_version.variant}.")
+        if self._poses is None:
+            table = PoseTable.build(self._all_puzzle_folders(), self.cache_path / 'poses_2dsolved.npz')
+            self._poses = table.subset([p.name for p in self.puzzle_folders_list])
+        return self._poses
+
+    def pair_index(self) -> PairIndex:
+        """Adjacent fragment pairs of the puzzles of this dataset with their GT relative transforms, see `pairs.PairIndex`."""
+        return PairIndex(self.adjacency(), self.pose_table())
+
+    def pair_crops(self, size : int = 256, channels : str = 'rgba', max_workers : int = 8) -> PairCropStore:
+        """
+        Crops of the adjacent pairs in their GT relative placement, rendered once into the cache and memory mapped,
+        see `pairs.PairCropStore`. `channels` is 'rgba' (composited) or 'alpha' (one plane per fragment).
+        """
+        fragments_of = lambda name: getitem_2dsolved(self.data_path / name, False, False)['fragments']
+        image_loader = lambda frag: load_fragment_2dsolved(frag, channels=channels)
+        store = PairCropStore(self.pair_index(), self.cache_path / 'pairs', fragments_of, image_loader,
+                              self.fragment_hashes(), size=size, channels=channels)
+        return store.build(max_workers)
+
+    def stats(self) -> dict:
+        """Aggregated loading statistics (per-stage wall time, bytes read, pixels decoded, returned image bytes)."""
+        if self._stats is None:
+            raise RuntimeError("Statistics are disabled, create the dataset with collect_stats=True.")
+        return self._stats.to_dict()
+
+    def export_stats(self, path, format : str = 'json') -> None:
+        """Write the aggregated statistics to `path`, as 'json' or in the 'prometheus' text format."""
+        if self._stats is None:
+            raise RuntimeError("Statistics are disabled, create the dataset with collect_stats=True.")
+        if format == 'json':
+            text = self._stats.to_json(indent=4)
+        elif format == 'prometheus':
+            text = self._stats.to_prometheus(labels={'dataset': str(self.variant_version), 'split': self._split or 'all'})
+        else:
+            raise RuntimeError(f"Unsupported stats format: {format}. Supported formats are: 'json', 'prometheus'")
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def reset_stats(self) -> None:
+        if self._stats is not None:
+            self._stats.reset()
+
+    def set_stats_callback(self, callback) -> None:
+        """Call `callback(record)` with the statistics of every loaded sample. Enables statistics if disabled."""
+        if self._stats is None:
+            self._stats = LoadStats(callback)
+        else:
+            self._stats.callback = callback
 
 
 
     
-   
\ No newline at end of file
+   
+
+    def contacts(self, key : Union[int, str], threshold : float) -> list:
+        """Pairs of fragments in contact (closer than `threshold`) in the solved pose, see `spatial.find_contacts`."""
+        if self.variant_version.variant != '3D_SOLVED':
+            raise NotImplementedError(f"Contact detection not implemented for dataset type {self.variant_version.variant}.")
+        puzzle_folder = self._get_puzzle_folder(key)
+        data = getitem_3dsolved(puzzle_folder, False, self._index_3d[puzzle_folder.name])
+        return find_contacts(data['fragments'], threshold, cache_dir=self.cache_path / 'spatial' / puzzle_folder.name)
+
+    def fragment_counts(self) -> dict:
+        """Number of fragments of every puzzle, by puzzle name. Read from the index, no file is opened."""
+        if self._index_3d is None:
+            raise NotImplementedError(f"Fragment counts not implemented for dataset type {self.variant_version.variant}.")
+        return {p.name: len(self._index_3d[p.name]['fragments']) for p in self.puzzle_folders_list}
+
+    def register_feature(self, name : str, fn, version : str) -> None:
+        """
+        Register a per-fragment feature `fn(image, frag) -> np.ndarray`, where `image` is the centered and padded
+        RGBA fragment. Bump `version` whenever `fn` changes: stored values of other versions are not reused.
+        `fn` must be picklable (a module level function) to be computed in worker processes.
+        """
+        if self.variant_version.variant != '2D_SOLVED':
+            raise NotImplementedError(f"Features not implemented for dataset type {self.variant_version.variant}.")
+        self._features[name] = (fn, str(version))
+
+    def _feature_path(self, name : str):
+        if name not in self._features:
+            raise RuntimeError(f"Unknown feature: {name}. Registered features are: {list(self._features.keys())}")
+        return feature_store_path(self.cache_path, self.variant_version, name, self._features[name][1])
+
+    def _feature_hashes(self) -> dict:
+        hashes = self.fragment_hashes()
+        return {frag['full_name']: hashes[frag['full_name']] for frag in self._iter_fragments_2d(self.puzzle_folders_list)}
+
+    def compute_features(self, names=None, max_workers=None, use_processes=True) -> dict:
+        """Compute the registered features (all, or `names`) over the dataset, only for missing or changed fragments."""
+        if names is None:
+            names = list(self._features.keys())
+        fragments = list(self._iter_fragments_2d(self.puzzle_folders_list))
+        hashes = self._feature_hashes()
+
+        stores = {}
+        for name in names:
+            fn, version = self._features[name]
+            meta = {'name': name, 'feature_version': version, 'variant_version': str(self.variant_version)}
+            stores[name] = compute_feature(fn, fragments, hashes, self._feature_path(name), meta,
+                                           max_workers=max_workers, use_processes=use_processes)
+        return stores
+
+    def feature(self, name : str) -> FeatureStore:
+        """Stored values of a registered feature, indexed by fragment `full_name`. Never decodes images."""
+        path = self._feature_path(name)
+        if not (path / 'manifest.json').exists():
+            raise RuntimeError(f"Feature {name} not computed yet, run compute_features first.")
+        store = FeatureStore(path)
+        if not store.is_valid(self._feature_hashes()):
+            raise RuntimeError(f"Feature {name} is missing or outdated for some fragments, run compute_features again.")
+        return store
@@ -0,0 +1,151 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+from pathlib import Path
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+
+from tqdm import tqdm
+
+INDEX_VERSION = 1
+
+
+def content_hash(path: Union[str, Path]) -> str:
+    """Hash of the raw bytes of a fragment file. Identical images saved by the same encoder share it."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stamp(path: Union[str, Path]) -> List[int]:
+    st = Path(path).stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+class FragmentHashIndex:
+    """
+    Content hash of every fragment image of a dataset version, keyed by fragment `full_name`.
+
+    The index is persisted as JSON and only fragments whose file changed are hashed again.
+    Caches keyed by content hash store a fragment shared by several puzzles only once.
+    """
+
+    def __init__(self, hashes: Dict[str, str]) -> None:
+        self.hashes = hashes
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def __getitem__(self, full_name: str) -> str:
+        return self.hashes[full_name]
+
+    def __contains__(self, full_name: str) -> bool:
+        return full_name in self.hashes
+
+    @classmethod
+    def build(cls, fragments: Iterable[dict], index_path: Union[str, Path, None] = None, max_workers: int = 8) -> 'FragmentHashIndex':
+        """Hash `fragments` (dicts with 'full_name' and 'image_path'), reusing `index_path` if it exists."""
+        stored = {}
+        if index_path is not None and Path(index_path).exists():
+            with open(index_path, 'r') as f:
+                content = json.load(f)
+            if content.get('version') == INDEX_VERSION:
+                stored = content['fragments']
+
+        fragments = list(fragments)
+        entries = {}
+        todo = []
+        for frag in fragments:
+            entry = stored.get(frag['full_name'])
+            stamp = _stamp(frag['image_path'])
+            if entry is not None and entry['stamp'] == stamp:
+                entries[frag['full_name']] = entry
+            else:
+                todo.append((frag, stamp))
+
+        if len(todo) > 0:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                digests = list(tqdm(executor.map(lambda t: content_hash(t[0]['image_path']), todo),
+                                    total=len(todo), desc="Hashing fragments"))
+            for (frag, stamp), digest in zip(todo, digests):
+                entries[frag['full_name']] = {'hash': digest, 'stamp': stamp}
+
+            if index_path is not None:
+                stored.update(entries)
+                index_path = Path(index_path)
+                index_path.parent.mkdir(parents=True, exist_ok=True)
+                # datasets of several processes may build the index at the same time
+                tmp = index_path.with_name(f"{index_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                with open(tmp, 'w') as f:
+                    json.dump({'version': INDEX_VERSION, 'fragments': stored}, f)
+                tmp.replace(index_path)
+
+        return cls({name: entry['hash'] for name, entry in entries.items()})
+
+    def groups(self) -> Dict[str, List[str]]:
+        """Fragment full names by content hash."""
+        groups = defaultdict(list)
+        for name, digest in self.hashes.items():
+            groups[digest].append(name)
+        return dict(groups)
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        """Content hashes shared by more than one fragment, with the fragments sharing them."""
+        return {digest: sorted(names) for digest, names in self.groups().items() if len(names) > 1}
+
+    def cross_split_duplicates(self, split_a: Sequence[str], split_b: Sequence[str]) -> List[dict]:
+        """
+        Fragments appearing (by content) in puzzles of both splits.
+
+        Args:
+            split_a, split_b (list of str): puzzle names of the two splits, e.g. `train_split` and `test_split`.
+
+        Returns:
+            list of dict: one entry per shared content hash, with the fragment full names on each side.
+        """
+        split_a, split_b = set(split_a), set(split_b)
+        report = []
+        for digest, names in sorted(self.duplicates().items()):
+            in_a = [n for n in names if n.split('/')[0] in split_a]
+            in_b = [n for n in names if n.split('/')[0] in split_b]
+            if in_a and in_b:
+                report.append({'hash': digest, 'a': in_a, 'b': in_b})
+        return report
+
+
+class DecodedCache:
+    """Thread-safe LRU of decoded fragments, bounded in bytes and keyed by content hash."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _nbytes(image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, key) -> Optional[object]:
+        with self._lock:
+            image = self._items.get(key)
+            if image is not None:
+                self._items.move_to_end(key)
+            return image
+
+    def put(self, key, image) -> None:
+        n = self._nbytes(image)
+        if n > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = image
+            self.size += n
+            while self.size > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self.size -= self._nbytes(old)
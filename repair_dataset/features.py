@@ -0,0 +1,177 @@
+from typing import Callable, Dict, Iterable, List, Optional, Union
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+from tqdm import tqdm
+
+from .getters.solved2d_getter import load_fragment_2dsolved
+from .locks import file_lock
+
+STORE_VERSION = 1
+_NAME_RE = re.compile(r'^[A-Za-z0-9_.\-]+$')
+
+
+def _compute_one(fn: Callable, frag: dict) -> np.ndarray:
+    # module level, so that it can be sent to worker processes
+    image = load_fragment_2dsolved(frag)
+    return np.asarray(fn(image, frag))
+
+
+class FeatureStore:
+    """
+    Read-only, memory-mapped columnar store of a per-fragment feature.
+
+    All the values are concatenated in a single flat `data.npy`, with `offsets.npy` and `shapes.npy`
+    giving where every row starts and its shape. Fragments with the same content hash share a row.
+    Reading never touches the source images.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        with open(self.path / 'manifest.json', 'r') as f:
+            self.manifest = json.load(f)
+        self._data = np.load(self.path / 'data.npy', mmap_mode='r')
+        self._offsets = np.load(self.path / 'offsets.npy')
+        self._shapes = np.load(self.path / 'shapes.npy')
+        self._rows: Dict[str, int] = self.manifest['rows']
+
+    @property
+    def version(self) -> str:
+        return self.manifest['feature_version']
+
+    @property
+    def hashes(self) -> Dict[str, str]:
+        return self.manifest['hashes']
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, full_name: str) -> bool:
+        return full_name in self._rows
+
+    def keys(self) -> List[str]:
+        return list(self._rows.keys())
+
+    def __getitem__(self, full_name: str) -> np.ndarray:
+        row = self._rows[full_name]
+        start, end = self._offsets[row], self._offsets[row + 1]
+        return self._data[start:end].reshape(tuple(self._shapes[row]))
+
+    def is_valid(self, hashes: Dict[str, str]) -> bool:
+        """True if the store holds an up-to-date value for all the fragments in `hashes` (full name -> content hash)."""
+        stored = self.hashes
+        return all(stored.get(name) == digest for name, digest in hashes.items())
+
+    @staticmethod
+    def write(path: Union[str, Path], values: Dict[str, np.ndarray], hashes: Dict[str, str], meta: dict) -> None:
+        """Write `values` (content hash -> array) for the fragments in `hashes` (full name -> content hash)."""
+        path = Path(path)
+        # write in a new folder per process and thread and swap it in, readers may have the old arrays memory-mapped
+        unique = f"{os.getpid()}.{threading.get_ident()}"
+        tmp_path = path.with_name(f"{path.name}.{unique}.tmp")
+        if tmp_path.exists():
+            # left by a crashed run with the same pid
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+
+        digests = sorted(values)
+        rows = {digest: i for i, digest in enumerate(digests)}
+        arrays = [np.asarray(values[d]) for d in digests]
+
+        ndim = max((a.ndim for a in arrays), default=1)
+        shapes = np.zeros((len(arrays), ndim), dtype=np.int64)
+        for i, a in enumerate(arrays):
+            shapes[i, ndim - a.ndim:] = a.shape
+            shapes[i, :ndim - a.ndim] = 1
+
+        dtype = np.result_type(*arrays) if arrays else np.float32
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([a.size for a in arrays])
+        data = np.concatenate([a.ravel() for a in arrays]).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+
+        np.save(tmp_path / 'data.npy', data)
+        np.save(tmp_path / 'offsets.npy', offsets)
+        np.save(tmp_path / 'shapes.npy', shapes)
+
+        manifest = dict(meta)
+        manifest.update({
+            'store_version': STORE_VERSION,
+            'hashes': hashes,
+            'rows': {name: rows[digest] for name, digest in hashes.items()},
+        })
+        with open(tmp_path / 'manifest.json', 'w') as f:
+            json.dump(manifest, f)
+
+        # concurrent writers swap one at a time, the last one wins
+        old_path = path.with_name(f"{path.name}.{unique}.old")
+        with file_lock(path.with_name(path.name + '.lock')):
+            if path.exists():
+                path.rename(old_path)
+            tmp_path.rename(path)
+        if old_path.exists():
+            shutil.rmtree(old_path)
+
+
+def feature_store_path(cache_path: Union[str, Path], variant_version, name: str, version: str) -> Path:
+    for s in (name, version):
+        if not _NAME_RE.match(s):
+            raise RuntimeError(f"Invalid feature name or version: {s!r}")
+    return Path(cache_path) / 'features' / str(variant_version) / name / version
+
+
+def compute_feature(fn: Callable,
+                    fragments: Iterable[dict],
+                    hashes: Dict[str, str],
+                    store_path: Union[str, Path],
+                    meta: dict,
+                    max_workers: Optional[int] = None,
+                    use_processes: bool = True) -> FeatureStore:
+    """
+    Compute `fn(image, frag)` for the fragments missing (or outdated) in the store at `store_path`.
+
+    `image` is the centered and padded RGBA fragment, as returned in supervised mode. Values are computed
+    once per content hash, valid values already in the store are kept.
+    """
+    store_path = Path(store_path)
+    fragments = list(fragments)
+
+    values: Dict[str, np.ndarray] = {}
+    all_hashes: Dict[str, str] = {}
+    old = None
+    if (store_path / 'manifest.json').exists():
+        old = FeatureStore(store_path)
+        if old.manifest.get('store_version') == STORE_VERSION:
+            # keep the rows of fragments not in this run (e.g. the other split), if their content did not change
+            for name, digest in old.hashes.items():
+                if hashes.get(name, digest) == digest:
+                    all_hashes[name] = digest
+                    values[digest] = np.array(old[name])
+
+    todo: Dict[str, dict] = {}
+    for frag in fragments:
+        digest = hashes[frag['full_name']]
+        all_hashes[frag['full_name']] = digest
+        if digest not in values and digest not in todo:
+            todo[digest] = frag
+
+    if len(todo) == 0 and old is not None and old.hashes == all_hashes:
+        return old
+
+    if len(todo) > 0:
+        Executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        max_workers = max_workers or min(8, os.cpu_count() or 1)
+        with Executor(max_workers=max_workers) as executor:
+            digests = list(todo)
+            futures = [executor.submit(_compute_one, fn, todo[d]) for d in digests]
+            for digest, future in tqdm(zip(digests, futures), total=len(futures), desc=f"Computing feature {meta.get('name')}"):
+                values[digest] = future.result()
+
+    used = set(all_hashes.values())
+    FeatureStore.write(store_path, {d: v for d, v in values.items() if d in used}, all_hashes, meta)
+    return FeatureStore(store_path)
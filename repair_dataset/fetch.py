@@ -0,0 +1,387 @@
+from typing import List, Optional, Sequence, Set, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+import requests
+from tqdm import tqdm
+
+PIECE_SIZE = 8 * 2**20
+_CHUNK = 2**20
+MIRRORS_ENV = 'REPAIR_DATASET_MIRRORS'
+
+
+def parse_checksum(checksum: str):
+    """'md5:<hex>' (or any hashlib algorithm) -> (algorithm, hex digest)."""
+    algo, _, digest = checksum.partition(':')
+    if not digest:
+        raise RuntimeError(f"Invalid checksum {checksum}, expected '<algorithm>:<hex digest>'.")
+    return algo.lower(), digest.lower()
+
+
+def file_checksum(path: Union[str, Path], algo: str) -> str:
+    h = hashlib.new(algo)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stamp(path: Path) -> List[int]:
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _record_path(dest: Path) -> Path:
+    return dest.with_name(dest.name + '.verified.json')
+
+
+def is_verified(dest: Union[str, Path], checksum: Optional[str]) -> bool:
+    """Whether `dest` was verified against `checksum` since it last changed, from the record `fetch_file` leaves next to it."""
+    dest = Path(dest)
+    record = _record_path(dest)
+    if not dest.exists() or not record.exists():
+        return False
+    with open(record, 'r') as f:
+        content = json.load(f)
+    return content.get('checksum') == checksum and content.get('stamp') == _stamp(dest)
+
+
+def _write_record(dest: Path, checksum: Optional[str]) -> None:
+    record = _record_path(dest)
+    tmp = record.with_name(f"{record.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump({'checksum': checksum, 'stamp': _stamp(dest)}, f)
+    tmp.replace(record)
+
+
+def _copy_verified(source: Path, dest: Path, algo: Optional[str], expected: Optional[str]) -> None:
+    # the bytes that land in `dest` are the ones hashed, a mirror file replaced meanwhile cannot get through
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+    h = hashlib.new(algo) if algo is not None else None
+    try:
+        with open(source, 'rb') as src, open(tmp, 'wb') as dst:
+            for chunk in iter(lambda: src.read(_CHUNK), b''):
+                dst.write(chunk)
+                if h is not None:
+                    h.update(chunk)
+        if h is not None and h.hexdigest() != expected:
+            raise RuntimeError(f"Checksum mismatch for {source}: expected {algo}:{expected}, got {algo}:{h.hexdigest()}.")
+        tmp.replace(dest)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def default_mirrors() -> List[str]:
+    """Mirrors from the REPAIR_DATASET_MIRRORS environment variable, separated by ';'."""
+    return [m.strip() for m in os.environ.get(MIRRORS_ENV, '').split(';') if m.strip()]
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith('http://') or source.startswith('https://')
+
+
+class _HashFeeder:
+    """
+    Feeds the pieces of a file to a hash in order, as they complete in any order.
+
+    Only the indices of the pieces written to disk (in this run or a previous one) are kept, pieces are read
+    back when their turn comes, so a stalled piece never makes the others pile up in memory.
+    """
+
+    def __init__(self, algo: str, path: Path, piece_size: int, n_pieces: int, on_disk: Set[int]) -> None:
+        self.hash = hashlib.new(algo)
+        self.path = path
+        self.piece_size = piece_size
+        self.n_pieces = n_pieces
+        self.on_disk = set(on_disk)
+        self.next = 0
+        self._lock = threading.Lock()
+
+    def _advance(self) -> None:
+        if self.next not in self.on_disk:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.next * self.piece_size)
+            while self.next in self.on_disk:
+                self.on_disk.discard(self.next)
+                self.hash.update(f.read(self.piece_size))
+                self.next += 1
+
+    def start(self) -> None:
+        with self._lock:
+            self._advance()
+
+    def submit(self, index: int) -> None:
+        """Piece `index` is on disk."""
+        with self._lock:
+            self.on_disk.add(index)
+            self._advance()
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+class Downloader:
+    """
+    Resumable download of a single file, over several HTTP range connections when the server allows it.
+
+    The file is written to `<dest>.part` piece by piece, completed pieces are listed in `<dest>.part.json`
+    so that an interrupted download resumes where it stopped. The checksum is computed while downloading.
+    """
+
+    def __init__(self, connections: int = 4, piece_size: int = PIECE_SIZE, timeout: float = 60.0, session: Optional[requests.Session] = None) -> None:
+        self.connections = max(1, connections)
+        self.piece_size = piece_size
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.connections)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def _probe(self, url: str):
+        # size and range support, with a 1 byte range request (HEAD is not always allowed)
+        with self.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout, allow_redirects=True) as r:
+            r.raise_for_status()
+            if r.status_code == 206:
+                total = r.headers.get('Content-Range', '').rpartition('/')[2]
+                return (int(total) if total.isdigit() else None), True
+            length = r.headers.get('Content-Length')
+            return (int(length) if length is not None else None), False
+
+    def download(self, url: str, dest: Union[str, Path], checksum: Optional[str] = None) -> Path:
+        """Download `url` to `dest`, verifying `checksum` ('md5:<hex>') on the fly. Returns `dest`."""
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        part = dest.with_name(dest.name + '.part')
+        state_path = dest.with_name(dest.name + '.part.json')
+        algo, expected = parse_checksum(checksum) if checksum else ('md5', None)
+
+        size, ranges = self._probe(url)
+
+        state = None
+        if state_path.exists() and part.exists():
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+            if state.get('url') != url or state.get('size') != size or state.get('piece_size') != self.piece_size:
+                state = None
+        if state is None:
+            state = {'url': url, 'size': size, 'piece_size': self.piece_size, 'done': []}
+            if part.exists():
+                part.unlink()
+
+        if size is None or not ranges:
+            digest = self._download_stream(url, part, algo)
+        else:
+            digest = self._download_pieces(url, part, state, state_path, size, algo)
+
+        if expected is not None and digest != expected:
+            part.unlink()
+            if state_path.exists():
+                state_path.unlink()
+            raise RuntimeError(f"Checksum mismatch for {url}: expected {algo}:{expected}, got {algo}:{digest}.")
+
+        part.replace(dest)
+        if state_path.exists():
+            state_path.unlink()
+        return dest
+
+    def _download_stream(self, url: str, part: Path, algo: str) -> str:
+        h = hashlib.new(algo)
+        with self.session.get(url, stream=True, timeout=self.timeout) as r, open(part, 'wb') as f:
+            r.raise_for_status()
+            total = r.headers.get('Content-Length')
+            with tqdm(total=int(total) if total else None, unit='B', unit_scale=True, desc=f"Downloading {part.stem}") as bar:
+                for chunk in r.iter_content(_CHUNK):
+                    f.write(chunk)
+                    h.update(chunk)
+                    bar.update(len(chunk))
+        return h.hexdigest()
+
+    def _download_pieces(self, url: str, part: Path, state: dict, state_path: Path, size: int, algo: str) -> str:
+        n_pieces = max(1, -(-size // self.piece_size))
+        done = set(state['done'])
+
+        with open(part, 'ab') as f:
+            f.truncate(size)
+
+        feeder = _HashFeeder(algo, part, self.piece_size, n_pieces, done)
+        feeder.start()
+        state_lock = threading.Lock()
+        bar = tqdm(total=size, initial=sum(min(self.piece_size, size - k * self.piece_size) for k in done),
+                   unit='B', unit_scale=True, desc=f"Downloading {part.stem}")
+
+        def fetch(k: int) -> None:
+            start = k * self.piece_size
+            end = min(size, start + self.piece_size) - 1
+            with self.session.get(url, headers={'Range': f'bytes={start}-{end}'}, timeout=self.timeout) as r:
+                r.raise_for_status()
+                if r.status_code != 206 or len(r.content) != end - start + 1:
+                    raise RuntimeError(f"Server did not honour the range request {start}-{end} for {url}.")
+                data = r.content
+            # every piece is written through its own handle
+            with open(part, 'r+b') as f:
+                f.seek(start)
+                f.write(data)
+            feeder.submit(k)
+            bar.update(len(data))
+            with state_lock:
+                state['done'].append(k)
+                tmp = state_path.with_name(f"{state_path.name}.{os.getpid()}.tmp")
+                with open(tmp, 'w') as sf:
+                    json.dump(state, sf)
+                tmp.replace(state_path)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                # pieces are taken in order, the hash follows close behind
+                for future in [executor.submit(fetch, k) for k in range(n_pieces) if k not in done]:
+                    future.result()
+        finally:
+            bar.close()
+
+        return feeder.hexdigest()
+
+
+def fetch_file(url: str,
+               filename: str,
+               dest_dir: Union[str, Path],
+               checksum: Optional[str] = None,
+               mirrors: Optional[Sequence[str]] = None,
+               connections: int = 4,
+               update_mirrors: bool = True) -> Path:
+    """
+    Get `filename` into `dest_dir`: from the first mirror that has it (a shared directory, or an HTTP mirror
+    serving `<mirror>/<filename>`), else from `url`. Every copy is verified against `checksum`. A downloaded
+    file is also copied into the writable mirror directories that miss it, for the next users.
+
+    A verified file gets a `<filename>.verified.json` record (checksum and size/mtime stamp), later calls trust it
+    instead of hashing the file again.
+    """
+    dest = Path(dest_dir) / filename
+    mirrors = list(mirrors) if mirrors is not None else default_mirrors()
+    algo, expected = parse_checksum(checksum) if checksum else (None, None)
+
+    if is_verified(dest, checksum):
+        return dest
+    if dest.exists() and (expected is None or file_checksum(dest, algo) == expected):
+        _write_record(dest, checksum)
+        return dest
+
+    downloader = Downloader(connections=connections)
+    downloaded = False
+    for mirror in mirrors:
+        try:
+            if _is_url(mirror):
+                downloader.download(mirror.rstrip('/') + '/' + filename, dest, checksum)
+                downloaded = True
+                break
+            source = Path(mirror) / filename
+            if source.exists():
+                _copy_verified(source, dest, algo, expected)
+                _write_record(dest, checksum)
+                return dest
+        except (requests.RequestException, RuntimeError, OSError) as e:
+            print(f"Mirror {mirror} failed: {e}")
+
+    if not downloaded:
+        downloader.download(url, dest, checksum)
+    _write_record(dest, checksum)
+
+    if update_mirrors:
+        for mirror in mirrors:
+            if _is_url(mirror):
+                continue
+            target = Path(mirror) / filename
+            try:
+                if not target.exists():
+                    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+                    shutil.copyfile(dest, tmp)
+                    tmp.replace(target)
+            except OSError:
+                # read-only mirrors are fine
+                pass
+    return dest
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler with single byte range support, enough to serve a mirror (or to stand in for Zenodo in tests)."""
+
+    _RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+    def send_head(self):
+        match = self._RANGE_RE.match(self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        first, last = match.groups()
+        if first == '':
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start, end = int(first), min(int(last) if last else size - 1, size - 1)
+        if start > end or start >= size:
+            self.send_error(416, "Requested Range Not Satisfiable")
+            return None
+
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, '_remaining', None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(_CHUNK, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+        self._remaining = None
+
+
+def serve_mirror(directory: Union[str, Path], host: str = '0.0.0.0', port: int = 8000) -> ThreadingHTTPServer:
+    """HTTP mirror of `directory` with range requests. Call `serve_forever()` (or run it in a thread)."""
+    handler = functools.partial(RangeRequestHandler, directory=str(directory))
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:
+
+    argparser = argparse.ArgumentParser(description="Serve a folder of dataset archives as an HTTP mirror with range requests")
+    argparser.add_argument('directory', type=str, help="Folder with the archives")
+    argparser.add_argument('--host', type=str, default='0.0.0.0', help="Address to bind")
+    argparser.add_argument('--port', type=int, default=8000, help="Port to listen on")
+    args = argparser.parse_args()
+
+    server = serve_mirror(args.directory, args.host, args.port)
+    print(f"Serving {args.directory} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,28 +3,57 @@ from pathlib import Path
 import random
 import json
 import warnings
+import math
+import os
+from concurrent.futures import CancelledError
 
+import numpy as np
 from PIL import Image
 
-from ..utils import center_and_pad_rgba, centroid_rgba, concat_pil_img
+from ..utils import center_and_pad_rgba, center_and_pad_alpha, alpha_channel, pack_mask, centroid_rgba, concat_pil_img, load_image
+from ..stats import NULL_SAMPLE_STATS
+from ..contour import place_contour
+from ..poses import get_poses, set_poses, scale_poses, compose_rotations
 
 
-def getmetadata_2dsolved(puzzle_folder: Union[str, Path]) -> dict:
+def getmetadata_2dsolved(puzzle_folder: Union[str, Path], stats=NULL_SAMPLE_STATS) -> dict:
     puzzle_folder = Path(puzzle_folder)
     json_path = puzzle_folder / "data.json"
-    with open(json_path, 'r') as f:
-        data = json.load(f)
+    with stats.stage('read_json'):
+        with open(json_path, 'r') as f:
+            stats.add_read(os.fstat(f.fileno()).st_size)
+            data = json.load(f)
 
     data['path'] = str(puzzle_folder)
 
     return data
 
-def getitem_2dsolved(puzzle_folder : Union[str,Path], supervised_mode : bool, load_images : bool, apply_random_rotations: bool = False) -> Union[dict, tuple]:
+CHANNELS = ('rgba', 'alpha', 'mask')
+
+def load_fragment_2dsolved(frag: dict, stats=NULL_SAMPLE_STATS, channels : str = 'rgba') -> Image.Image:
+    """Default fragment loader: decode, convert to RGBA (or keep only the alpha plane), center and pad."""
+    image = load_image(frag['image_path'], stats)
+    if channels == 'rgba':
+        with stats.stage('convert'):
+            image = image.convert('RGBA')
+        with stats.stage('center_pad'):
+            image = center_and_pad_rgba(image)
+    else:
+        with stats.stage('convert'):
+            image = alpha_channel(image)
+        with stats.stage('center_pad'):
+            image = center_and_pad_alpha(image)
+    return image
+
+def getitem_2dsolved(puzzle_folder : Union[str,Path], supervised_mode : bool, load_images : bool, apply_random_rotations: bool = False, stats=NULL_SAMPLE_STATS, image_loader=None, downscale : int = 1, channels : str = 'rgba', contour_loader=None, rotator=None, cancelled=None) -> Union[dict, tuple]:
 
     if apply_random_rotations and not (supervised_mode and load_images):
         raise RuntimeError("Random rotations can only be applied in supervised mode with load_images=True.")
 
-    data = getmetadata_2dsolved(puzzle_folder)
+    if channels not in CHANNELS:
+        raise RuntimeError(f"Unsupported channels: {channels}. Supported channels are: {list(CHANNELS)}")
+
+    data = getmetadata_2dsolved(puzzle_folder, stats)
 
     puzzle_folder = Path(puzzle_folder)
     puzzle_name = puzzle_folder.name
@@ -60,34 +89,73 @@ def getitem_2dsolved(puzzle_folder : Union[str,Path], supervised_mode : bool, lo
     # x contains in-memory images and few metadata
     # data contains the original metadata dict with the GT
 
+    if image_loader is None:
+        image_loader = lambda frag, stats: load_fragment_2dsolved(frag, stats, channels)
+
+    if downscale != 1:
+        # images come already downscaled from the loader, the GT must match them
+        set_poses(data['fragments'], scale_poses(get_poses(data['fragments']), 1 / downscale))
+        w, h = data['solution_size']
+        data['solution_size'] = [math.ceil(w / downscale), math.ceil(h / downscale)]
 
+    # rotated variants are cached per resolution and channels
+    variant = f"{downscale}_{channels}"
 
     fragments = []
+    # random rotations, composed with the GT poses in bulk at the end
+    angles = np.zeros(len(data['fragments']))
     for i, frag in enumerate(data['fragments']):
 
+        if cancelled is not None and cancelled():
+            raise CancelledError(f"Loading of {puzzle_name} cancelled.")
+
         frag_ = {key: frag[key] for key in ['idx','name','full_name','image_path']}
 
         if load_images:
-            image = Image.open(frag['image_path']).convert('RGBA')
-            image = center_and_pad_rgba(image)
-
+            angle = 0.0
+            image = None
+            if apply_random_rotations:
+                if rotator is not None:
+                    # seeded, per epoch, and possibly already rotated in the cache
+                    angle = rotator.angle(frag)
+                    image = rotator.lookup(frag, angle, variant, stats)
+                else:
+                    angle = round(random.uniform(0, 359),2)
+            rotated = image is not None
+
+            if image is None:
+                image = image_loader(frag, stats)
+                if channels != 'rgba' and image.mode != 'L':
+                    # loaders may return RGBA (e.g. the pyramid), only the alpha plane is kept
+                    with stats.stage('convert'):
+                        image = alpha_channel(image)
 
             if apply_random_rotations:
-                angle = round(random.uniform(0, 359),2)
-                angle_orig = frag['position_2d'][2]
-                new_angle = (angle_orig + angle) % 360.0
+                angles[i] = angle
+                if not rotated:
+                    with stats.stage('rotate'):
+                        image = rotator.rotate(image, angle, frag, variant) if rotator is not None else image.rotate(-angle)
 
+            if contour_loader is not None:
+                # cached contours are relative to the centroid, move them on the returned image
+                with stats.stage('contour'):
+                    frag_['contour'] = place_contour(contour_loader(frag), image.size, downscale, -angle)
 
-                if angle_orig != 0.0:
-                    warnings.warn(f"Fragment {frag} already has a non-zero angle {angle_orig}. Adding random rotation of {angle} on top of it. Resulting angle: {new_angle}")
-                
-                data['fragments'][i]['position_2d'][2] = new_angle
-                image = image.rotate(-angle)
+            if channels == 'mask':
+                frag_['image_size'] = image.size
+                image = pack_mask(image)
 
+            stats.add_output(image)
             frag_['image'] = image
 
 
         fragments.append(frag_)
+
+    if apply_random_rotations:
+        poses = get_poses(data['fragments'])
+        if np.any(poses[:, 2] != 0.0):
+            warnings.warn(f"Fragments of {puzzle_name} already have non-zero angles. Adding random rotations on top of them.")
+        set_poses(data['fragments'], compose_rotations(poses, angles))
     
     x = {
         'name': puzzle_name,
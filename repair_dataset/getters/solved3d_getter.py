@@ -1,7 +1,37 @@
-def getitem_3dsolved(puzzle_folder, supervised_mode) -> dict:
+from typing import Dict, List, Optional, Union
+from pathlib import Path
+import json
+import os
+import re
+import threading
 
-        if supervised_mode:
-            raise NotImplementedError("3D_SOLVED dataset not available in supervised mode.")
+from tqdm import tqdm
+
+INDEX_VERSION = 2
+
+_HEADER_RE = re.compile(rb'^#\s*(vertices|faces)\s*[:=]?\s*(\d+)', re.IGNORECASE | re.MULTILINE)
+
+
+def _obj_counts(obj_path: Path) -> Dict[str, int]:
+        # many exporters (e.g. MeshLab) write the counts in the header comments
+        with open(obj_path, 'rb') as f:
+            head = f.read(1024)
+        counts = {k.decode().lower(): int(v) for k, v in _HEADER_RE.findall(head)}
+        if 'vertices' in counts and 'faces' in counts:
+            return {'n_vertices': counts['vertices'], 'n_faces': counts['faces']}
+
+        # no header, count the records
+        n_vertices, n_faces = 0, 0
+        with open(obj_path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'v '):
+                    n_vertices += 1
+                elif line.startswith(b'f '):
+                    n_faces += 1
+        return {'n_vertices': n_vertices, 'n_faces': n_faces}
+
+
+def _scan_puzzle_3dsolved(puzzle_folder: Path) -> List[dict]:
 
         frags = {}
         for file in puzzle_folder.iterdir():
@@ -13,17 +43,106 @@ def getitem_3dsolved(puzzle_folder, supervised_mode) -> dict:
                     }
                 frags[frag_name][file.suffix.lower()[1:]] = str(file)
 
-        
+
         for frag in frags.values():
             if 'obj' not in frag or 'mtl' not in frag or 'png' not in frag:
                 raise RuntimeError(f"Fragment {frag['name']} is missing one of the required files (.obj, .mtl, .png)")
-            
+
+        # filesystem order is not deterministic
+        return [frags[name] for name in sorted(frags)]
+
+
+def _stamp(path: Path) -> List[int]:
+        st = path.stat()
+        return [st.st_size, st.st_mtime_ns]
+
+
+def _index_puzzle_3dsolved(puzzle_folder: Path) -> dict:
+        fragments = _scan_puzzle_3dsolved(puzzle_folder)
+        for frag in fragments:
+            frag['size'] = sum(Path(frag[ext]).stat().st_size for ext in ['obj', 'mtl', 'png'])
+            frag.update(_obj_counts(Path(frag['obj'])))
+            # sizes and counts come from the files, a file edited in place does not change the folder mtime
+            frag['stamps'] = [_stamp(Path(frag[ext])) for ext in ['obj', 'mtl', 'png']]
+            # store file names only, so that the index survives moving the dataset
+            for ext in ['obj', 'mtl', 'png']:
+                frag[ext] = Path(frag[ext]).name
+
+        return {
+            # files added, removed or renamed
+            'stamp': puzzle_folder.stat().st_mtime_ns,
+            'fragments': fragments,
+        }
+
+
+def _is_current(puzzle_folder: Path, entry: Optional[dict]) -> bool:
+        if entry is None or entry['stamp'] != puzzle_folder.stat().st_mtime_ns:
+            return False
+        try:
+            return all([_stamp(puzzle_folder / frag[ext]) for ext in ['obj', 'mtl', 'png']] == frag['stamps']
+                       for frag in entry['fragments'])
+        except FileNotFoundError:
+            return False
+
+
+def load_index_3dsolved(puzzle_folders: List[Path], index_path: Union[str, Path, None] = None) -> Dict[str, dict]:
+        """
+        Per-puzzle fragment table of a 3D_SOLVED dataset, keyed by puzzle name.
+
+        The table is persisted in `index_path` and only the puzzles whose folder changed are rescanned.
+        """
+        index = {}
+        if index_path is not None and Path(index_path).exists():
+            with open(index_path, 'r') as f:
+                stored = json.load(f)
+            if stored.get('version') == INDEX_VERSION:
+                index = stored['puzzles']
+
+        changed = False
+        for puzzle_folder in tqdm(puzzle_folders, desc="Indexing 3D fragments", leave=False):
+            if not _is_current(puzzle_folder, index.get(puzzle_folder.name)):
+                index[puzzle_folder.name] = _index_puzzle_3dsolved(puzzle_folder)
+                changed = True
+
+        if changed and index_path is not None:
+            index_path = Path(index_path)
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            # concurrent builders never see a partial file
+            tmp = index_path.with_name(f"{index_path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.json")
+            with open(tmp, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'puzzles': index}, f)
+            tmp.replace(index_path)
+
+        return {p.name: index[p.name] for p in puzzle_folders}
+
+
+def getitem_3dsolved(puzzle_folder, supervised_mode, index_entry: Optional[dict] = None, lod_loader=None) -> dict:
+
+        if supervised_mode:
+            raise NotImplementedError("3D_SOLVED dataset not available in supervised mode.")
+
+        puzzle_folder = Path(puzzle_folder)
+
+        if index_entry is not None:
+            fragments = []
+            for frag in index_entry['fragments']:
+                frag = dict(frag)
+                del frag['stamps']
+                for ext in ['obj', 'mtl', 'png']:
+                    frag[ext] = str(puzzle_folder / frag[ext])
+                fragments.append(frag)
+        else:
+            fragments = _scan_puzzle_3dsolved(puzzle_folder)
+
+        # meshes at the selected level of detail, with their error bound
+        if lod_loader is not None:
+            for frag in fragments:
+                frag.update(lod_loader(frag['obj']))
 
         data = {
             'path': str(puzzle_folder),
             'name': puzzle_folder.name,
-            'fragments': list(frags.values()),
+            'fragments': fragments,
         }
 
         return data
-
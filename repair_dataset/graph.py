@@ -0,0 +1,314 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from pathlib import Path
+import json
+import os
+import threading
+
+import numpy as np
+
+INDEX_VERSION = 1
+
+
+def parse_adjacency(adjacency, n_fragments: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Undirected edges of a puzzle as two int arrays (i < j, sorted, no duplicates).
+
+    `adjacency` is the 'adjacency' field of data.json, either an edge list `[[i, j], ...]`, a dense
+    `n_fragments x n_fragments` 0/1 matrix or a dict `{i: [j, ...]}`. Indices are fragment positions
+    in the 'fragments' list.
+    """
+    if adjacency is None or len(adjacency) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    if isinstance(adjacency, dict):
+        pairs = [(int(i), int(j)) for i, js in adjacency.items() for j in js]
+        a = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    else:
+        a = np.asarray(adjacency)
+        if a.ndim == 2 and a.shape == (n_fragments, n_fragments) and np.isin(a, [0, 1]).all():
+            a = np.argwhere(a)
+        elif a.ndim != 2 or a.shape[1] != 2:
+            raise RuntimeError(f"Unsupported adjacency format with shape {a.shape}.")
+        a = a.astype(np.int64)
+
+    if len(a) > 0 and (a.min() < 0 or a.max() >= n_fragments):
+        raise RuntimeError(f"Adjacency refers to fragments out of range [0, {n_fragments}).")
+
+    i, j = np.minimum(a[:, 0], a[:, 1]), np.maximum(a[:, 0], a[:, 1])
+    keep = i != j
+    keys = np.unique(i[keep] * n_fragments + j[keep])
+    return keys // n_fragments, keys % n_fragments
+
+
+def _stamp(puzzle_folder: Path) -> List[int]:
+    st = (puzzle_folder / 'data.json').stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _read_puzzle(puzzle_folder: Path) -> Tuple[int, np.ndarray, np.ndarray]:
+    with open(puzzle_folder / 'data.json', 'r') as f:
+        data = json.load(f)
+    n = len(data['fragments'])
+    i, j = parse_adjacency(data.get('adjacency'), n)
+    return n, i, j
+
+
+class AdjacencyIndex:
+    """
+    Fragment adjacency of a set of 2D_SOLVED puzzles, as a single CSR graph.
+
+    Fragments of all the puzzles are numbered globally: the fragments of puzzle `p` are the nodes
+    `offsets[p]:offsets[p + 1]`, in the order of its 'fragments' list. `indptr` and `indices` are the
+    CSR arrays of the symmetric graph, with sorted neighbors. Queries take and return local fragment
+    indices (positions in the puzzle 'fragments' list) and puzzle names or indices.
+    """
+
+    def __init__(self, names: Sequence[str], offsets: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 stamps: Optional[np.ndarray] = None) -> None:
+        self.names = list(names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.stamps = None if stamps is None else np.asarray(stamps, dtype=np.int64).reshape(-1, 2)
+        self._map = {name: k for k, name in enumerate(self.names)}
+        self._keys = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._map
+
+    def __repr__(self) -> str:
+        return f"AdjacencyIndex({len(self)} puzzles, {self.n_nodes} fragments, {self.n_edges} edges)"
+
+    @property
+    def n_nodes(self) -> int:
+        return int(self.offsets[-1])
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices) // 2
+
+    @classmethod
+    def from_edges(cls, names: Sequence[str], sizes: Sequence[int], edges: Sequence[Tuple[np.ndarray, np.ndarray]],
+                   stamps: Optional[np.ndarray] = None) -> 'AdjacencyIndex':
+        """Assemble the index from per-puzzle fragment counts and local undirected edges (i, j)."""
+        offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(sizes)
+        n = int(offsets[-1])
+
+        if len(edges) > 0:
+            src = np.concatenate([i + offsets[p] for p, (i, j) in enumerate(edges)] + [np.zeros(0, dtype=np.int64)])
+            dst = np.concatenate([j + offsets[p] for p, (i, j) in enumerate(edges)] + [np.zeros(0, dtype=np.int64)])
+        else:
+            src = dst = np.zeros(0, dtype=np.int64)
+
+        # both directions, sorted by row then column
+        rows = np.concatenate([src, dst])
+        cols = np.concatenate([dst, src])
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=n))
+        return cls(names, offsets, indptr, cols, stamps)
+
+    @classmethod
+    def build(cls, puzzle_folders: Sequence[Union[str, Path]], index_path: Union[str, Path, None] = None) -> 'AdjacencyIndex':
+        """
+        Index of `puzzle_folders`. It is persisted in `index_path` (.npz) and only the puzzles whose
+        data.json changed are parsed again.
+        """
+        puzzle_folders = [Path(p) for p in puzzle_folders]
+        stored = None
+        if index_path is not None and Path(index_path).exists():
+            stored = cls.load(index_path)
+
+        names, sizes, edges, stamps = [], [], [], []
+        changed = stored is None or stored.names != [p.name for p in puzzle_folders]
+        for puzzle_folder in puzzle_folders:
+            stamp = _stamp(puzzle_folder)
+            k = stored._map.get(puzzle_folder.name) if stored is not None else None
+            if k is not None and stored.stamps is not None and stored.stamps[k].tolist() == stamp:
+                n = int(stored.offsets[k + 1] - stored.offsets[k])
+                i, j = stored.edges(k)
+            else:
+                n, i, j = _read_puzzle(puzzle_folder)
+                changed = True
+            names.append(puzzle_folder.name)
+            sizes.append(n)
+            edges.append((i, j))
+            stamps.append(stamp)
+
+        if not changed:
+            return stored
+
+        index = cls.from_edges(names, sizes, edges, np.array(stamps, dtype=np.int64))
+        if index_path is not None:
+            index.save(index_path)
+        return index
+
+    def save(self, path: Union[str, Path]) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        stamps = self.stamps if self.stamps is not None else np.zeros((0, 2), dtype=np.int64)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez(tmp, version=INDEX_VERSION, names=np.array(self.names, dtype=str), offsets=self.offsets,
+                 indptr=self.indptr, indices=self.indices, stamps=stamps)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional['AdjacencyIndex']:
+        """Stored index, or None if it was written by another version."""
+        with np.load(path) as f:
+            if int(f['version']) != INDEX_VERSION:
+                return None
+            stamps = f['stamps'] if len(f['stamps']) > 0 else None
+            return cls(f['names'].tolist(), f['offsets'], f['indptr'], f['indices'], stamps)
+
+    def subset(self, names: Sequence[str]) -> 'AdjacencyIndex':
+        """Index restricted to the puzzles `names`, in that order (e.g. a split)."""
+        ks = [self.puzzle_index(name) for name in names]
+        sizes = [int(self.offsets[k + 1] - self.offsets[k]) for k in ks]
+        stamps = self.stamps[ks] if self.stamps is not None else None
+        return AdjacencyIndex.from_edges(list(names), sizes, [self.edges(k) for k in ks], stamps)
+
+    def puzzle_index(self, puzzle: Union[int, str]) -> int:
+        if isinstance(puzzle, str):
+            return self._map[puzzle]
+        if not -len(self) <= puzzle < len(self):
+            raise IndexError(puzzle)
+        return int(puzzle) % len(self)
+
+    def n_fragments(self, puzzle: Union[int, str, None] = None) -> Union[int, np.ndarray]:
+        """Number of fragments of a puzzle, or of all the puzzles as an array."""
+        sizes = np.diff(self.offsets)
+        return sizes if puzzle is None else int(sizes[self.puzzle_index(puzzle)])
+
+    ################### queries ###################
+
+    def neighbors(self, puzzle: Union[int, str], i: int) -> np.ndarray:
+        """Local indices of the fragments adjacent to fragment `i` of `puzzle`."""
+        p = self.puzzle_index(puzzle)
+        u = self.offsets[p] + i
+        return self.indices[self.indptr[u]:self.indptr[u + 1]] - self.offsets[p]
+
+    def edges(self, puzzle: Union[int, str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Undirected edges (i < j) of `puzzle`, in local indices."""
+        p = self.puzzle_index(puzzle)
+        lo, hi = self.offsets[p], self.offsets[p + 1]
+        rows = np.repeat(np.arange(lo, hi), np.diff(self.indptr[lo:hi + 1]))
+        cols = self.indices[self.indptr[lo]:self.indptr[hi]]
+        keep = rows < cols
+        return rows[keep] - lo, cols[keep] - lo
+
+    def to_dense(self, puzzle: Union[int, str]) -> np.ndarray:
+        """Dense boolean adjacency matrix of `puzzle`."""
+        n = self.n_fragments(puzzle)
+        i, j = self.edges(puzzle)
+        dense = np.zeros((n, n), dtype=bool)
+        dense[i, j] = dense[j, i] = True
+        return dense
+
+    def _edge_keys(self) -> np.ndarray:
+        # sorted global (row, col) keys, for batched membership tests
+        if self._keys is None:
+            rows = np.repeat(np.arange(self.n_nodes, dtype=np.int64), np.diff(self.indptr))
+            self._keys = rows * self.n_nodes + self.indices
+        return self._keys
+
+    def is_adjacent(self, puzzles, i, j) -> np.ndarray:
+        """Batched test: are fragments `i[k]` and `j[k]` of puzzle `puzzles[k]` adjacent? Puzzles as indices."""
+        base = self.offsets[np.asarray(puzzles, dtype=np.int64)]
+        keys = (base + np.asarray(i)) * self.n_nodes + base + np.asarray(j)
+        stored = self._edge_keys()
+        pos = np.minimum(np.searchsorted(stored, keys), max(len(stored) - 1, 0))
+        return stored[pos] == keys if len(stored) > 0 else np.zeros(keys.shape, dtype=bool)
+
+    def degrees(self, puzzle: Union[int, str, None] = None) -> np.ndarray:
+        """Degree of every fragment of `puzzle`, or of all the fragments (global numbering)."""
+        degrees = np.diff(self.indptr)
+        if puzzle is None:
+            return degrees
+        p = self.puzzle_index(puzzle)
+        return degrees[self.offsets[p]:self.offsets[p + 1]]
+
+    def degree_stats(self) -> dict:
+        """Degree statistics over all the fragments, plus per-puzzle edge counts and density."""
+        degrees = self.degrees()
+        sizes = self.n_fragments()
+        edges = np.add.reduceat(degrees, self.offsets[:-1]) // 2 if self.n_nodes > 0 else np.zeros(len(self), dtype=np.int64)
+        # reduceat repeats the next value on empty puzzles
+        edges = np.where(sizes > 0, edges, 0)
+        pairs = sizes * (sizes - 1) // 2
+        density = np.divide(edges, pairs, out=np.zeros(len(self)), where=pairs > 0)
+        return {
+            'fragments': self.n_nodes,
+            'edges': self.n_edges,
+            'mean_degree': float(degrees.mean()) if len(degrees) > 0 else 0.0,
+            'min_degree': int(degrees.min()) if len(degrees) > 0 else 0,
+            'max_degree': int(degrees.max()) if len(degrees) > 0 else 0,
+            'isolated': int((degrees == 0).sum()),
+            'degree_histogram': np.bincount(degrees).tolist(),
+            'edges_per_puzzle': edges,
+            'density_per_puzzle': density,
+        }
+
+    def components(self) -> np.ndarray:
+        """
+        Connected component of every fragment (global numbering), labelled by the local index of its
+        smallest fragment. Computed for all the puzzles at once by min-label propagation with shortcutting.
+        """
+        n = self.n_nodes
+        rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+        labels = np.arange(n, dtype=np.int64)
+        while True:
+            new = labels.copy()
+            np.minimum.at(new, rows, labels[self.indices])
+            new = new[new]
+            if np.array_equal(new, labels):
+                break
+            labels = new
+        puzzle_of = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        return labels - self.offsets[puzzle_of]
+
+    def n_components(self) -> np.ndarray:
+        """Number of connected components of every puzzle."""
+        roots = (self.components() == (np.arange(self.n_nodes) - np.repeat(self.offsets[:-1], np.diff(self.offsets))))
+        counts = np.zeros(len(self), dtype=np.int64)
+        np.add.at(counts, np.repeat(np.arange(len(self)), np.diff(self.offsets)), roots)
+        return counts
+
+    def sample_negatives(self, n: int, seed=None, puzzles: Optional[Sequence[Union[int, str]]] = None) -> Dict[str, np.ndarray]:
+        """
+        Sample `n` pairs of non-adjacent fragments of the same puzzle, uniformly over all such pairs.
+
+        Returns:
+            dict: 'puzzle' (puzzle indices), 'i' and 'j' (local fragment indices), arrays of length `n`.
+        """
+        rng = np.random.default_rng(seed)
+        sizes = self.n_fragments()
+        n_edges = self.degree_stats()['edges_per_puzzle']
+        negatives = sizes * (sizes - 1) // 2 - n_edges
+        if puzzles is not None:
+            mask = np.zeros(len(self), dtype=bool)
+            mask[[self.puzzle_index(p) for p in puzzles]] = True
+            negatives = np.where(mask, negatives, 0)
+        if negatives.sum() == 0:
+            raise RuntimeError("No negative pairs to sample from.")
+
+        p = rng.choice(len(self), size=n, p=negatives / negatives.sum())
+        i = np.zeros(n, dtype=np.int64)
+        j = np.zeros(n, dtype=np.int64)
+        todo = np.arange(n)
+        # rejection sampling, only the adjacent draws are drawn again
+        while len(todo) > 0:
+            m = sizes[p[todo]]
+            a = rng.integers(0, m)
+            b = rng.integers(0, m - 1)
+            b = b + (b >= a)
+            i[todo], j[todo] = a, b
+            todo = todo[self.is_adjacent(p[todo], a, b)]
+        return {'puzzle': p, 'i': i, 'j': j}
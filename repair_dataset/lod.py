@@ -0,0 +1,193 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+import numpy as np
+from tqdm import tqdm
+
+from .spatial import load_obj_mesh
+
+INDEX_VERSION = 1
+
+# target face counts of the levels after the full resolution one (level 0)
+LOD_TARGETS = (50000, 10000, 2000)
+
+# cell coordinates are packed in 21 bits per axis
+_BITS = 21
+
+
+def cluster_vertices(vertices: np.ndarray, faces: np.ndarray, cell_size: float) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Vertex clustering on a grid of `cell_size`: the vertices of every cell are merged into their mean, the faces
+    that collapse are dropped, as are the duplicates.
+
+    Returns:
+        (vertices, faces, error): the simplified mesh, and the largest distance a vertex moved. Every point of a
+        simplified face is within `error` of the original face it comes from.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if len(vertices) == 0:
+        return vertices, faces, 0.0
+
+    cells = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+    if cells.max() >= (1 << _BITS):
+        raise RuntimeError(f"Cell size {cell_size} too small for the extent of the mesh.")
+    keys = (cells[:, 0] << (2 * _BITS)) | (cells[:, 1] << _BITS) | cells[:, 2]
+    _, cluster, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    cluster = cluster.reshape(-1)
+
+    merged = np.stack([np.bincount(cluster, weights=vertices[:, d], minlength=len(counts)) for d in range(3)], axis=1)
+    merged /= counts[:, None]
+    error = float(np.sqrt(np.max(np.sum((vertices - merged[cluster]) ** 2, axis=1))))
+
+    f = cluster[faces]
+    f = f[(f[:, 0] != f[:, 1]) & (f[:, 1] != f[:, 2]) & (f[:, 0] != f[:, 2])]
+    # the same triangle, whatever its orientation, is kept once, at its first occurrence
+    _, first = np.unique(np.sort(f, axis=1), axis=0, return_index=True)
+    f = f[np.sort(first)]
+
+    # drop the clusters no face uses
+    used, f = np.unique(f, return_inverse=True)
+    return merged[used], f.reshape(-1, 3), error
+
+
+def decimate(vertices: np.ndarray, faces: np.ndarray, target_faces: int, min_cell: Optional[float] = None,
+             iterations: int = 20) -> dict:
+    """
+    Cluster `vertices` with the smallest cell that brings the mesh to at most `target_faces` faces, found by
+    bisection (on a log scale) above `min_cell`. Meshes already small enough are returned unchanged.
+
+    Returns a level dict: 'vertices', 'faces', 'error' and 'cell_size' (0 for an unchanged mesh).
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if len(faces) <= target_faces:
+        return {'vertices': vertices, 'faces': faces, 'error': 0.0, 'cell_size': 0.0}
+
+    extent = float(np.max(vertices.max(axis=0) - vertices.min(axis=0)))
+    lo = max(min_cell or 0.0, extent / (1 << (_BITS - 1)))
+    hi = 2 * extent
+    best = None
+    for _ in range(iterations):
+        cell = float(np.sqrt(lo * hi))
+        v, f, error = cluster_vertices(vertices, faces, cell)
+        if len(f) <= target_faces:
+            best = {'vertices': v, 'faces': f, 'error': error, 'cell_size': cell}
+            hi = cell
+            # close enough, more iterations only shave a few faces
+            if len(f) >= 0.95 * target_faces:
+                break
+        else:
+            lo = cell
+    if best is None:
+        v, f, error = cluster_vertices(vertices, faces, hi)
+        best = {'vertices': v, 'faces': f, 'error': error, 'cell_size': hi}
+    return best
+
+
+def build_lods(vertices: np.ndarray, faces: np.ndarray, targets: Sequence[int] = LOD_TARGETS) -> List[dict]:
+    """Level 0 (the mesh itself) and one `decimate` level per target face count, coarser and coarser."""
+    levels = [{'vertices': np.asarray(vertices, dtype=np.float64), 'faces': np.asarray(faces, dtype=np.int64),
+               'error': 0.0, 'cell_size': 0.0}]
+    min_cell = None
+    for target in targets:
+        level = decimate(vertices, faces, target, min_cell)
+        # a coarser level never needs a smaller cell
+        min_cell = level['cell_size'] or min_cell
+        levels.append(level)
+    return levels
+
+
+def _stamp(path: Path) -> np.ndarray:
+    st = path.stat()
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+class MeshLODCache:
+    """
+    Levels of detail of the 3D_SOLVED fragment meshes, one .npz per fragment in `cache_dir/<puzzle>/`, with float32
+    vertices and the smallest unsigned faces dtype. Level 0 is the full mesh (parsing the .npz is much faster than
+    the .obj), level k > 0 has at most `targets[k - 1]` faces. Files are invalidated when the .obj or the targets
+    change.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], targets: Sequence[int] = LOD_TARGETS) -> None:
+        targets = [int(t) for t in targets]
+        if any(a <= b for a, b in zip(targets, targets[1:])) or any(t <= 0 for t in targets):
+            raise RuntimeError(f"LOD targets must be positive and decreasing, got {targets}.")
+        self.cache_dir = Path(cache_dir)
+        self.targets = targets
+
+    def __len__(self) -> int:
+        """Number of levels, the full resolution one included."""
+        return len(self.targets) + 1
+
+    def path(self, obj_path: Union[str, Path]) -> Path:
+        obj_path = Path(obj_path)
+        return self.cache_dir / obj_path.parent.name / f"{obj_path.stem}.lod.npz"
+
+    def _valid(self, path: Path, obj_path: Path) -> bool:
+        if not path.exists():
+            return False
+        with np.load(path) as npz:
+            return (int(npz['version']) == INDEX_VERSION and np.array_equal(npz['stamp'], _stamp(obj_path))
+                    and npz['targets'].tolist() == self.targets)
+
+    def build_fragment(self, obj_path: Union[str, Path]) -> Path:
+        """Compute and store the levels of one mesh, if missing or outdated."""
+        obj_path = Path(obj_path)
+        path = self.path(obj_path)
+        if self._valid(path, obj_path):
+            return path
+
+        levels = build_lods(*load_obj_mesh(obj_path), targets=self.targets)
+        arrays = {}
+        for k, level in enumerate(levels):
+            n = len(level['vertices'])
+            dtype = np.uint16 if n <= np.iinfo(np.uint16).max else np.uint32
+            arrays[f'vertices_{k}'] = level['vertices'].astype(np.float32)
+            arrays[f'faces_{k}'] = level['faces'].astype(dtype)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # concurrent builders never see a partial file
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez(tmp,
+                 version=INDEX_VERSION,
+                 stamp=_stamp(obj_path),
+                 targets=np.array(self.targets, dtype=np.int64),
+                 errors=np.array([level['error'] for level in levels]),
+                 cell_sizes=np.array([level['cell_size'] for level in levels]),
+                 **arrays)
+        tmp.replace(path)
+        return path
+
+    def build(self, obj_paths: Iterable[Union[str, Path]], max_workers: int = 8) -> None:
+        """Build the missing (or outdated) levels of all the meshes in parallel."""
+        obj_paths = list(obj_paths)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(tqdm(executor.map(self.build_fragment, obj_paths), total=len(obj_paths), desc="Building mesh LODs", leave=False))
+
+    def load(self, obj_path: Union[str, Path], lod: int) -> dict:
+        """
+        Level `lod` of a mesh: 'vertices' (float32 (n, 3)), 'faces' ((m, 3), 0-based), 'lod_error' (the bound of
+        `cluster_vertices`, in mesh units) and 'lod_cell_size'. It is built first if needed.
+        """
+        if not 0 <= lod < len(self):
+            raise RuntimeError(f"Unsupported LOD: {lod}. Supported levels are 0 to {len(self) - 1}.")
+        path = self.build_fragment(obj_path)
+        with np.load(path) as npz:
+            return {
+                'vertices': npz[f'vertices_{lod}'],
+                'faces': npz[f'faces_{lod}'],
+                'lod_error': float(npz['errors'][lod]),
+                'lod_cell_size': float(npz['cell_sizes'][lod]),
+            }
+
+    def errors(self, obj_path: Union[str, Path]) -> Dict[int, float]:
+        """Error bound of every level of a mesh."""
+        path = self.build_fragment(obj_path)
+        with np.load(path) as npz:
+            return dict(enumerate(npz['errors'].tolist()))
@@ -0,0 +1,191 @@
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import json
+import shutil
+import threading
+import zipfile
+
+from tqdm import tqdm
+
+from .fetch import fetch_file
+from .locks import file_lock
+
+STATUS_FILE = 'STATUS.json'
+# marks the STATUS files written here, folders prepared by datman are never touched
+MANAGER = 'repair_dataset'
+
+
+def read_status(data_path: Union[str, Path]) -> Optional[dict]:
+    path = Path(data_path) / STATUS_FILE
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_status(data_path: Union[str, Path], status: dict) -> None:
+    path = Path(data_path) / STATUS_FILE
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(status, f, indent=4)
+    tmp.replace(path)
+
+
+def prepared_here(data_path: Union[str, Path]) -> bool:
+    """Whether `data_path` was prepared by `prepare_dataset` (and not by datman)."""
+    status = read_status(data_path)
+    return status is not None and status.get('manager') == MANAGER
+
+
+def _member_path(name: str, root_folder: Optional[str]) -> Optional[str]:
+    # path of an archive member relative to the dataset root (the `root_folder` of the archive, if any)
+    if root_folder:
+        prefix = root_folder.strip('/') + '/'
+        if not name.startswith(prefix):
+            return None
+        name = name[len(prefix):]
+    return name or None
+
+
+def archive_puzzles(archive: Union[str, Path], root_folder: Optional[str] = None) -> Dict[str, List[str]]:
+    """Members of the zip `archive` grouped by top folder (relative to `root_folder`), '' for the loose files."""
+    groups: Dict[str, List[str]] = {}
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            rel = _member_path(info.filename, root_folder)
+            if rel is None or info.is_dir():
+                continue
+            top = rel.split('/', 1)[0] if '/' in rel else ''
+            groups.setdefault(top, []).append(info.filename)
+    return groups
+
+
+def extract_archive(archive: Union[str, Path],
+                    dest: Union[str, Path],
+                    root_folder: Optional[str] = None,
+                    folders: Optional[Iterable[str]] = None,
+                    max_workers: int = 8) -> List[str]:
+    """
+    Extract the content of `root_folder` inside the zip `archive` into `dest`, only the top `folders` if given
+    ('' for the loose files). Folders are decompressed concurrently, each worker with its own handle on the archive.
+
+    Returns the extracted folders.
+    """
+    dest = Path(dest)
+    groups = archive_puzzles(archive, root_folder)
+    folders = list(groups) if folders is None else [f for f in folders if f in groups]
+
+    local = threading.local()
+
+    def extract(folder: str) -> str:
+        zf = getattr(local, 'zf', None)
+        if zf is None:
+            zf = local.zf = zipfile.ZipFile(archive)
+            handles.append(zf)
+        for name in groups[folder]:
+            target = dest / _member_path(name, root_folder)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with zf.open(name) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        return folder
+
+    handles: List[zipfile.ZipFile] = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            done = list(tqdm(executor.map(extract, folders), total=len(folders), desc=f"Extracting {Path(archive).name}"))
+    finally:
+        for zf in handles:
+            zf.close()
+    return done
+
+
+def prepare_dataset(root: Union[str, Path],
+                    dataset_id: str,
+                    remote,
+                    extract_subpath: str,
+                    patches: Sequence[Callable] = (),
+                    from_scratch: bool = False,
+                    skip_verify: bool = False,
+                    mirrors: Optional[Sequence[str]] = None,
+                    connections: int = 4,
+                    puzzles: Optional[Iterable[str]] = None,
+                    max_workers: int = 8) -> Path:
+    """
+    Managed mode without datman: download the archive of `remote` (mirrors first, see `fetch_file`) into
+    `root/downloads`, extract it into `root/extract_subpath`, apply the `patches` and write a STATUS.json file.
+
+    With `puzzles`, only those puzzle folders are extracted. Later calls extract (and patch) only the puzzles
+    still missing, the STATUS file lists the ones already there.
+
+    Folders with content but without our STATUS file (e.g. prepared by datman) are refused and left untouched,
+    `from_scratch` only deletes folders prepared here.
+
+    Returns the data path.
+    """
+    root = Path(root)
+    data_path = root / extract_subpath
+    wanted = None if puzzles is None else set(puzzles)
+
+    # several processes may prepare the same dataset at once (e.g. one per GPU)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(data_path.with_name(data_path.name + '.lock')):
+        status = read_status(data_path)
+        if not prepared_here(data_path):
+            if data_path.exists() and any(data_path.iterdir()):
+                raise RuntimeError(f"{data_path} was not prepared by repair_dataset (e.g. by datman), it is left untouched. "
+                                   "Open it without mirrors and connections, or choose another root.")
+            status = None
+        elif status.get('dataset_id') != dataset_id and not from_scratch:
+            raise RuntimeError(f"{data_path} holds {status.get('dataset_id')}, not {dataset_id}. Run with from_scratch=True to recreate it.")
+        elif from_scratch:
+            shutil.rmtree(data_path)
+            status = None
+        elif status.get('complete') or (wanted is not None and wanted <= set(status['puzzles'])):
+            return data_path
+
+        archive = fetch_file(remote.url,
+                             remote.filename,
+                             root / 'downloads',
+                             checksum=None if skip_verify else remote.checksum,
+                             mirrors=mirrors,
+                             connections=connections)
+
+        available = [f for f in archive_puzzles(archive, remote.root_folder) if f.startswith('puzzle_')]
+        extracted = set() if status is None else set(status['puzzles'])
+        missing = [f for f in available if f not in extracted and (wanted is None or f in wanted)]
+        if status is None:
+            # loose files come with the first extraction
+            missing.append('')
+
+        # extracted and patched aside, a failure never leaves half patched puzzles behind; patches only
+        # see the new puzzles, they are not idempotent
+        staging = data_path.with_name(data_path.name + '.extracting')
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+        extract_archive(archive, staging, remote.root_folder, missing, max_workers)
+        for patch in patches:
+            patch(staging)
+
+        data_path.mkdir(parents=True, exist_ok=True)
+        for item in staging.iterdir():
+            target = data_path / item.name
+            if target.is_dir():
+                shutil.rmtree(target)
+            elif target.exists():
+                target.unlink()
+            item.rename(target)
+        staging.rmdir()
+
+        extracted.update(f for f in missing if f)
+        write_status(data_path, {
+            'manager': MANAGER,
+            'dataset_id': dataset_id,
+            'archive': remote.filename,
+            'checksum': remote.checksum,
+            'patches': [patch.__name__ for patch in patches],
+            'puzzles': sorted(extracted),
+            'complete': extracted >= set(available),
+        })
+    return data_path
@@ -0,0 +1,242 @@
+from typing import Callable, Dict, List, Optional, Sequence, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from .graph import AdjacencyIndex
+from .poses import PoseTable, pose_matrices, relative_matrices
+from .rotation import warp_affine
+from .contour import image_center
+from .dedup import FragmentHashIndex
+
+PAIR_CHANNELS = ('rgba', 'alpha')
+
+
+def relative_poses(poses_a: np.ndarray, poses_b: np.ndarray) -> np.ndarray:
+    """
+    (n, 3) pose (x, y, angle) of fragment b in the local frame of fragment a, for `position_2d` poses:
+    composing the pose of a with it gives the pose of b.
+    """
+    m = relative_matrices(poses_a, poses_b)
+    relative = np.empty((len(m), 3), dtype=np.float64)
+    relative[:, :2] = m[:, :, 2]
+    relative[:, 2] = np.mod(np.asarray(poses_b, dtype=np.float64).reshape(-1, 3)[:, 2]
+                            - np.asarray(poses_a, dtype=np.float64).reshape(-1, 3)[:, 2], 360.0)
+    return relative
+
+
+class PairIndex:
+    """
+    Adjacent fragment pairs (i < j) of a set of 2D_SOLVED puzzles with their GT relative transforms, as arrays:
+    `puzzle` (puzzle indices), `i`, `j` (local fragment indices) and `relative` (`relative_poses` of j in the
+    frame of i). Negative pairs (non-adjacent fragments of the same puzzle) are drawn on the fly.
+    """
+
+    def __init__(self, adjacency: AdjacencyIndex, poses: PoseTable) -> None:
+        if adjacency.names != poses.names:
+            raise RuntimeError("Adjacency and pose table cover different puzzles.")
+        self.adjacency = adjacency
+        self.poses = poses
+        self.names = adjacency.names
+
+        edges = [adjacency.edges(p) for p in range(len(adjacency))]
+        self.puzzle = np.repeat(np.arange(len(adjacency), dtype=np.int64), [len(i) for i, _ in edges])
+        self.i = np.concatenate([i for i, _ in edges] + [np.zeros(0, dtype=np.int64)])
+        self.j = np.concatenate([j for _, j in edges] + [np.zeros(0, dtype=np.int64)])
+        self.relative = self._relative(self.puzzle, self.i, self.j)
+
+    def __len__(self) -> int:
+        return len(self.puzzle)
+
+    def __repr__(self) -> str:
+        return f"PairIndex({len(self.names)} puzzles, {len(self)} pairs)"
+
+    def _relative(self, puzzle: np.ndarray, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        base = self.poses.offsets[puzzle]
+        return relative_poses(self.poses.poses[base + i], self.poses.poses[base + j])
+
+    def __getitem__(self, k: int) -> dict:
+        return {'puzzle': self.names[self.puzzle[k]], 'i': int(self.i[k]), 'j': int(self.j[k]),
+                'relative': self.relative[k]}
+
+    def matrices(self) -> np.ndarray:
+        """(n_pairs, 2, 3) maps from the local frame of j to the local frame of i."""
+        return pose_matrices(self.relative)
+
+    def sample_negatives(self, n: int, seed=None) -> Dict[str, np.ndarray]:
+        """
+        `n` non-adjacent pairs of fragments of the same puzzle, uniformly, with the relative transform they
+        have in the solution: 'puzzle', 'i', 'j' and 'relative' arrays.
+        """
+        negatives = self.adjacency.sample_negatives(n, seed)
+        negatives['relative'] = self._relative(negatives['puzzle'], negatives['i'], negatives['j'])
+        return negatives
+
+    def sample(self, batch_size: int, negative_fraction: float = 0.5, seed=None) -> Dict[str, np.ndarray]:
+        """
+        A batch of random positive pairs (`index` in this table) and on the fly negatives (`index` -1), with
+        'label' 1 and 0 respectively.
+        """
+        rng = np.random.default_rng(seed)
+        n_neg = int(round(batch_size * negative_fraction))
+        pos = rng.integers(0, len(self), batch_size - n_neg)
+        neg = self.sample_negatives(n_neg, rng)
+        return {
+            'puzzle': np.concatenate([self.puzzle[pos], neg['puzzle']]),
+            'i': np.concatenate([self.i[pos], neg['i']]),
+            'j': np.concatenate([self.j[pos], neg['j']]),
+            'relative': np.concatenate([self.relative[pos], neg['relative']]),
+            'index': np.concatenate([pos, np.full(n_neg, -1, dtype=np.int64)]),
+            'label': np.concatenate([np.ones(len(pos), dtype=np.int64), np.zeros(n_neg, dtype=np.int64)]),
+        }
+
+
+def _radius(image: Image.Image) -> float:
+    # distance from the centroid (image center) to the farthest foreground pixel
+    alpha = np.asarray(image.getchannel('A') if image.mode == 'RGBA' else image)
+    ys, xs = np.nonzero(alpha)
+    if len(xs) == 0:
+        return 0.0
+    c = image_center(image.size)
+    return float(np.sqrt(((xs - c[0]) ** 2 + (ys - c[1]) ** 2).max())) + 1.0
+
+
+def render_pair(image_a: Image.Image, image_b: Image.Image, relative: np.ndarray, size: int = 256,
+                channels: str = 'rgba', radii: Optional[Sequence[float]] = None) -> tuple:
+    """
+    Joint crop of two centered and padded fragments, b placed at the `relative` pose in the frame of a, centered
+    on the midpoint of their centroids and scaled (never up) so that both fit in `size` x `size`.
+
+    Returns:
+        (array, scale): `uint8 (size, size, 4)` with b composited over a for 'rgba', `(size, size, 2)` with the
+        alpha planes of a and b for 'alpha'; and the scale of the crop with respect to the images.
+    """
+    if channels not in PAIR_CHANNELS:
+        raise RuntimeError(f"Unsupported channels: {channels}. Supported channels are: {list(PAIR_CHANNELS)}")
+    relative = np.asarray(relative, dtype=np.float64)
+    r_a, r_b = radii if radii is not None else (_radius(image_a), _radius(image_b))
+    t = relative[:2]
+    mid = t / 2
+    extent = np.hypot(*mid) + max(r_a, r_b, 1.0)
+    scale = min(1.0, size / (2 * extent))
+
+    # crop pixel q -> local point of a: (q - (size - 1) / 2) / scale + mid
+    origin = mid - (size - 1) / (2 * scale)
+    m_a = np.array([[1 / scale, 0, origin[0] + image_center(image_a.size)[0]],
+                    [0, 1 / scale, origin[1] + image_center(image_a.size)[1]]])
+    # local point of a -> local point of b: R^T (p - t)
+    r_t = pose_matrices(relative)[0, :, :2].T
+    m_b = np.concatenate([r_t / scale, (r_t @ (origin - t) + image_center(image_b.size))[:, None]], axis=1)
+
+    if channels == 'rgba':
+        a = warp_affine(image_a, m_a, (size, size))
+        b = warp_affine(image_b, m_b, (size, size))
+        return np.asarray(Image.alpha_composite(a, b)), scale
+
+    a = warp_affine(image_a.getchannel('A') if image_a.mode == 'RGBA' else image_a, m_a, (size, size))
+    b = warp_affine(image_b.getchannel('A') if image_b.mode == 'RGBA' else image_b, m_b, (size, size))
+    return np.stack([np.asarray(a), np.asarray(b)], axis=-1), scale
+
+
+class PairCropStore:
+    """
+    Rendered crops (`render_pair`) of all the pairs of a `PairIndex`, in a single .npy file memory mapped read-only:
+    `store[k]` is a zero-copy view of the crop of pair k. The file is keyed by the pairs, the fragment contents
+    and the parameters; it is built once in parallel, each puzzle decoding its fragments once.
+    """
+
+    def __init__(self,
+                 index: PairIndex,
+                 cache_dir: Union[str, Path],
+                 fragments_of: Callable[[str], List[dict]],
+                 image_loader: Callable[[dict], Image.Image],
+                 hashes: Optional[FragmentHashIndex] = None,
+                 size: int = 256,
+                 channels: str = 'rgba') -> None:
+        if channels not in PAIR_CHANNELS:
+            raise RuntimeError(f"Unsupported channels: {channels}. Supported channels are: {list(PAIR_CHANNELS)}")
+        self.index = index
+        self.cache_dir = Path(cache_dir)
+        self.fragments_of = fragments_of
+        self.image_loader = image_loader
+        self.hashes = hashes
+        self.size = size
+        self.channels = channels
+        self.crops = None
+        self.scales = None
+        self._fingerprint = None
+
+    def fingerprint(self) -> str:
+        if self._fingerprint is not None:
+            return self._fingerprint
+        h = hashlib.blake2b(digest_size=8)
+        for name in self.index.names:
+            h.update(name.encode())
+            if self.hashes is not None:
+                for frag in self.fragments_of(name):
+                    h.update(self.hashes[frag['full_name']].encode())
+        for a in (self.index.puzzle, self.index.i, self.index.j, self.index.relative):
+            h.update(np.ascontiguousarray(a).tobytes())
+        self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    @property
+    def path(self) -> Path:
+        return self.cache_dir / f"pairs_{self.fingerprint()}_{self.size}_{self.channels}.npy"
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, k) -> np.ndarray:
+        if self.crops is None:
+            self.build()
+        return self.crops[k]
+
+    def build(self, max_workers: int = 8) -> 'PairCropStore':
+        """Render the missing store, then map it."""
+        path = self.path
+        scales_path = path.with_suffix('.scales.npy')
+        if not path.exists() or not scales_path.exists():
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            n_channels = 4 if self.channels == 'rgba' else 2
+            unique = f"{os.getpid()}.{threading.get_ident()}"
+            tmp = path.with_name(f"{path.stem}.{unique}.tmp.npy")
+            out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(len(self.index), self.size, self.size, n_channels))
+            scales = np.zeros(len(self.index), dtype=np.float64)
+
+            by_puzzle: Dict[int, List[int]] = {}
+            for k, p in enumerate(self.index.puzzle.tolist()):
+                by_puzzle.setdefault(p, []).append(k)
+
+            def render(item):
+                p, ks = item
+                frags = self.fragments_of(self.index.names[p])
+                needed = sorted(set(self.index.i[ks].tolist()) | set(self.index.j[ks].tolist()))
+                images = {f: self.image_loader(frags[f]) for f in needed}
+                radii = {f: _radius(images[f]) for f in needed}
+                for k in ks:
+                    i, j = int(self.index.i[k]), int(self.index.j[k])
+                    out[k], scales[k] = render_pair(images[i], images[j], self.index.relative[k], self.size,
+                                                    self.channels, (radii[i], radii[j]))
+                return len(ks)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(tqdm(executor.map(render, by_puzzle.items()), total=len(by_puzzle), desc="Rendering pair crops"))
+            out.flush()
+            del out
+            # both files through temporary names, concurrent builders never see a partial file; the crops last,
+            # their presence marks a complete store
+            scales_tmp = path.with_name(f"{path.stem}.{unique}.tmp.scales.npy")
+            np.save(scales_tmp, scales)
+            scales_tmp.replace(scales_path)
+            tmp.replace(path)
+
+        self.crops = np.load(path, mmap_mode='r')
+        self.scales = np.load(scales_path)
+        return self
@@ -13,7 +13,8 @@ def patch_2ds_v2_0_1(data_path : str) -> None:
         'puzzle_0000059_RP_group_58',
     ]
 
-    puzzle_folders = [Path(data_path) / puzzle for puzzle in puzzles]
+    # the dataset may be extracted in parts, patch the puzzles that are there
+    puzzle_folders = [Path(data_path) / puzzle for puzzle in puzzles if (Path(data_path) / puzzle).exists()]
 
     for puzzle in puzzle_folders:
         sol_size = Image.open(puzzle / "preview.png").convert('RGBA').size
@@ -24,7 +25,7 @@ def patch_2ds_v2_0_1(data_path : str) -> None:
 
         # better we open the file now to lock it for writing
         with open(data_file, "w", encoding="utf-8") as f:
-            # Process fragments
+            # Process fragments, only y is written back, ints stay ints
             for i, frag in enumerate(data["fragments"]):
                 y = frag['pixel_position'][1]
                 y = sol_size[1] - y
@@ -9,7 +9,8 @@ import warnings
 from PIL import Image
 from tqdm import tqdm
 
-from repair_dataset.utils import center_and_pad_rgba, centroid_rgba
+from repair_dataset.utils import center_and_pad_rgba
+from repair_dataset.poses import get_poses, set_poses, compose_rotations
 
 def patch_2ds_v3_b1_randrot(dataset_path : str) -> None:
     convert_to_v3_b1_randrot(dataset_path, patch_mode=True)
@@ -51,21 +52,22 @@ def convert_to_v3_b1_randrot(dataset_path : Union[str, Path], output_path : Unio
                 new_puzzle_folder.mkdir(parents=True, exist_ok=True)
 
             fragments = data['fragments']
+            for frag in fragments:
+                if 'position_2d' not in frag:
+                    raise RuntimeError(f"Fragment {frag} does not have 'position_2d' key required for random rotation.")
+
+            # all the poses of the puzzle at once
+            angles = [round(random.uniform(0, 359),2) for _ in fragments]
+            poses = get_poses(fragments, 'position_2d')
+            if (poses[:, 2] != 0.0).any():
+                warnings.warn(f"Fragments of {puzzle_name} already have non-zero angles. Adding random rotations on top of them.")
+            poses = compose_rotations(poses, angles)
+            set_poses(fragments, poses, 'position_2d')
+
             for i, _ in enumerate(fragments):
                 image_path = puzzle_folder / fragments[i]['filename']
                 img_pil = Image.open(image_path).convert('RGBA')
-
-                angle = round(random.uniform(0, 359),2)
-                if 'position_2d' not in fragments[i]:
-                    raise RuntimeError(f"Fragment {fragments[i]} does not have 'position_2d' key required for random rotation.")
-                
-                x,y, original_angle = fragments[i]['position_2d']
-                if original_angle != 0.0:
-                    warnings.warn(f"Fragment {fragments[i]} already has a non-zero angle {original_angle}. Adding random rotation on top of it.")
-                new_angle = original_angle + angle
-                fragments[i]['position_2d'] = (x,y, new_angle)
-
-                x,y = centroid_rgba(img_pil)
+                new_angle = poses[i, 2]
 
                 if in_place:
                     new_image_path = new_puzzle_folder / (image_path.stem + '_cropped_padded.png')
@@ -0,0 +1,87 @@
+from typing import Union
+from pathlib import Path
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# mode -> (PNG color type, bytes per pixel)
+_PNG_MODES = {'L': (0, 1), 'RGB': (2, 3), 'RGBA': (6, 4)}
+_FILTER_BYTES = 4 * 2**20
+
+
+class PNGStreamWriter:
+    """
+    PNG (RGB, RGBA or L) written band by band, for images too large to hold in memory. The height is fixed upfront
+    and the rows must add up to it. Rows are stored with the 'Up' filter, which compresses sheets well.
+    """
+
+    def __init__(self, path: Union[str, Path], width: int, height: int, level: int = 6, mode: str = 'RGB') -> None:
+        if mode not in _PNG_MODES:
+            raise RuntimeError(f"Unsupported mode: {mode}. Supported modes are: {list(_PNG_MODES)}")
+        self.path = Path(path)
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows = 0
+        color_type, self._bpp = _PNG_MODES[mode]
+        self._previous = np.zeros((width * self._bpp,), dtype=np.uint8)
+        self._compressor = zlib.compressobj(level)
+        self._file = open(self.path, 'wb')
+        self._file.write(_PNG_SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+
+    def __enter__(self) -> 'PNGStreamWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            # the image is incomplete anyway, do not hide the error with the row count check
+            self._file.close()
+            return
+        self.close()
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, band: Union[Image.Image, np.ndarray]) -> None:
+        """Append the rows of a `band` (width x any height), converted to the mode of the image."""
+        if isinstance(band, Image.Image) and band.mode != self.mode:
+            band = band.convert(self.mode)
+        rows = np.asarray(band, dtype=np.uint8)
+        rows = rows.reshape(rows.shape[0], -1)
+        if rows.shape[1] != self.width * self._bpp:
+            raise RuntimeError(f"Band width {rows.shape[1] // self._bpp} does not match the image width {self.width}.")
+        if self.rows + len(rows) > self.height:
+            raise RuntimeError("More rows than the image height.")
+
+        # a few rows at a time, the temporaries stay small for wide bands
+        step = max(1, _FILTER_BYTES // (rows.shape[1] + 1))
+        for start in range(0, len(rows), step):
+            chunk = rows[start:start + step]
+            filtered = np.empty((len(chunk), 1 + chunk.shape[1]), dtype=np.uint8)
+            filtered[:, 0] = 2
+            np.subtract(chunk[1:], chunk[:-1], out=filtered[1:, 1:])
+            np.subtract(chunk[0], self._previous, out=filtered[0, 1:])
+            self._previous = chunk[-1].copy()
+
+            data = self._compressor.compress(filtered)
+            if data:
+                self._chunk(b'IDAT', data)
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        try:
+            if self.rows != self.height:
+                raise RuntimeError(f"Only {self.rows} rows written out of {self.height}.")
+            self._chunk(b'IDAT', self._compressor.flush())
+            self._chunk(b'IEND', b'')
+        finally:
+            self._file.close()
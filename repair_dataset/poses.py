@@ -0,0 +1,264 @@
+from typing import List, Optional, Sequence, Tuple, Union
+from pathlib import Path
+import json
+import os
+import threading
+
+import numpy as np
+
+from .sizes import image_size
+
+INDEX_VERSION = 1
+
+# Canonical convention, the one of `position_2d`: (x, y, angle) with (x, y) the fragment centroid in the solution,
+# in pixels, y pointing down, and the angle in degrees, counter-clockwise on screen as `Image.rotate(angle)`.
+
+ArrayLike = Union[np.ndarray, Sequence]
+
+
+def _poses(poses: ArrayLike) -> np.ndarray:
+    return np.array(poses, dtype=np.float64).reshape(-1, 3)
+
+
+def get_poses(fragments: Sequence[dict], key: Optional[str] = None) -> np.ndarray:
+    """(n, 3) poses of the fragment dicts, from `key` ('position_2d', or 'pixel_position' for v2 metadata by default)."""
+    if len(fragments) == 0:
+        return np.zeros((0, 3), dtype=np.float64)
+    if key is None:
+        key = 'position_2d' if 'position_2d' in fragments[0] else 'pixel_position'
+    return _poses([frag[key] for frag in fragments])
+
+
+def set_poses(fragments: Sequence[dict], poses: ArrayLike, key: str = 'position_2d') -> None:
+    """Write (n, 3) poses back into the fragment dicts, as lists."""
+    for frag, pose in zip(fragments, np.asarray(poses, dtype=np.float64).tolist()):
+        frag[key] = pose
+
+
+################### converters ###################
+
+def to_radians(poses: ArrayLike) -> np.ndarray:
+    poses = _poses(poses)
+    poses[:, 2] = np.radians(poses[:, 2])
+    return poses
+
+
+def to_degrees(poses: ArrayLike) -> np.ndarray:
+    poses = _poses(poses)
+    poses[:, 2] = np.degrees(poses[:, 2])
+    return poses
+
+
+def flip_y(poses: ArrayLike, heights: ArrayLike, negate_angle: bool = False) -> np.ndarray:
+    """
+    y-up <-> y-down: y becomes height - y, with `heights` a scalar or one per pose. Angles are kept (they stay
+    counter-clockwise as displayed) unless `negate_angle`, for angles measured in the flipped frame.
+    """
+    poses = _poses(poses)
+    poses[:, 1] = np.asarray(heights, dtype=np.float64) - poses[:, 1]
+    if negate_angle:
+        poses[:, 2] = -poses[:, 2]
+    return poses
+
+
+def scale_poses(poses: ArrayLike, factor: Union[float, ArrayLike]) -> np.ndarray:
+    """Positions multiplied by `factor` (e.g. 1 / downscale), angles unchanged."""
+    poses = _poses(poses)
+    poses[:, :2] *= np.asarray(factor, dtype=np.float64).reshape(-1, 1)
+    return poses
+
+
+def compose_rotations(poses: ArrayLike, angles: ArrayLike) -> np.ndarray:
+    """Poses of fragments rotated by `angles` (degrees) about their centroid on top of their pose, modulo 360."""
+    poses = _poses(poses)
+    poses[:, 2] = np.mod(poses[:, 2] + np.asarray(angles, dtype=np.float64), 360.0)
+    return poses
+
+
+def padded_centroids(sizes: ArrayLike) -> np.ndarray:
+    """(n, 2) centroids of centered and padded fragments of `sizes` (w, h): the image centers."""
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    return (sizes - 1) / 2
+
+
+def centroid_to_topleft(poses: ArrayLike, centroids: ArrayLike) -> np.ndarray:
+    """
+    (n, 2) top-left corners where the fragment images are pasted, given their `centroids` in image coordinates
+    (`centroid_rgba` for cropped frames, `padded_centroids` for padded ones). A rotation about the image center,
+    as `Image.rotate` does, keeps the paste position only for padded frames.
+    """
+    return _poses(poses)[:, :2] - np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+
+
+def topleft_to_centroid(topleft: ArrayLike, centroids: ArrayLike, angles: Optional[ArrayLike] = None) -> np.ndarray:
+    """(n, 3) poses from paste positions and image centroids, the inverse of `centroid_to_topleft`."""
+    topleft = np.asarray(topleft, dtype=np.float64).reshape(-1, 2)
+    poses = np.zeros((len(topleft), 3), dtype=np.float64)
+    poses[:, :2] = topleft + np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+    if angles is not None:
+        poses[:, 2] = angles
+    return poses
+
+
+def reframe(poses: ArrayLike, centroids_from: ArrayLike, centroids_to: ArrayLike) -> np.ndarray:
+    """
+    Poses of a reference point moved from `centroids_from` to `centroids_to` in image coordinates (e.g. the
+    top-left corner, or the center of another frame), taking the rotation of every fragment into account.
+    """
+    poses = _poses(poses)
+    d = np.asarray(centroids_to, dtype=np.float64).reshape(-1, 2) - np.asarray(centroids_from, dtype=np.float64).reshape(-1, 2)
+    m = pose_matrices(poses)
+    poses[:, :2] += np.einsum('nij,nj->ni', m[:, :, :2], d)
+    return poses
+
+
+def pose_matrices(poses: ArrayLike) -> np.ndarray:
+    """
+    (n, 2, 3) affine maps from fragment local coordinates (relative to the centroid, pixels) to the solution, for
+    `position_2d` poses (x, y, angle): the image rotated with `image.rotate(angle)` and its centroid placed on (x, y).
+    """
+    poses = _poses(poses)
+    rad = np.radians(poses[:, 2])
+    cos, sin = np.cos(rad), np.sin(rad)
+    # PIL rotates counter-clockwise on screen, with y pointing down
+    return np.stack([np.stack([cos, sin, poses[:, 0]], -1), np.stack([-sin, cos, poses[:, 1]], -1)], axis=1)
+
+
+def relative_matrices(poses_a: ArrayLike, poses_b: ArrayLike) -> np.ndarray:
+    """(n, 2, 3) maps from the local frame of b to the local frame of a."""
+    ma, mb = pose_matrices(poses_a), pose_matrices(poses_b)
+    ra_t = np.transpose(ma[:, :, :2], (0, 2, 1))
+    rot = ra_t @ mb[:, :, :2]
+    t = np.einsum('nij,nj->ni', ra_t, mb[:, :, 2] - ma[:, :, 2])
+    return np.concatenate([rot, t[:, :, None]], axis=-1)
+
+
+################### table ###################
+
+def _stamp(puzzle_folder: Path) -> List[int]:
+    st = (puzzle_folder / 'data.json').stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _read_puzzle(puzzle_folder: Path) -> Tuple[np.ndarray, Tuple[int, int]]:
+    with open(puzzle_folder / 'data.json', 'r') as f:
+        data = json.load(f)
+    poses = get_poses(data['fragments'])
+    size = data.get('solution_size')
+    if size is None:
+        # v2 fragments are full canvas images
+        size = image_size(puzzle_folder / data['fragments'][0]['filename'].replace('.obj', '.png'))
+    return poses, tuple(size)
+
+
+class PoseTable:
+    """
+    Ground truth poses of a set of 2D_SOLVED puzzles, in the `position_2d` convention, as one `float64 (n, 3)`
+    array: the fragments of puzzle `p` are the rows `offsets[p]:offsets[p + 1]`, in the order of its 'fragments'
+    list. `solution_sizes` is `(n_puzzles, 2)`. Use the module converters on `poses` (or on slices of it).
+    """
+
+    def __init__(self, names: Sequence[str], offsets: np.ndarray, poses: np.ndarray, solution_sizes: np.ndarray,
+                 stamps: Optional[np.ndarray] = None) -> None:
+        self.names = list(names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+        self.solution_sizes = np.asarray(solution_sizes, dtype=np.int64).reshape(-1, 2)
+        self.stamps = None if stamps is None else np.asarray(stamps, dtype=np.int64).reshape(-1, 2)
+        self._map = {name: k for k, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._map
+
+    def __repr__(self) -> str:
+        return f"PoseTable({len(self)} puzzles, {len(self.poses)} fragments)"
+
+    def __getitem__(self, puzzle: Union[int, str]) -> np.ndarray:
+        """(n_fragments, 3) view of the poses of `puzzle`."""
+        p = self.puzzle_index(puzzle)
+        return self.poses[self.offsets[p]:self.offsets[p + 1]]
+
+    def puzzle_index(self, puzzle: Union[int, str]) -> int:
+        if isinstance(puzzle, str):
+            return self._map[puzzle]
+        if not -len(self) <= puzzle < len(self):
+            raise IndexError(puzzle)
+        return int(puzzle) % len(self)
+
+    @property
+    def puzzle_of(self) -> np.ndarray:
+        """Puzzle index of every row."""
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def heights(self) -> np.ndarray:
+        """Solution height of every row, e.g. for `flip_y`."""
+        return self.solution_sizes[self.puzzle_of, 1]
+
+    @classmethod
+    def from_arrays(cls, names: Sequence[str], poses: Sequence[np.ndarray], solution_sizes: Sequence[Tuple[int, int]],
+                    stamps: Optional[np.ndarray] = None) -> 'PoseTable':
+        offsets = np.zeros(len(poses) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in poses])
+        stacked = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 3) for p in poses] + [np.zeros((0, 3))])
+        return cls(names, offsets, stacked, np.array(solution_sizes, dtype=np.int64).reshape(-1, 2), stamps)
+
+    @classmethod
+    def build(cls, puzzle_folders: Sequence[Union[str, Path]], index_path: Union[str, Path, None] = None) -> 'PoseTable':
+        """
+        Table of `puzzle_folders`. It is persisted in `index_path` (.npz) and only the puzzles whose data.json
+        changed are parsed again.
+        """
+        puzzle_folders = [Path(p) for p in puzzle_folders]
+        stored = None
+        if index_path is not None and Path(index_path).exists():
+            stored = cls.load(index_path)
+
+        names, poses, sizes, stamps = [], [], [], []
+        changed = stored is None or stored.names != [p.name for p in puzzle_folders]
+        for puzzle_folder in puzzle_folders:
+            stamp = _stamp(puzzle_folder)
+            k = stored._map.get(puzzle_folder.name) if stored is not None else None
+            if k is not None and stored.stamps is not None and stored.stamps[k].tolist() == stamp:
+                p, size = stored[k], stored.solution_sizes[k]
+            else:
+                p, size = _read_puzzle(puzzle_folder)
+                changed = True
+            names.append(puzzle_folder.name)
+            poses.append(p)
+            sizes.append(size)
+            stamps.append(stamp)
+
+        if not changed:
+            return stored
+
+        table = cls.from_arrays(names, poses, sizes, np.array(stamps, dtype=np.int64))
+        if index_path is not None:
+            table.save(index_path)
+        return table
+
+    def save(self, path: Union[str, Path]) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        stamps = self.stamps if self.stamps is not None else np.zeros((0, 2), dtype=np.int64)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez(tmp, version=INDEX_VERSION, names=np.array(self.names, dtype=str), offsets=self.offsets,
+                 poses=self.poses, solution_sizes=self.solution_sizes, stamps=stamps)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional['PoseTable']:
+        """Stored table, or None if it was written by another version."""
+        with np.load(path) as f:
+            if int(f['version']) != INDEX_VERSION:
+                return None
+            stamps = f['stamps'] if len(f['stamps']) > 0 else None
+            return cls(f['names'].tolist(), f['offsets'], f['poses'], f['solution_sizes'], stamps)
+
+    def subset(self, names: Sequence[str]) -> 'PoseTable':
+        """Table restricted to the puzzles `names`, in that order (e.g. a split)."""
+        ks = [self.puzzle_index(name) for name in names]
+        stamps = self.stamps[ks] if self.stamps is not None else None
+        return PoseTable.from_arrays(list(names), [self[k] for k in ks], self.solution_sizes[ks], stamps)
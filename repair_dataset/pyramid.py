@@ -0,0 +1,98 @@
+from typing import Dict, Iterable, Sequence, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import math
+import os
+import threading
+
+from PIL import Image
+from tqdm import tqdm
+
+from .utils import center_and_pad_rgba, load_image
+from .stats import NULL_SAMPLE_STATS
+from .dedup import FragmentHashIndex
+
+# downscale factors of the pyramid levels: full, 1/2, 1/4, 1/8
+LEVELS = (1, 2, 4, 8)
+
+
+def scale_to_factor(scale: float, levels: Sequence[int] = LEVELS) -> int:
+    factor = int(round(1.0 / scale)) if scale > 0 else 0
+    if factor not in levels or not math.isclose(factor * scale, 1.0):
+        raise RuntimeError(f"Unsupported scale: {scale}. Supported scales are: {[1 / k for k in levels]}")
+    return factor
+
+
+def downscale_centered(image: Image.Image, factor: int) -> Image.Image:
+    """
+    Downscale a centered and padded fragment by exactly `factor`, keeping the centroid in the center.
+
+    The output is odd sized like the input, so that `position_2d / factor` places it correctly.
+    """
+    if factor == 1:
+        return image
+
+    size = image.width
+    out_size = 2 * math.ceil(size / (2 * factor)) + 1
+
+    # pad so that the sampled box, centered on the image center, is inside the image
+    margin = 2 * factor
+    padded = Image.new('RGBA', (size + 2 * margin, size + 2 * margin), (0, 0, 0, 0))
+    padded.paste(image, (margin, margin))
+
+    c = margin + size / 2
+    half = out_size * factor / 2
+    box = (c - half, c - half, c + half, c + half)
+
+    return padded.resize((out_size, out_size), Image.LANCZOS, box=box)
+
+
+class FragmentPyramid:
+    """
+    Cache of centered and padded fragments at several resolutions.
+
+    Levels are stored as PNGs in `cache_dir`, one file per level and fragment content hash,
+    so fragments shared by several puzzles are processed and stored once.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], hashes: FragmentHashIndex, levels: Sequence[int] = LEVELS) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.hashes = hashes
+        self.levels = tuple(levels)
+
+    def level_path(self, frag: dict, factor: int) -> Path:
+        digest = self.hashes[frag['full_name']]
+        return self.cache_dir / digest[:2] / f"{digest}@{factor}.png"
+
+    def is_built(self, frag: dict) -> bool:
+        # content addressed, a changed source has a different hash
+        return all(self.level_path(frag, factor).exists() for factor in self.levels)
+
+    def build_fragment(self, frag: dict) -> None:
+        image = center_and_pad_rgba(Image.open(frag['image_path']).convert('RGBA'))
+        for factor in self.levels:
+            path = self.level_path(frag, factor)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # a temporary file per process and thread, concurrent builders never see a partial image
+            tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.png")
+            downscale_centered(image, factor).save(tmp, format='PNG')
+            tmp.replace(path)
+
+    def build(self, fragments: Iterable[dict], max_workers: int = 8) -> None:
+        """Build the missing (or outdated) levels of `fragments` in parallel."""
+        todo: Dict[str, dict] = {}
+        for frag in fragments:
+            digest = self.hashes[frag['full_name']]
+            if digest not in todo and not self.is_built(frag):
+                todo[digest] = frag
+        if len(todo) == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.build_fragment, frag) for frag in todo.values()]
+
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Building fragment pyramid"):
+                future.result()
+
+    def load(self, frag: dict, factor: int, stats=NULL_SAMPLE_STATS) -> Image.Image:
+        return load_image(self.level_path(frag, factor), stats)
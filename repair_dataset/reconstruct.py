@@ -1,22 +1,24 @@
+from pathlib import Path
 from PIL import Image
 import math
+import numpy as np
 from .utils import centroid_rgba
+from .poses import centroid_to_topleft
+from .png import PNGStreamWriter
 
 def _reassemble_solution_2d(images, positions, solution_size):
 
     solution_pil = Image.new("RGBA", solution_size, (0, 0, 0, 0))
 
-    for img_pil, pos in zip(images, positions):
-        x,y,angle = pos
-        
-        x_c,y_c = centroid_rgba(img_pil)
+    centroids = [centroid_rgba(img_pil) for img_pil in images]
+    topleft = centroid_to_topleft(positions, centroids).astype(int)
 
-        x_ = int(x - x_c)
-        y_ = int(y - y_c)
+    for img_pil, pos, (x_, y_) in zip(images, positions, topleft):
+        angle = pos[2]
         if angle != 0.0:
             img_pil = img_pil.rotate(angle)
         
-        solution_pil.paste(img_pil, (x_, y_), img_pil)
+        solution_pil.paste(img_pil, (int(x_), int(y_)), img_pil)
 
     mask = solution_pil.split()[-1]
 
@@ -43,4 +45,174 @@ def reassemble_2d(solved_fragements, position_key='position_2d', solution_size=N
     if solution_size is None:
         solution_size = (max_x, max_y)
 
-    return _reassemble_solution_2d(images, positions, solution_size)
\ No newline at end of file
+    return _reassemble_solution_2d(images, positions, solution_size)
+
+################### tiled ###################
+
+def _load(fragment):
+    return fragment() if callable(fragment) else fragment
+
+
+class TiledSolution:
+    """
+    Solution of a 2D puzzle composited into `tile_size` tiles, as `reassemble_2d` does on a full canvas.
+
+    `fragments` are RGBA images, or callables loading them (read once to place them, again when their tiles are
+    rendered). Each fragment only touches the tiles its rotated bbox intersects, and it is kept rotated in memory
+    only while its row of tiles is rendered, so memory depends on the tile and fragment sizes, not on the canvas.
+    With `crop`, tiles cover the bbox of the solution, as the image returned by `reassemble_2d`.
+    """
+
+    def __init__(self, fragments, positions, solution_size=None, tile_size=512, crop=True):
+        self.fragments = list(fragments)
+        self.positions = [tuple(p) for p in positions]
+        self.tile_size = tile_size
+
+        topleft, boxes = [], []
+        max_x, max_y = 0, 0
+        for frag, (x, y, angle) in zip(self.fragments, self.positions):
+            img_pil = _load(frag)
+            x_, y_ = centroid_to_topleft([(x, y, angle)], [centroid_rgba(img_pil)]).astype(int)[0]
+            if angle != 0.0:
+                img_pil = img_pil.rotate(angle)
+            bbox = img_pil.getchannel('A').getbbox()
+            topleft.append((int(x_), int(y_)))
+            boxes.append(None if bbox is None else (x_ + bbox[0], y_ + bbox[1], x_ + bbox[2], y_ + bbox[3]))
+            max_x = int(math.ceil(max(max_x, x + img_pil.width)))
+            max_y = int(math.ceil(max(max_y, y + img_pil.height)))
+
+        self.solution_size = tuple(solution_size) if solution_size is not None else (max_x, max_y)
+        w, h = self.solution_size
+        # fragments are clipped by the canvas
+        self.topleft = topleft
+        self.boxes = [None if b is None or b[0] >= w or b[1] >= h or b[2] <= 0 or b[3] <= 0
+                      else (max(0, int(b[0])), max(0, int(b[1])), min(w, int(b[2])), min(h, int(b[3])))
+                      for b in boxes]
+
+        placed = [b for b in self.boxes if b is not None]
+        if not crop:
+            self.box = (0, 0, w, h)
+        elif placed:
+            self.box = (min(b[0] for b in placed), min(b[1] for b in placed),
+                        max(b[2] for b in placed), max(b[3] for b in placed))
+        else:
+            self.box = (0, 0, 0, 0)
+
+    @property
+    def size(self):
+        return self.box[2] - self.box[0], self.box[3] - self.box[1]
+
+    def rows(self):
+        """
+        Rows of tiles, top to bottom: lists of `(box, tile)` with the box in the output image and the RGBA tile,
+        or None for the tiles no fragment touches.
+        """
+        ox0, oy0, ox1, oy1 = self.box
+        t = self.tile_size
+        rotated = {}
+        for ty0 in range(oy0, oy1, t):
+            ty1 = min(ty0 + t, oy1)
+            active = [k for k, b in enumerate(self.boxes) if b is not None and b[1] < ty1 and b[3] > ty0]
+            rotated = {k: rotated[k] if k in rotated else self._rotated(k) for k in active}
+
+            row = []
+            for tx0 in range(ox0, ox1, t):
+                tx1 = min(tx0 + t, ox1)
+                box = (tx0 - ox0, ty0 - oy0, tx1 - ox0, ty1 - oy0)
+                hits = [k for k in active if self.boxes[k][0] < tx1 and self.boxes[k][2] > tx0]
+                if not hits:
+                    row.append((box, None))
+                    continue
+                tile = Image.new("RGBA", (tx1 - tx0, ty1 - ty0), (0, 0, 0, 0))
+                # in fragment order, overlaps resolve as on the full canvas
+                for k in hits:
+                    x_, y_ = self.topleft[k]
+                    tile.paste(rotated[k], (x_ - tx0, y_ - ty0), rotated[k])
+                row.append((box, tile))
+            yield row
+
+    def _rotated(self, k):
+        img_pil = _load(self.fragments[k])
+        angle = self.positions[k][2]
+        return img_pil.rotate(angle) if angle != 0.0 else img_pil
+
+    def bands(self, factor=1):
+        """RGBA bands of one row of tiles over the whole width, reduced by `factor` (dividing `tile_size`)."""
+        if self.tile_size % factor != 0:
+            raise RuntimeError(f"The reduction factor {factor} must divide the tile size {self.tile_size}.")
+        for row in self.rows():
+            yield join_tiles(row, "RGBA", factor)
+
+    def image(self):
+        """The whole solution in memory, for small canvases."""
+        solution_pil = Image.new("RGBA", self.size, (0, 0, 0, 0))
+        for row in self.rows():
+            for box, tile in row:
+                if tile is not None:
+                    solution_pil.paste(tile, box[:2])
+        return solution_pil
+
+    def save(self, path, factor=1):
+        """Stream the solution (reduced by `factor`) to an RGBA PNG, one row of tiles at a time."""
+        write_bands(path, self.bands(factor), reduced_size(self.size, factor), "RGBA")
+        return Path(path)
+
+
+def join_tiles(row, mode, factor=1):
+    """Band of a row of `(box, tile)`, the missing tiles left empty, reduced by `factor`."""
+    width = row[-1][0][2]
+    height = row[0][0][3] - row[0][0][1]
+    band = Image.new(mode, (width, height), 0)
+    for box, tile in row:
+        if tile is not None:
+            band.paste(tile, (box[0], 0))
+    return band.reduce(factor) if factor > 1 else band
+
+
+def reduced_size(size, factor):
+    """Size of `Image.reduce(factor)`."""
+    return (size[0] + factor - 1) // factor, (size[1] + factor - 1) // factor
+
+
+def write_bands(path, bands, size, mode):
+    """Write horizontal `bands` of an image of `size` to a PNG without holding it in memory."""
+    with PNGStreamWriter(path, size[0], size[1], mode=mode) as writer:
+        for band in bands:
+            writer.write(band)
+
+
+def image_bands(image, height, mode, factor=1):
+    """Horizontal bands of `height` rows of an image already in memory, converted to `mode` and reduced by `factor`."""
+    for y in range(0, image.height, height):
+        band = image.crop((0, y, image.width, min(y + height, image.height)))
+        if band.mode != mode:
+            band = band.convert(mode)
+        yield band.reduce(factor) if factor > 1 else band
+
+
+def coverage_rows(solution, alpha):
+    """
+    Rows of tiles of a `TiledSolution` (built with `crop=False`) with the same boxes of `alpha`, the 'L' alpha plane
+    of the ground truth: yields `(row, alphas)`, `alphas` holding the `(box, solution_alpha, gt_alpha)` uint8 arrays.
+    """
+    if solution.box != (0, 0) + tuple(alpha.size):
+        raise RuntimeError("The solution must cover the whole canvas of the ground truth, build it with crop=False.")
+    for row in solution.rows():
+        alphas = []
+        for box, tile in row:
+            gt = np.asarray(alpha.crop(box))
+            alphas.append((box, np.asarray(tile.getchannel('A')) if tile is not None else np.zeros_like(gt), gt))
+        yield row, alphas
+
+
+def reassemble_2d_tiled(solved_fragements, path, position_key='position_2d', solution_size=None, tile_size=512, factor=1):
+    """
+    Like `reassemble_2d`, but the solution is composited tile by tile and streamed to the PNG `path`, optionally
+    reduced by `factor`. Fragment 'image' entries may be callables loading the image. Returns the `TiledSolution`.
+    """
+    solution = TiledSolution([frag['image'] for frag in solved_fragements],
+                             [frag[position_key] for frag in solved_fragements],
+                             solution_size=solution_size,
+                             tile_size=tile_size)
+    solution.save(path, factor)
+    return solution
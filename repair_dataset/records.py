@@ -0,0 +1,205 @@
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .poses import get_poses
+
+
+class Fragment:
+    """
+    Lightweight view on the i-th fragment of a `Puzzle`.
+
+    It does not hold any data itself, all the fields are read from the arrays of the puzzle.
+    """
+
+    __slots__ = ('puzzle', 'i')
+
+    def __init__(self, puzzle: 'Puzzle', i: int) -> None:
+        self.puzzle = puzzle
+        self.i = i
+
+    @property
+    def name(self) -> str:
+        return self.puzzle.fragment_names[self.i]
+
+    @property
+    def full_name(self) -> str:
+        return f'{self.puzzle.name}/{self.name}'
+
+    @property
+    def idx(self) -> int:
+        return int(self.puzzle.idx[self.i])
+
+    @property
+    def image_path(self) -> str:
+        return self.puzzle.image_paths[self.i]
+
+    @property
+    def position_2d(self) -> Optional[np.ndarray]:
+        if self.puzzle.positions is None:
+            return None
+        return self.puzzle.positions[self.i]
+
+    @property
+    def image(self):
+        if self.puzzle.images is None:
+            return None
+        return self.puzzle.images[self.i]
+
+    @property
+    def contour(self) -> Optional[np.ndarray]:
+        if self.puzzle.contours is None:
+            return None
+        return self.puzzle.contours[self.i]
+
+    @property
+    def image_size(self) -> Optional[Tuple[int, int]]:
+        if self.puzzle.image_sizes is None:
+            return None
+        w, h = self.puzzle.image_sizes[self.i]
+        return int(w), int(h)
+
+    def to_dict(self) -> dict:
+        frag = {
+            'idx': self.idx,
+            'name': self.name,
+            'full_name': self.full_name,
+            'image_path': self.image_path,
+        }
+        if self.puzzle.positions is not None:
+            frag['position_2d'] = self.puzzle.positions[self.i].tolist()
+        if self.puzzle.images is not None:
+            frag['image'] = self.puzzle.images[self.i]
+            if not hasattr(frag['image'], 'mode'):
+                frag['image_size'] = self.image_size
+        if self.puzzle.contours is not None:
+            frag['contour'] = self.puzzle.contours[self.i]
+        return frag
+
+    def __repr__(self) -> str:
+        return f"Fragment({self.full_name})"
+
+
+class Puzzle:
+    """
+    Compact record of a 2D_SOLVED puzzle.
+
+    Per-fragment fields are stored column-wise: fragment indices in `idx` (int32, [n]),
+    GT poses in `positions` (float64, [n, 3], x, y, angle) and image sizes in `image_sizes` (int32, [n, 2]).
+    `contours`, if loaded, holds the (m, 2) outline of every fragment in the pixel coordinates of its image.
+    Iterating or indexing returns `Fragment` views. Use `to_dict`/`to_supervised` to get the dict format
+    returned by `RePAIRDataset` without records.
+    """
+
+    __slots__ = ('name', 'path', 'solution_size', 'adjacency', 'fragment_names', 'image_paths',
+                 'idx', 'positions', 'images', 'image_sizes', 'contours')
+
+    def __init__(self,
+                 name: str,
+                 path: Optional[str],
+                 fragment_names: Sequence[str],
+                 image_paths: Sequence[str],
+                 idx: np.ndarray,
+                 positions: Optional[np.ndarray] = None,
+                 solution_size: Optional[Sequence[int]] = None,
+                 adjacency=None,
+                 images: Optional[List] = None,
+                 image_sizes: Optional[np.ndarray] = None,
+                 contours: Optional[List[np.ndarray]] = None) -> None:
+        self.name = name
+        self.path = path
+        self.fragment_names = tuple(fragment_names)
+        self.image_paths = tuple(image_paths)
+        self.idx = np.asarray(idx, dtype=np.int32)
+        self.positions = None if positions is None else np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.solution_size = solution_size
+        self.adjacency = adjacency
+        self.images = images
+        if image_sizes is None and images is not None:
+            # PIL images, or arrays (e.g. shared memory views)
+            image_sizes = [img.size if hasattr(img, 'mode') else (img.shape[1], img.shape[0]) for img in images]
+        self.image_sizes = None if image_sizes is None else np.array(image_sizes, dtype=np.int32).reshape(-1, 2)
+        self.contours = contours
+
+    def __len__(self) -> int:
+        return len(self.fragment_names)
+
+    def __getitem__(self, i: int) -> Fragment:
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        return Fragment(self, i % len(self))
+
+    def __iter__(self) -> Iterator[Fragment]:
+        return (Fragment(self, i) for i in range(len(self)))
+
+    def __repr__(self) -> str:
+        return f"Puzzle({self.name}, {len(self)} fragments)"
+
+    @classmethod
+    def from_dict(cls, data: dict, x: Optional[dict] = None) -> 'Puzzle':
+        """
+        Build a record from the output of `getitem_2dsolved`.
+
+        `data` is the metadata dict (unsupervised output, or the GT of the supervised output),
+        `x` the optional supervised input dict carrying the images.
+        """
+        frags = data['fragments']
+        images, image_sizes, contours = None, None, None
+        if x is not None and len(x['fragments']) > 0 and 'contour' in x['fragments'][0]:
+            contours = [frag['contour'] for frag in x['fragments']]
+        if x is not None and len(x['fragments']) > 0 and 'image' in x['fragments'][0]:
+            images = [frag['image'] for frag in x['fragments']]
+            # packed masks carry their size apart
+            if 'image_size' in x['fragments'][0]:
+                image_sizes = [frag['image_size'] for frag in x['fragments']]
+
+        positions = None
+        if len(frags) > 0 and 'position_2d' in frags[0]:
+            positions = get_poses(frags, 'position_2d')
+
+        return cls(name=data['name'],
+                   path=data.get('path'),
+                   fragment_names=[frag['name'] for frag in frags],
+                   image_paths=[frag['image_path'] for frag in frags],
+                   idx=np.array([frag['idx'] for frag in frags], dtype=np.int32),
+                   positions=positions,
+                   solution_size=data.get('solution_size'),
+                   adjacency=data.get('adjacency'),
+                   images=images,
+                   image_sizes=image_sizes,
+                   contours=contours)
+
+    def to_dict(self) -> dict:
+        """Metadata dict, as returned by `RePAIRDataset` when `supervised_mode=False`."""
+        data = {
+            'name': self.name,
+            'path': self.path,
+            'fragments': [],
+        }
+        if self.solution_size is not None:
+            # a list from data.json, or the (w, h) tuple of the preview for v2 metadata, as the dataset returns it
+            data['solution_size'] = type(self.solution_size)(self.solution_size)
+        if self.adjacency is not None:
+            data['adjacency'] = self.adjacency
+
+        for frag in self:
+            frag_ = frag.to_dict()
+            frag_.pop('image', None)
+            frag_.pop('image_size', None)
+            frag_.pop('contour', None)
+            data['fragments'].append(frag_)
+        return data
+
+    def to_supervised(self) -> Tuple[dict, dict]:
+        """(x, data) tuple, as returned by `RePAIRDataset` when `supervised_mode=True`."""
+        fragments = []
+        for frag in self:
+            frag_ = frag.to_dict()
+            frag_.pop('position_2d', None)
+            fragments.append(frag_)
+
+        x = {
+            'name': self.name,
+            'fragments': fragments,
+        }
+        return x, self.to_dict()
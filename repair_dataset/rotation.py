@@ -0,0 +1,213 @@
+from typing import Dict, Iterable, Optional, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from .dedup import FragmentHashIndex
+from .stats import NULL_SAMPLE_STATS
+from .utils import load_image
+
+MODES = ('nearest', 'exact')
+
+
+def warp_affine(image: Image.Image, matrix: np.ndarray, size: tuple) -> Image.Image:
+    """
+    Inverse affine warp with bilinear interpolation: output pixel (x, y) of an image of `size` (w, h) samples the
+    source at `matrix @ (x, y, 1)` (2 x 3, pixel-center coordinates), transparent (0) outside. RGBA images are
+    interpolated with premultiplied alpha, so that transparent pixels do not bleed into the border colors.
+    """
+    a = np.asarray(image, dtype=np.float32)
+    if a.ndim == 2:
+        a = a[..., None]
+    h, w, c = a.shape
+
+    rgba = image.mode == 'RGBA'
+    if rgba:
+        a = np.concatenate([a[..., :3] * (a[..., 3:] / 255.0), a[..., 3:]], axis=-1)
+
+    m = np.asarray(matrix, dtype=np.float32)
+    ys, xs = np.mgrid[0:size[1], 0:size[0]].astype(np.float32)
+    # source coordinates of every output pixel
+    sx = m[0, 0] * xs + m[0, 1] * ys + m[0, 2]
+    sy = m[1, 0] * xs + m[1, 1] * ys + m[1, 2]
+
+    # one pixel of zeros around the source, so that the border is interpolated with transparency
+    src = np.pad(a, ((1, 1), (1, 1), (0, 0)))
+    x0f, y0f = np.floor(sx), np.floor(sy)
+    fx, fy = (sx - x0f)[..., None], (sy - y0f)[..., None]
+    x0 = np.clip(x0f.astype(np.int64) + 1, 0, w + 1)
+    y0 = np.clip(y0f.astype(np.int64) + 1, 0, h + 1)
+    x1, y1 = np.minimum(x0 + 1, w + 1), np.minimum(y0 + 1, h + 1)
+
+    out = (src[y0, x0] * (1 - fx) * (1 - fy) + src[y0, x1] * fx * (1 - fy)
+           + src[y1, x0] * (1 - fx) * fy + src[y1, x1] * fx * fy)
+    inside = (sx > -1) & (sx < w) & (sy > -1) & (sy < h)
+    out *= inside[..., None]
+
+    if rgba:
+        alpha = out[..., 3:]
+        out[..., :3] = np.divide(out[..., :3] * 255.0, alpha, out=np.zeros_like(out[..., :3]), where=alpha > 0)
+
+    out = np.clip(np.rint(out), 0, 255).astype(np.uint8)
+    return Image.fromarray(out[..., 0] if c == 1 else out, mode=image.mode)
+
+
+def rotate_exact(image: Image.Image, angle: float) -> Image.Image:
+    """
+    Same transform as `image.rotate(angle)` (counter-clockwise, about the image center, same size), computed
+    as a vectorized inverse affine warp with bilinear interpolation, see `warp_affine`.
+    """
+    w, h = image.size
+    rad = math.radians(angle)
+    cos, sin = math.cos(rad), math.sin(rad)
+    cx, cy = (w - 1) / 2, (h - 1) / 2
+    # (dx, dy) -> (dx cos - dy sin, dx sin + dy cos), about the center
+    matrix = np.array([[cos, -sin, cx - cx * cos + cy * sin],
+                       [sin, cos, cy - cx * sin - cy * cos]])
+    return warp_affine(image, matrix, (w, h))
+
+
+class RotationEngine:
+    """
+    Random rotations of the fragments, reproducible and optionally cached.
+
+    The angle of a fragment is a function of (`seed`, epoch, fragment full name) only, so it does not depend
+    on the access order or on the number of workers; call `set_epoch` to get new angles. With `step`, angles
+    are quantized to multiples of `step` degrees, and with `cache_dir` every rotated variant is stored once
+    (per content hash, resolution and channels) so that later rotations are a lookup.
+    Drawn angles are recorded in `log`, `save_log`/`load_log` replay them exactly.
+
+    Args:
+        seed (int, optional): random seed, drawn at random (and recorded) if None.
+        step (float, optional): angular quantization in degrees, 360 must be a multiple of it.
+        mode (str): 'nearest' (PIL rotate, as without the engine) or 'exact' (bilinear affine warp).
+        cache_dir (str or Path, optional): where rotated variants are stored, requires `step` and `hashes`.
+        hashes (FragmentHashIndex, optional): content hashes of the fragments, keys of the cache.
+    """
+
+    def __init__(self,
+                 seed: Optional[int] = None,
+                 step: Optional[float] = None,
+                 mode: str = 'nearest',
+                 cache_dir: Union[str, Path, None] = None,
+                 hashes: Optional[FragmentHashIndex] = None) -> None:
+        if mode not in MODES:
+            raise RuntimeError(f"Unsupported rotation mode: {mode}. Supported modes are: {list(MODES)}")
+
+        if step is not None:
+            n_bins = 360.0 / step
+            if step <= 0 or abs(n_bins - round(n_bins)) > 1e-9:
+                raise RuntimeError(f"Rotation step must divide 360, got {step}.")
+
+        if cache_dir is not None and (step is None or hashes is None):
+            raise RuntimeError("Cached rotations need a rotation step and the fragment hashes.")
+
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        self.step = step
+        self.mode = mode
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.hashes = hashes
+        self.epoch = 0
+        self.log: Dict[int, Dict[str, float]] = {}
+        self._replay: Dict[int, Dict[str, float]] = {}
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    @property
+    def n_bins(self) -> Optional[int]:
+        return None if self.step is None else round(360.0 / self.step)
+
+    def angle(self, frag: dict) -> float:
+        """Rotation angle (degrees, counter-clockwise) of `frag` in the current epoch, recorded in `log`."""
+        name = frag['full_name']
+        replay = self._replay.get(self.epoch)
+        if replay is not None and name in replay:
+            angle = replay[name]
+        else:
+            h = hashlib.blake2b(f"{self.seed}/{self.epoch}/{name}".encode(), digest_size=8).digest()
+            angle = int.from_bytes(h, 'little') / 2**64 * 360.0
+            if self.step is not None:
+                angle = (round(angle / self.step) % self.n_bins) * self.step
+            else:
+                angle = round(angle, 2) % 360.0
+        self.log.setdefault(self.epoch, {})[name] = angle
+        return angle
+
+    def _rotate(self, image: Image.Image, angle: float) -> Image.Image:
+        if self.mode == 'exact':
+            return rotate_exact(image, angle)
+        return image.rotate(angle)
+
+    def variant_path(self, frag: dict, angle: float, variant: str) -> Path:
+        digest = self.hashes[frag['full_name']]
+        k = round(angle / self.step) % self.n_bins
+        return self.cache_dir / self.mode / f"{self.step:g}" / variant / digest[:2] / f"{digest}_{k}.png"
+
+    def lookup(self, frag: dict, angle: float, variant: str = '', stats=NULL_SAMPLE_STATS) -> Optional[Image.Image]:
+        """Cached rotated variant of `frag`, or None. Lets callers skip decoding the unrotated image."""
+        if self.cache_dir is None:
+            return None
+        path = self.variant_path(frag, angle, variant)
+        if not path.exists():
+            return None
+        return load_image(path, stats)
+
+    def rotate(self, image: Image.Image, angle: float, frag: dict, variant: str = '') -> Image.Image:
+        """
+        `image` of `frag` rotated clockwise by `angle`, i.e. so that its GT angle grows by `angle`. Stored in the
+        cache if enabled; `variant` tells apart images of the same fragment at different resolutions or channels.
+        """
+        rotated = self._rotate(image, -angle)
+        if self.cache_dir is not None:
+            path = self.variant_path(frag, angle, variant)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # a temporary file per process and thread, concurrent workers never see a partial image
+            tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.png")
+            rotated.save(tmp, format='PNG')
+            tmp.replace(path)
+        return rotated
+
+    def precompute(self, fragments: Iterable[dict], image_loader, variant: str = '', max_workers: int = 8) -> None:
+        """Store the rotated variants of `fragments` for all the angle bins. `image_loader(frag)` returns the unrotated image."""
+        if self.cache_dir is None:
+            raise RuntimeError("Rotations can only be precomputed with a cache folder.")
+
+        todo: Dict[str, dict] = {}
+        for frag in fragments:
+            todo.setdefault(self.hashes[frag['full_name']], frag)
+
+        def build(frag):
+            missing = [k * self.step for k in range(self.n_bins) if not self.variant_path(frag, k * self.step, variant).exists()]
+            if len(missing) == 0:
+                return
+            image = image_loader(frag)
+            for angle in missing:
+                self.rotate(image, angle, frag, variant)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(build, frag) for frag in todo.values()]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Precomputing rotations"):
+                future.result()
+
+    def save_log(self, path: Union[str, Path]) -> None:
+        """Write the recorded angles (and the parameters needed to draw them again) as JSON."""
+        with open(path, 'w') as f:
+            json.dump({'seed': self.seed, 'step': self.step, 'mode': self.mode,
+                       'epochs': {str(epoch): angles for epoch, angles in self.log.items()}}, f)
+
+    def load_log(self, path: Union[str, Path]) -> None:
+        """Replay the angles recorded in `path`: recorded fragments get the same angle in the same epoch."""
+        with open(path, 'r') as f:
+            content = json.load(f)
+        self.seed = content['seed']
+        self._replay = {int(epoch): angles for epoch, angles in content['epochs'].items()}
@@ -0,0 +1,155 @@
+from typing import Dict, Iterator, List, Optional, Sequence
+import hashlib
+
+import numpy as np
+
+from .sizes import SizeIndex
+
+UNITS = ('puzzles', 'fragments')
+COSTS = ('pixels', 'tokens')
+
+
+class BucketBatchSampler:
+    """
+    Batches of puzzles (or fragments) of similar size, under a padded cost budget.
+
+    Items are sorted by size (fragment count, then padded side) and split into `n_buckets` buckets of the same
+    number of items. Every epoch, each bucket is shuffled and cut greedily into batches whose padded cost stays
+    within `budget`, then all the batches are shuffled. Batches are lists of puzzle names, or of fragment
+    full names with `unit='fragments'`.
+
+    The padded cost of a batch is its size once padded to the largest item: with `cost='tokens'`,
+    batch size x max fragment count (1 per fragment); with `cost='pixels'`, that times the max padded area.
+
+    The order only depends on (`seed`, epoch), so `state_dict`/`load_state_dict` resume an epoch exactly
+    where it stopped, without replaying batches.
+    """
+
+    def __init__(self,
+                 sizes: SizeIndex,
+                 budget: int,
+                 names: Optional[Sequence[str]] = None,
+                 unit: str = 'puzzles',
+                 cost: str = 'pixels',
+                 n_buckets: int = 8,
+                 max_batch_size: Optional[int] = None,
+                 shuffle: bool = True,
+                 seed: int = 0) -> None:
+        if unit not in UNITS:
+            raise RuntimeError(f"Unsupported unit: {unit}. Supported units are: {list(UNITS)}")
+        if cost not in COSTS:
+            raise RuntimeError(f"Unsupported cost: {cost}. Supported costs are: {list(COSTS)}")
+
+        self.budget = budget
+        self.unit = unit
+        self.cost = cost
+        self.n_buckets = max(1, n_buckets)
+        self.max_batch_size = max_batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.position = 0
+
+        if unit == 'puzzles':
+            table = sizes.puzzle_table(names)
+            self.items = list(table['names'])
+            self._count = table['n_fragments']
+            self._side = table['max_padded']
+            self._useful = table['padded_pixels'] if cost == 'pixels' else table['n_fragments']
+        else:
+            table = sizes.fragment_table(names)
+            self.items = list(table['full_names'])
+            self._count = np.ones(len(self.items), dtype=np.int64)
+            self._side = table['padded']
+            self._useful = self._side ** 2 if cost == 'pixels' else self._count
+
+        # sorted by size, then split in buckets of the same number of items
+        order = np.lexsort((self._side, self._count))
+        self._buckets = [b for b in np.array_split(order, min(self.n_buckets, max(len(order), 1))) if len(b) > 0]
+
+        self._fingerprint = hashlib.blake2b('\n'.join(self.items).encode(), digest_size=8).hexdigest()
+        self._batches: Optional[List[List[int]]] = None
+        self._batches_epoch = None
+
+    def batch_cost(self, items: Sequence[int]) -> int:
+        """Padded cost of a batch of item indices."""
+        items = np.asarray(items)
+        cost = len(items) * int(self._count[items].max())
+        if self.cost == 'pixels':
+            cost *= int(self._side[items].max()) ** 2
+        return cost
+
+    def _make_batches(self, epoch: int) -> List[List[int]]:
+        rng = np.random.default_rng([self.seed, epoch])
+        batches = []
+        for bucket in self._buckets:
+            bucket = rng.permutation(bucket) if self.shuffle else bucket
+            batch, max_count, max_side = [], 0, 0
+            for k in bucket:
+                count, side = max(max_count, int(self._count[k])), max(max_side, int(self._side[k]))
+                cost = (len(batch) + 1) * count * (side ** 2 if self.cost == 'pixels' else 1)
+                full = self.max_batch_size is not None and len(batch) >= self.max_batch_size
+                if batch and (cost > self.budget or full):
+                    batches.append(batch)
+                    batch, count, side = [], int(self._count[k]), int(self._side[k])
+                batch.append(int(k))
+                max_count, max_side = count, side
+            if batch:
+                batches.append(batch)
+
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return batches
+
+    def batches(self, epoch: Optional[int] = None) -> List[List[int]]:
+        """Item indices of all the batches of an epoch (the current one by default)."""
+        epoch = self.epoch if epoch is None else epoch
+        if self._batches_epoch != epoch:
+            self._batches = self._make_batches(epoch)
+            self._batches_epoch = epoch
+        return self._batches
+
+    def set_epoch(self, epoch: int) -> None:
+        """Start `epoch` from its first batch."""
+        self.epoch = epoch
+        self.position = 0
+
+    def __len__(self) -> int:
+        return len(self.batches())
+
+    def __iter__(self) -> Iterator[List[str]]:
+        """Batches of the current epoch from the current position. At the end, the next epoch is set."""
+        batches = self.batches()
+        while self.position < len(batches):
+            batch = batches[self.position]
+            self.position += 1
+            yield [self.items[k] for k in batch]
+        self.set_epoch(self.epoch + 1)
+
+    def state_dict(self, batches_consumed: Optional[int] = None) -> Dict:
+        """
+        Resumable state. With a prefetching loader the sampler runs ahead of training: pass the number of batches
+        actually consumed in the current epoch as `batches_consumed`.
+        """
+        return {
+            'seed': self.seed,
+            'epoch': self.epoch,
+            'position': self.position if batches_consumed is None else batches_consumed,
+            'fingerprint': self._fingerprint,
+        }
+
+    def load_state_dict(self, state: Dict) -> None:
+        if state['fingerprint'] != self._fingerprint:
+            raise RuntimeError("Sampler state was saved for a different set of items.")
+        self.seed = state['seed']
+        self.epoch = state['epoch']
+        self.position = state['position']
+        self._batches_epoch = None
+
+    def stats(self) -> Dict[str, float]:
+        """Padding efficiency of the current epoch: useful cost (unpadded) over padded cost."""
+        batches = self.batches()
+        padded = sum(self.batch_cost(b) for b in batches)
+        useful = int(self._useful.sum())
+        return {'batches': len(batches), 'padded_cost': padded, 'useful_cost': useful,
+                'efficiency': useful / padded if padded > 0 else 1.0}
@@ -0,0 +1,253 @@
+from typing import Dict, Optional, Sequence, Union
+from collections import OrderedDict
+from pathlib import Path
+import math
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from .dedup import FragmentHashIndex
+from .contour import fragment_contour, image_center
+from .poses import relative_matrices
+
+def _lower_envelope(f: np.ndarray) -> np.ndarray:
+    """
+    Squared 1-D distance transform of every row of `f` (squared distances, inf where undefined):
+    d(x) = min_x' (x - x')² + f(x'), by the lower envelope of the parabolas of Felzenszwalb and Huttenlocher.
+    The scan is along x, all the rows advance together.
+    """
+    h, w = f.shape
+    ar = np.arange(h)
+    # per row: the stack of the envelope parabolas `v`, their left boundaries `z` and the top `k`
+    v = np.zeros((h, w), dtype=np.int64)
+    z = np.full((h, w + 1), np.inf)
+    k = np.full(h, -1, dtype=np.int64)
+
+    for q in range(w):
+        fq = f[:, q]
+        finite = np.isfinite(fq)
+        first = finite & (k < 0)
+        k[first] = 0
+        v[first, 0] = q
+        z[first, 0] = -np.inf
+
+        cur = np.nonzero(finite & ~first)[0]
+        while len(cur) > 0:
+            vk = v[cur, k[cur]]
+            s = ((fq[cur] + q * q) - (f[cur, vk] + vk * vk)) / (2 * (q - vk))
+            pop = s <= z[cur, k[cur]]
+            # z[0] is -inf, the first parabola is never popped
+            done = cur[~pop]
+            k[done] += 1
+            v[done, k[done]] = q
+            z[done, k[done]] = s[~pop]
+            z[done, k[done] + 1] = np.inf
+            cur = cur[pop]
+            k[cur] -= 1
+
+    d = np.empty((h, w), dtype=np.float64)
+    k = np.zeros(h, dtype=np.int64)
+    for q in range(w):
+        while True:
+            step = z[ar, k + 1] < q
+            if not step.any():
+                break
+            k[step] += 1
+        vk = v[ar, k]
+        # rows without any finite value keep f = inf
+        d[:, q] = (q - vk) ** 2 + f[ar, vk]
+    return d
+
+
+def edt(mask: np.ndarray) -> np.ndarray:
+    """
+    Exact Euclidean distance from every pixel to the nearest True pixel of `mask` (inf if there is none).
+
+    Separable algorithm: distances along the columns by two cumulative scans, then the exact row pass
+    d²(x, y) = min_x' (x - x')² + g(x', y)² in linear time with `_lower_envelope`.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    h, w = mask.shape
+    if w > h:
+        # the row pass loops over x in python, keep it on the short side
+        return edt(mask.T).T
+    rows = np.arange(h, dtype=np.float64)[:, None]
+
+    above = np.maximum.accumulate(np.where(mask, rows, -np.inf), axis=0)
+    below = np.minimum.accumulate(np.where(mask, rows, np.inf)[::-1], axis=0)[::-1]
+    g2 = np.minimum(rows - above, below - rows) ** 2
+
+    return np.sqrt(_lower_envelope(g2))
+
+
+def signed_distance(mask: np.ndarray) -> np.ndarray:
+    """Signed distance to the boundary of `mask` in pixels, negative inside. The boundary lies between pixel centers."""
+    mask = np.asarray(mask, dtype=bool)
+    outside = edt(mask) - 0.5
+    inside = edt(~mask) - 0.5
+    return np.where(mask, -inside, outside)
+
+
+class FragmentSDF:
+    """
+    Signed distance field of a centered and padded fragment, on a grid of step `step` pixels, with the fragment
+    `boundary` points and `interior` cell centers (each covering `step`² pixels), all in local coordinates.
+    """
+
+    __slots__ = ('sdf', 'origin', 'step', 'boundary', 'interior')
+
+    def __init__(self, sdf: np.ndarray, origin: np.ndarray, step: int, boundary: np.ndarray, interior: np.ndarray) -> None:
+        self.sdf = sdf
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.step = int(step)
+        self.boundary = boundary
+        self.interior = interior
+
+    @classmethod
+    def from_alpha(cls, alpha: Image.Image, step: int = 1, margin: int = 16, n_boundary: int = 256) -> 'FragmentSDF':
+        """Build from the centered and padded alpha plane, with a band of `margin` pixels around it."""
+        a = np.pad(np.asarray(alpha) > 127.5, margin)
+        h, w = a.shape
+        hs, ws = math.ceil(h / step), math.ceil(w / step)
+        blocks = np.pad(a, ((0, hs * step - h), (0, ws * step - w))).reshape(hs, step, ws, step)
+        coarse = blocks.mean(axis=(1, 3)) >= 0.5
+
+        sdf = (signed_distance(coarse) * step).astype(np.float32)
+        # local coordinates of the center of cell (0, 0)
+        origin = (step - 1) / 2 - margin - image_center(alpha.size)
+
+        boundary = fragment_contour(alpha, n_samples=n_boundary) - image_center(alpha.size)
+        ys, xs = np.nonzero(coarse)
+        interior = np.stack([xs, ys], axis=-1) * step + origin
+        return cls(sdf, origin, step, boundary.astype(np.float32), interior.astype(np.float32))
+
+    def save(self, path: Union[str, Path]) -> None:
+        np.savez(path, sdf=self.sdf, origin=self.origin, step=self.step, boundary=self.boundary, interior=self.interior)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'FragmentSDF':
+        with np.load(path) as f:
+            return cls(f['sdf'], f['origin'], int(f['step']), f['boundary'], f['interior'])
+
+    def sample(self, points: np.ndarray) -> np.ndarray:
+        """
+        Signed distance at local `points` (..., 2), bilinear inside the grid. Outside the grid, the value at the
+        nearest grid point plus the distance to it, an upper bound of the true distance.
+        """
+        h, w = self.sdf.shape
+        g = (points - self.origin) / self.step
+        gc = np.stack([np.clip(g[..., 0], 0, w - 1), np.clip(g[..., 1], 0, h - 1)], axis=-1)
+        extra = np.linalg.norm(g - gc, axis=-1) * self.step
+
+        x0 = np.minimum(np.floor(gc[..., 0]).astype(np.int64), w - 2 if w > 1 else 0)
+        y0 = np.minimum(np.floor(gc[..., 1]).astype(np.int64), h - 2 if h > 1 else 0)
+        x1, y1 = np.minimum(x0 + 1, w - 1), np.minimum(y0 + 1, h - 1)
+        fx, fy = gc[..., 0] - x0, gc[..., 1] - y0
+        s = self.sdf
+        value = (s[y0, x0] * (1 - fx) * (1 - fy) + s[y0, x1] * fx * (1 - fy)
+                 + s[y1, x0] * (1 - fx) * fy + s[y1, x1] * fx * fy)
+        return value + extra
+
+
+class SDFCache:
+    """
+    Signed distance fields of the fragments, cached per content hash, grid `step` (the resolution, in pixels)
+    and `margin`. Queries take `position_2d` poses in full resolution pixels and never render a canvas.
+    """
+
+    def __init__(self,
+                 cache_dir: Union[str, Path],
+                 hashes: FragmentHashIndex,
+                 image_loader,
+                 step: int = 1,
+                 margin: int = 16,
+                 n_boundary: int = 256,
+                 max_loaded: int = 256) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.hashes = hashes
+        self.image_loader = image_loader
+        self.step = step
+        self.margin = margin
+        self.n_boundary = n_boundary
+        # fields in memory, solvers query the same fragments over and over
+        self.max_loaded = max_loaded
+        self._loaded: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, frag: dict) -> Path:
+        digest = self.hashes[frag['full_name']]
+        return self.cache_dir / f"s{self.step}_m{self.margin}_b{self.n_boundary}" / digest[:2] / f"{digest}.npz"
+
+    def get(self, frag: dict) -> FragmentSDF:
+        """SDF of `frag`, computed on its centered alpha plane (`image_loader(frag)`) and stored if missing."""
+        digest = self.hashes[frag['full_name']]
+        with self._lock:
+            field = self._loaded.get(digest)
+            if field is not None:
+                self._loaded.move_to_end(digest)
+                return field
+
+        path = self.path(frag)
+        if path.exists():
+            field = FragmentSDF.load(path)
+        else:
+            field = FragmentSDF.from_alpha(self.image_loader(frag), self.step, self.margin, self.n_boundary)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+            field.save(tmp)
+            tmp.replace(path)
+        with self._lock:
+            self._loaded[digest] = field
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return field
+
+    def query(self, frag_a: dict, frag_b: dict, poses_a, poses_b, overlap: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Collision measures between two fragments, for a batch of n pose pairs ((n, 3) or (3,) arrays).
+
+        Returns:
+            dict of (n,) arrays: 'penetration' (deepest boundary point of either fragment inside the other, 0 if
+            none), 'gap' (smallest distance between the boundaries, 0 if they touch or overlap) and 'overlap'
+            (area of `frag_b` inside `frag_a`, in pixels, estimated on the interior cells of `frag_b`).
+            The overlap costs one sample per interior cell and pose: use a coarser `step`, or `overlap=False`.
+        """
+        poses_a = np.asarray(poses_a, dtype=np.float64).reshape(-1, 3)
+        poses_b = np.asarray(poses_b, dtype=np.float64).reshape(-1, 3)
+        poses_a, poses_b = np.broadcast_arrays(poses_a, poses_b)
+        sa, sb = self.get(frag_a), self.get(frag_b)
+
+        def in_frame(points, m):
+            # (n, p, 2) points transformed by the (n, 2, 3) maps
+            return np.einsum('nij,pj->npi', m[:, :, :2], points) + m[:, None, :, 2]
+
+        b_to_a, a_to_b = relative_matrices(poses_a, poses_b), relative_matrices(poses_b, poses_a)
+        d_ba = sa.sample(in_frame(sb.boundary, b_to_a)).min(axis=1)
+        d_ab = sb.sample(in_frame(sa.boundary, a_to_b)).min(axis=1)
+        nearest = np.minimum(d_ba, d_ab)
+
+        result = {
+            'penetration': np.maximum(-nearest, 0.0),
+            'gap': np.maximum(nearest, 0.0),
+        }
+        if overlap:
+            inside = sa.sample(in_frame(sb.interior, b_to_a)) < 0
+            result['overlap'] = inside.sum(axis=1) * float(sb.step ** 2)
+        return result
+
+    def batch_query(self, pairs: Sequence[tuple], overlap: bool = True) -> Dict[str, np.ndarray]:
+        """`query` over a list of (frag_a, frag_b, pose_a, pose_b), grouped by fragment pair."""
+        groups: Dict[tuple, list] = {}
+        for k, (a, b, pa, pb) in enumerate(pairs):
+            groups.setdefault((a['full_name'], b['full_name']), []).append(k)
+
+        keys = ['penetration', 'gap', 'overlap'] if overlap else ['penetration', 'gap']
+        out = {key: np.zeros(len(pairs)) for key in keys}
+        for ks in groups.values():
+            a, b = pairs[ks[0]][0], pairs[ks[0]][1]
+            result = self.query(a, b, [pairs[k][2] for k in ks], [pairs[k][3] for k in ks], overlap)
+            for key, value in result.items():
+                out[key][ks] = value
+        return out
@@ -0,0 +1,289 @@
+from typing import Iterator, List, Optional, Sequence, Union
+from pathlib import Path
+import argparse
+import io
+import json
+import random
+import tarfile
+import time
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from .utils import center_and_pad_rgba
+from .records import Puzzle
+from .dataset import RePAIRDataset
+
+INDEX_FILE = 'index.json'
+_MESH_EXTS = ['obj', 'mtl', 'png']
+
+
+def _add_member(tar: tarfile.TarFile, name: str, payload: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(payload))
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, array, allow_pickle=False)
+    return buf.getvalue()
+
+
+def _sample_members(item) -> List[tuple]:
+    """Convert a dataset item into (suffix, payload) tar members, metadata first."""
+
+    if isinstance(item, Puzzle):
+        item = item.to_supervised() if item.images is not None else item.to_dict()
+
+    members = []
+    if isinstance(item, tuple):
+        # 2D supervised: input images go in .npy members, everything else in the json
+        x, data = item
+        x = dict(x)
+        fragments = []
+        for k, frag in enumerate(x['fragments']):
+            frag = dict(frag)
+            image = frag.pop('image', None)
+            if image is not None:
+                members.append((f'{k:03d}.npy', _npy_bytes(np.asarray(image))))
+            fragments.append(frag)
+        x['fragments'] = fragments
+        meta = {'kind': '2d_supervised', 'x': x, 'data': data}
+
+    elif 'image_path' in (item['fragments'][0] if item['fragments'] else {}):
+        # 2D unsupervised: store the centered and padded fragments, as the supervised loader would
+        for k, frag in enumerate(item['fragments']):
+            image = center_and_pad_rgba(Image.open(frag['image_path']).convert('RGBA'))
+            members.append((f'{k:03d}.npy', _npy_bytes(np.asarray(image))))
+        meta = {'kind': '2d', 'data': item}
+
+    else:
+        # 3D: raw mesh files
+        for k, frag in enumerate(item['fragments']):
+            for ext in _MESH_EXTS:
+                with open(frag[ext], 'rb') as f:
+                    members.append((f'{k:03d}.{ext}', f.read()))
+        meta = {'kind': '3d', 'data': item}
+
+    return [('json', json.dumps(meta).encode('utf-8'))] + members
+
+
+def export_shards(dataset: RePAIRDataset,
+                  output_path: Union[str, Path],
+                  samples_per_shard: int = 32,
+                  max_shard_bytes: Optional[int] = None,
+                  prefix: str = 'repair') -> List[Path]:
+    """
+    Write a `RePAIRDataset` into sequential tar shards, one sample per puzzle.
+
+    Members of a sample share the puzzle name as key: `<key>.json` holds the metadata,
+    `<key>.<k>.npy` the centered and padded RGBA fragments (2D) and `<key>.<k>.{obj,mtl,png}`
+    the raw mesh files (3D). A shard is closed after `samples_per_shard` samples, or as soon as
+    it grows over `max_shard_bytes`. An `index.json` with the shard list is written alongside.
+
+    Readers split whole shards among ranks and workers, see `ShardStream`: choose `samples_per_shard`
+    so that there are at least `world_size * num_workers` shards (and ideally many more, the last one
+    may be small), e.g. `len(dataset) // (world_size * num_workers * 4)`.
+
+    Returns:
+        list of Path: the written shards.
+    """
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    shards = []
+    counts = []
+    tar = None
+    n_in_shard, shard_bytes = 0, 0
+
+    for i in tqdm(range(len(dataset)), desc="Exporting shards"):
+        item = dataset[i]
+        key = item.name if isinstance(item, Puzzle) else item[0]['name'] if isinstance(item, tuple) else item['name']
+
+        if tar is None:
+            shards.append(output_path / f'{prefix}-{len(shards):06d}.tar')
+            tar = tarfile.open(shards[-1], 'w')
+            n_in_shard, shard_bytes = 0, 0
+
+        for suffix, payload in _sample_members(item):
+            _add_member(tar, f'{key}.{suffix}', payload)
+            shard_bytes += len(payload)
+        n_in_shard += 1
+
+        if n_in_shard >= samples_per_shard or (max_shard_bytes is not None and shard_bytes >= max_shard_bytes):
+            tar.close()
+            tar = None
+            counts.append(n_in_shard)
+
+    if tar is not None:
+        tar.close()
+        counts.append(n_in_shard)
+
+    index = {
+        'dataset': str(dataset.variant_version),
+        'split': dataset._split,
+        'supervised_mode': dataset.supervised_mode,
+        'shards': [{'file': s.name, 'samples': c} for s, c in zip(shards, counts)],
+    }
+    with open(output_path / INDEX_FILE, 'w') as f:
+        json.dump(index, f, indent=4)
+
+    return shards
+
+
+def _decode_sample(key: str, members: dict):
+    meta = json.loads(members.pop('json'))
+
+    def arrays():
+        return [np.load(io.BytesIO(members[s]), allow_pickle=False) for s in sorted(s for s in members if s.endswith('.npy'))]
+
+    if meta['kind'] == '2d_supervised':
+        x = meta['x']
+        images = arrays()
+        if len(images) == len(x['fragments']):
+            for frag, image in zip(x['fragments'], images):
+                frag['image'] = image
+        return x, meta['data']
+
+    data = meta['data']
+    if meta['kind'] == '2d':
+        for frag, image in zip(data['fragments'], arrays()):
+            frag['image'] = image
+    else:
+        for k, frag in enumerate(data['fragments']):
+            for ext in _MESH_EXTS:
+                frag[f'{ext}_bytes'] = members.get(f'{k:03d}.{ext}')
+    return data
+
+
+def _worker_info():
+    # torch is optional, it is only used to detect DataLoader workers
+    try:
+        from torch.utils.data import get_worker_info
+    except ImportError:
+        return 0, 1
+    info = get_worker_info()
+    if info is None:
+        return 0, 1
+    return info.id, info.num_workers
+
+
+class ShardStream:
+    """
+    Iterate over the samples of tar shards written by `export_shards` with sequential reads only.
+
+    Shards are split among `world_size` ranks and, inside each rank, among data loader workers
+    (detected automatically when running inside a torch DataLoader). With `shuffle=True` the
+    shard order is shuffled with a per-epoch seed and samples go through a shuffle buffer of
+    `buffer_size` samples. Call `set_epoch` at every epoch to get a different order.
+    Every rank and worker needs at least one shard, an error is raised otherwise.
+
+    Samples are returned in the same format as `RePAIRDataset`, with numpy arrays instead of PIL images.
+    """
+
+    def __init__(self,
+                 shards: Union[str, Path, Sequence[Union[str, Path]]],
+                 shuffle: bool = False,
+                 buffer_size: int = 64,
+                 seed: int = 0,
+                 rank: int = 0,
+                 world_size: int = 1) -> None:
+
+        if isinstance(shards, (str, Path)) and Path(shards).is_dir():
+            with open(Path(shards) / INDEX_FILE, 'r') as f:
+                index = json.load(f)
+            shards = [Path(shards) / s['file'] for s in index['shards']]
+        elif isinstance(shards, (str, Path)):
+            shards = [shards]
+
+        self.shards = [Path(s) for s in shards]
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def assigned_shards(self) -> List[Path]:
+        shards = list(self.shards)
+        if self.shuffle:
+            # same order on every rank and worker, so that the split is a partition
+            random.Random(self.seed + self.epoch).shuffle(shards)
+
+        worker_id, num_workers = _worker_info()
+        n = self.world_size * num_workers
+        if len(shards) < n:
+            # some readers would get nothing, and DistributedDataParallel would hang waiting for them
+            raise RuntimeError(f"{len(shards)} shards cannot be split among {self.world_size} ranks with {num_workers} workers each. "
+                               f"Export with a smaller samples_per_shard (at least {n} shards) or use fewer workers.")
+        return shards[self.rank * num_workers + worker_id::n]
+
+    def _iter_shard(self, shard: Path) -> Iterator:
+        key, members = None, {}
+        with tarfile.open(shard, 'r|') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                k, suffix = member.name.split('.', 1)
+                if k != key and key is not None:
+                    yield _decode_sample(key, members)
+                    members = {}
+                key = k
+                members[suffix] = tar.extractfile(member).read()
+        if key is not None:
+            yield _decode_sample(key, members)
+
+    def __iter__(self) -> Iterator:
+        shards = self.assigned_shards()
+
+        if not self.shuffle:
+            for shard in shards:
+                yield from self._iter_shard(shard)
+            return
+
+        worker_id, _ = _worker_info()
+        rng = random.Random(hash((self.seed, self.epoch, self.rank, worker_id)))
+        buffer = []
+        for shard in shards:
+            for sample in self._iter_shard(shard):
+                if len(buffer) < self.buffer_size:
+                    buffer.append(sample)
+                    continue
+                j = rng.randrange(len(buffer))
+                yield buffer[j]
+                buffer[j] = sample
+        rng.shuffle(buffer)
+        yield from buffer
+
+
+def main() -> None:
+
+    argparser = argparse.ArgumentParser(description="Export a RePAIR dataset to tar shards")
+    argparser.add_argument('--dataset_path', type=str, required=True, help="Path to RePAIR dataset root folder")
+    argparser.add_argument('--output_path', type=str, required=True, help="Output folder for the shards")
+    argparser.add_argument('--variant', type=str, default='2D_SOLVED', help="Dataset variant")
+    argparser.add_argument('--version', type=str, default=None, help="Dataset version")
+    argparser.add_argument('--split', type=str, default=None, help="Dataset split")
+    argparser.add_argument('--samples-per-shard', type=int, default=32, help="Samples per shard, leave at least one shard per rank and worker")
+    argparser.add_argument('--no-managed-mode', dest='managed_mode', action='store_false', help='Do not use managed_mode dataset')
+    argparser.add_argument('--unsupervised', dest='supervised_mode', action='store_false', help='Export in unsupervised mode')
+    args = argparser.parse_args()
+
+    dataset = RePAIRDataset(args.dataset_path,
+                            version=args.version,
+                            variant=args.variant,
+                            split=args.split,
+                            managed_mode=args.managed_mode,
+                            supervised_mode=args.supervised_mode and args.variant == '2D_SOLVED')
+
+    export_shards(dataset, args.output_path, samples_per_shard=args.samples_per_shard)
+
+
+if __name__ == "__main__":
+    main()
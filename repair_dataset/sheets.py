@@ -0,0 +1,252 @@
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import argparse
+import math
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from tqdm import tqdm
+
+from .getters.solved2d_getter import getmetadata_2dsolved
+from .png import PNGStreamWriter
+from .reconstruct import TiledSolution, coverage_rows, join_tiles, reduced_size
+
+
+def _bounded_map(executor: ThreadPoolExecutor, fn, items: Iterable, window: int) -> Iterator:
+    # like executor.map, in order, but with at most `window` results pending
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _fit(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    # shrink to fit in `size`, integer reduction first (fast) then resampling
+    scale = min(size[0] / image.width, size[1] / image.height, 1.0)
+    factor = int(1 / scale) if scale > 0 else 1
+    if factor > 1:
+        image = image.reduce(factor)
+    target = (max(1, round(image.width * scale * factor)), max(1, round(image.height * scale * factor)))
+    return image.resize(target, Image.BILINEAR) if target != image.size else image
+
+
+class ContactSheetRenderer:
+    """
+    Contact sheets of 2D_SOLVED puzzles: for each puzzle, a cell of `cell_size` with its name, the preview,
+    the solution reassembled from the ground truth, their difference (in red, with its percentage, measured at
+    full resolution as by `evaluate_gt`) and the fragments.
+
+    Solutions are composited tile by tile at full resolution, cells are rendered by `max_workers` threads, at most a few rows ahead of the
+    writer, so the peak memory depends on the cell size and the page (or band) size, not on the dataset.
+    """
+
+    def __init__(self,
+                 cell_size: Tuple[int, int] = (768, 384),
+                 cols: int = 4,
+                 padding: int = 8,
+                 font_size: int = 14,
+                 background: Tuple[int, int, int] = (255, 255, 255),
+                 max_workers: int = 8) -> None:
+        self.cell_size = cell_size
+        self.cols = cols
+        self.padding = padding
+        self.background = background
+        self.max_workers = max_workers
+        self.font = ImageFont.load_default(font_size)
+        # per instance, a cache on the method would keep the renderer alive
+        self._text_sizes = {}
+        self.line_height = self.text_size('Ag')[1] + padding // 2
+
+    def text_size(self, text: str) -> Tuple[int, int]:
+        size = self._text_sizes.get(text)
+        if size is None:
+            left, top, right, bottom = self.font.getbbox(text)
+            size = self._text_sizes[text] = (right - left, bottom)
+        return size
+
+    @property
+    def sheet_width(self) -> int:
+        return self.cols * self.cell_size[0] + (self.cols + 1) * self.padding
+
+    @property
+    def row_height(self) -> int:
+        return self.cell_size[1] + self.padding
+
+    def _solution(self, data: dict, path: Path, size: Tuple[int, int], factor: int) -> Tuple[TiledSolution, List[Image.Image]]:
+        # ground truth solution on the canvas of the preview, as `reassemble_2d`, and the fragment thumbnails
+        # (made when the solution first loads the fragments)
+        thumbnails = {}
+
+        def loader(k: int, image_path: Path):
+            def load() -> Image.Image:
+                image = Image.open(image_path)
+                if image.mode != 'RGBA':
+                    image = image.convert('RGBA')
+                image = image.crop(image.getchannel('A').getbbox())
+                if k not in thumbnails:
+                    thumbnails[k] = _fit(image, (128, 128))
+                return image
+            return load
+
+        loaders, poses = [], []
+        for k, frag in enumerate(data['fragments']):
+            position = frag.get('position_2d', frag.get('pixel_position'))
+            loaders.append(loader(k, path / frag['filename'].replace('.obj', '.png')))
+            poses.append((position[0], position[1], position[2] if len(position) > 2 else 0.0))
+        # tiles are reduced whole, their side must be a multiple of the factor
+        solution = TiledSolution(loaders, poses, size, tile_size=factor * max(1, 512 // factor), crop=False)
+        return solution, [thumbnails[k] for k in range(len(loaders))]
+
+    def _compare(self, solution: TiledSolution, alpha: Image.Image, factor: int) -> Tuple[Image.Image, Image.Image, float]:
+        # solution and difference reduced by `factor`, and the difference in percent, computed at full resolution
+        size = reduced_size(alpha.size, factor)
+        small = Image.new('RGBA', size, (0, 0, 0, 0))
+        diff = Image.new('RGB', size, (255, 255, 255))
+        mismatches, y = 0, 0
+        for row, alphas in coverage_rows(solution, alpha):
+            diff_row = []
+            for box, alpha_a, alpha_b in alphas:
+                a, b = alpha_a > 0, alpha_b > 0
+                tile = np.full(a.shape + (3,), 255, dtype=np.uint8)
+                tile[a & b] = (200, 200, 200)
+                tile[a != b] = (220, 30, 30)
+                mismatches += int(np.count_nonzero(a != b))
+                diff_row.append((box, Image.fromarray(tile)))
+            band = join_tiles(row, 'RGBA', factor)
+            small.paste(band, (0, y))
+            diff.paste(join_tiles(diff_row, 'RGB', factor), (0, y))
+            y += band.height
+        return small, diff, mismatches / (alpha.width * alpha.height) * 100
+
+    def render_cell(self, puzzle_folder: Union[str, Path]) -> Image.Image:
+        """RGB cell of one puzzle."""
+        path = Path(puzzle_folder)
+        data = getmetadata_2dsolved(path)
+        w, h = self.cell_size
+        pad = self.padding
+        cell = Image.new('RGB', (w, h), self.background)
+        draw = ImageDraw.Draw(cell)
+
+        panel_w, panel_h = (w - 2 * pad) // 3, int((h - self.line_height) * 0.6)
+        preview = Image.open(path / 'preview.png')
+        if preview.mode != 'RGBA':
+            preview = preview.convert('RGBA')
+        alpha = preview.getchannel('A')
+        scale = min(panel_w / preview.width, panel_h / preview.height, 1.0)
+        factor = max(1, int(1 / scale))
+        preview = _fit(preview, (panel_w, panel_h))
+
+        # compared at full resolution, only the images are reduced
+        solution, fragments = self._solution(data, path, alpha.size, factor)
+        solution, diff, percent = self._compare(solution, alpha, factor)
+        del alpha
+        if solution.size != preview.size:
+            solution = solution.resize(preview.size, Image.BILINEAR)
+            diff = diff.resize(preview.size, Image.BILINEAR)
+
+        label = f"{path.name}  {len(fragments)} fragments  diff {percent:.2f}%"
+        if self.text_size(label)[0] > w:
+            label = f"{path.name}  diff {percent:.2f}%"
+        draw.text((0, 0), label, fill='black', font=self.font)
+
+        y = self.line_height
+        for k, panel in enumerate([preview, solution, diff]):
+            x = k * (panel_w + pad)
+            if panel.mode == 'RGBA':
+                cell.paste(panel, (x, y), panel)
+            else:
+                cell.paste(panel, (x, y))
+
+        # fragments on a grid filling the rest of the cell, with the largest square thumbnail that fits
+        y += panel_h + pad
+        area_w, area_h = w, h - y
+        n = max(1, len(fragments))
+        side = max(min(area_w, area_h), 1)
+        while side > 4 and math.ceil(n / max(1, area_w // side)) * side > area_h:
+            side -= 1
+        per_row = max(1, area_w // side)
+        for k, frag in enumerate(fragments):
+            thumb = _fit(frag, (side - 2, side - 2))
+            x0, y0 = (k % per_row) * side, y + (k // per_row) * side
+            cell.paste(thumb, (x0, y0), thumb)
+        return cell
+
+    def rows(self, puzzle_folders: Sequence[Union[str, Path]]) -> Iterator[Image.Image]:
+        """Bands of `cols` cells (one sheet row each), rendered in parallel a few rows ahead."""
+        folders = list(puzzle_folders)
+        band = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            cells = _bounded_map(executor, self.render_cell, folders, window=2 * max(self.max_workers, self.cols))
+            for k, cell in enumerate(tqdm(cells, total=len(folders), desc="Rendering contact sheets")):
+                col = k % self.cols
+                if col == 0:
+                    band = Image.new('RGB', (self.sheet_width, self.row_height), self.background)
+                band.paste(cell, (self.padding + col * (self.cell_size[0] + self.padding), self.padding))
+                if col == self.cols - 1 or k == len(folders) - 1:
+                    yield band
+
+    def save_pages(self, puzzle_folders: Sequence[Union[str, Path]], output_dir: Union[str, Path], rows_per_page: int = 8) -> List[Path]:
+        """Sheets of `rows_per_page` x `cols` puzzles, saved as page_0000.png, page_0001.png, ..."""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        folders = list(puzzle_folders)
+        n_rows = math.ceil(len(folders) / self.cols)
+
+        paths = []
+        page = None
+        for r, band in enumerate(self.rows(folders)):
+            if r % rows_per_page == 0:
+                page_rows = min(rows_per_page, n_rows - r)
+                page = Image.new('RGB', (self.sheet_width, page_rows * self.row_height + self.padding), self.background)
+            page.paste(band, (0, (r % rows_per_page) * self.row_height))
+            if r % rows_per_page == rows_per_page - 1 or r == n_rows - 1:
+                paths.append(output_dir / f"page_{len(paths):04d}.png")
+                page.save(paths[-1])
+        return paths
+
+    def save_image(self, puzzle_folders: Sequence[Union[str, Path]], path: Union[str, Path]) -> Path:
+        """All the puzzles in a single PNG, written band by band: only one row of cells is in memory at a time."""
+        folders = list(puzzle_folders)
+        n_rows = math.ceil(len(folders) / self.cols)
+        with PNGStreamWriter(path, self.sheet_width, n_rows * self.row_height + self.padding) as writer:
+            for band in self.rows(folders):
+                writer.write(band)
+            writer.write(Image.new('RGB', (self.sheet_width, self.padding), self.background))
+        return Path(path)
+
+
+def main() -> None:
+
+    from .dataset import RePAIRDataset
+
+    argparser = argparse.ArgumentParser(description="Render contact sheets of the puzzles of a 2D_SOLVED RePAIR dataset")
+    argparser.add_argument('--dataset_path', type=str, required=True, help="Path to RePAIR dataset root folder")
+    argparser.add_argument('--output', type=str, required=True, help="Output folder for pages, or PNG file with --single")
+    argparser.add_argument('--version', type=str, default=None, help="Dataset version")
+    argparser.add_argument('--split', type=str, default=None, help="Dataset split")
+    argparser.add_argument('--cols', type=int, default=4, help="Puzzles per row")
+    argparser.add_argument('--rows-per-page', type=int, default=8, help="Rows of puzzles per page")
+    argparser.add_argument('--single', action='store_true', default=False, help="Write one large image instead of pages")
+    argparser.add_argument('--no-managed-mode', dest='managed_mode', action='store_false', help='Do not use managed_mode dataset')
+    args = argparser.parse_args()
+
+    dataset = RePAIRDataset(args.dataset_path,
+                            version=args.version,
+                            variant='2D_SOLVED',
+                            split=args.split,
+                            managed_mode=args.managed_mode)
+
+    renderer = ContactSheetRenderer(cols=args.cols)
+    if args.single:
+        renderer.save_image(dataset.puzzle_folders_list, args.output)
+    else:
+        renderer.save_pages(dataset.puzzle_folders_list, args.output, args.rows_per_page)
+
+
+if __name__ == "__main__":
+    main()
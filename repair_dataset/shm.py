@@ -0,0 +1,301 @@
+from typing import Dict, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+import argparse
+import atexit
+import os
+import pickle
+import secrets
+import tempfile
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+from .locks import file_lock, pid_alive
+
+SHM_VERSION = 2
+_HEADER = 8  # bytes, length of the pickled manifest
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # attached segments are owned by the server, the resource tracker (possibly shared with the server
+    # process) must not hear about them, or it would unlink them when the client exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        # before Python 3.13 attaching registers the segment too
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class _ClientTable:
+    """Pids of the attached clients, in a shared int64 array guarded by a file lock."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, name: str) -> None:
+        self.shm = shm
+        self.pids = np.ndarray((shm.size // 8,), dtype=np.int64, buffer=shm.buf)
+        self.lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+
+    def add(self, pid: int) -> None:
+        with file_lock(self.lock_path):
+            # slots of dead clients are reused
+            for k, p in enumerate(self.pids):
+                if p == 0 or not pid_alive(int(p)):
+                    self.pids[k] = pid
+                    return
+            raise RuntimeError("Too many clients attached to the shared dataset.")
+
+    def remove(self, pid: int) -> None:
+        with file_lock(self.lock_path):
+            self.pids[self.pids == pid] = 0
+
+    def live(self) -> List[int]:
+        return [int(p) for p in self.pids if p and pid_alive(int(p))]
+
+    def release(self) -> None:
+        # views on the buffer must go before the segment can be closed
+        self.pids = None
+
+
+class SharedDatasetServer:
+    """
+    Decode a supervised 2D_SOLVED `RePAIRDataset` once into shared memory, for the clients of the same node.
+
+    Fragment images are packed as raw arrays into segments of about `segment_bytes`; the metadata (the (x, data)
+    dicts without images, and where every image lives) is pickled in the `name` segment. Clients are
+    `SharedDatasetClient(name)` or `RePAIRDataset(..., shared_memory=name)`. The server tracks the attached
+    clients and unlinks all the segments on `close` (or at exit). Mappings of attached clients stay valid
+    after unlinking, until they detach.
+    """
+
+    def __init__(self, dataset, name: Optional[str] = None, segment_bytes: int = 256 * 2**20, max_clients: int = 1024) -> None:
+        if not (dataset.supervised_mode and dataset.load_images):
+            raise RuntimeError("Only datasets in supervised mode with load_images=True can be shared.")
+        if dataset.apply_random_rotations:
+            raise RuntimeError("Datasets with random rotations cannot be shared, samples would be frozen.")
+
+        self.dataset = dataset
+        self.name = name or f"repair_{secrets.token_hex(4)}"
+        self.segment_bytes = segment_bytes
+        self.max_clients = max_clients
+        self._segments: List[shared_memory.SharedMemory] = []
+        self._clients = None
+        self._closed = True
+
+    def __enter__(self) -> 'SharedDatasetServer':
+        # `RePAIRDataset.serve` returns a started server
+        return self.start() if self._closed else self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _flush(self, pending: List[Tuple[str, list, list]], puzzles: Dict[str, dict]) -> None:
+        size = sum(a.nbytes for _, _, arrays in pending for a in arrays)
+        segment = shared_memory.SharedMemory(name=f"{self.name}_{len(self._segments)}", create=True, size=max(size, 1))
+        self._segments.append(segment)
+
+        offset = 0
+        for puzzle_name, meta, arrays in pending:
+            placement = []
+            for a in arrays:
+                np.ndarray(a.shape, dtype=a.dtype, buffer=segment.buf, offset=offset)[...] = a
+                placement.append((offset, a.shape, a.dtype.str))
+                offset += a.nbytes
+            puzzles[puzzle_name] = {'segment': segment.name, 'arrays': placement, 'x': meta[0], 'data': meta[1]}
+
+    def start(self, max_workers: int = 8) -> 'SharedDatasetServer':
+        """Decode all the puzzles of the dataset in parallel and publish them."""
+        self._closed = False
+        atexit.register(self.close)
+
+        names = [p.name for p in self.dataset.puzzle_folders_list]
+        puzzles: Dict[str, dict] = {}
+        pending, pending_bytes = [], 0
+
+        def load(name):
+            x, data = self.dataset[name]
+            fragments, arrays = [], []
+            for frag in x['fragments']:
+                frag = dict(frag)
+                arrays.append(np.ascontiguousarray(np.asarray(frag.pop('image'))))
+                fragments.append(frag)
+            return name, (dict(x, fragments=fragments), data), arrays
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for item in tqdm(executor.map(load, names), total=len(names), desc="Publishing dataset in shared memory"):
+                pending.append(item)
+                pending_bytes += sum(a.nbytes for a in item[2])
+                if pending_bytes >= self.segment_bytes:
+                    self._flush(pending, puzzles)
+                    pending, pending_bytes = [], 0
+        if pending:
+            self._flush(pending, puzzles)
+
+        manifest = pickle.dumps({
+            'version': SHM_VERSION,
+            'variant_version': str(self.dataset.variant_version),
+            # everything that changes a sample, clients must match it
+            'options': self.dataset.sample_options(),
+            'names': names,
+            'puzzles': puzzles,
+        })
+        header = shared_memory.SharedMemory(name=self.name, create=True, size=_HEADER + len(manifest))
+        header.buf[:_HEADER] = len(manifest).to_bytes(_HEADER, 'little')
+        header.buf[_HEADER:_HEADER + len(manifest)] = manifest
+        self._segments.append(header)
+
+        table = shared_memory.SharedMemory(name=f"{self.name}_clients", create=True, size=8 * self.max_clients)
+        self._segments.append(table)
+        self._clients = _ClientTable(table, self.name)
+        self._clients.pids[:] = 0
+        return self
+
+    def clients(self) -> List[int]:
+        """Pids of the live attached clients."""
+        return [] if self._clients is None else self._clients.live()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(s.size for s in self._segments)
+
+    def close(self, wait: float = 0.0) -> None:
+        """Unlink all the segments, after waiting up to `wait` seconds for the clients to detach."""
+        if self._closed:
+            return
+        deadline = time.monotonic() + wait
+        while self.clients() and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        self._closed = True
+        if self._clients is not None:
+            self._clients.release()
+            try:
+                os.remove(self._clients.lock_path)
+            except FileNotFoundError:
+                pass
+            self._clients = None
+        for segment in self._segments:
+            segment.close()
+            if os.name == 'posix':
+                # clients sharing our resource tracker unregister the segments they attach
+                resource_tracker.register(segment._name, 'shared_memory')
+            segment.unlink()
+        self._segments = []
+        atexit.unregister(self.close)
+
+
+class SharedDatasetClient:
+    """
+    Read-only view on a dataset published by a `SharedDatasetServer`.
+
+    Samples are (x, data) tuples as returned by `RePAIRDataset` in supervised mode, with fragment images as
+    read-only NumPy views on the shared memory (no copy, no decode).
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        try:
+            header = _attach(name)
+        except FileNotFoundError:
+            raise RuntimeError(f"No shared dataset named {name}, is the server running?")
+        length = int.from_bytes(bytes(header.buf[:_HEADER]), 'little')
+        self.manifest = pickle.loads(bytes(header.buf[_HEADER:_HEADER + length]))
+        header.close()
+        if self.manifest.get('version') != SHM_VERSION:
+            raise RuntimeError(f"Shared dataset {name} was published by an incompatible version.")
+
+        self.names = self.manifest['names']
+        self._segments: Dict[str, shared_memory.SharedMemory] = {}
+        self._clients = _ClientTable(_attach(f"{name}_clients"), name)
+        self._clients.add(os.getpid())
+        self._pid = os.getpid()
+        self._closed = False
+        atexit.register(self.close)
+
+    @property
+    def variant_version(self) -> str:
+        return self.manifest['variant_version']
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.manifest['puzzles']
+
+    def _segment(self, name: str) -> shared_memory.SharedMemory:
+        segment = self._segments.get(name)
+        if segment is None:
+            segment = self._segments[name] = _attach(name)
+        return segment
+
+    def __getitem__(self, key: Union[int, str]) -> tuple:
+        name = self.names[key] if isinstance(key, int) else key
+        entry = self.manifest['puzzles'][name]
+        segment = self._segment(entry['segment'])
+
+        fragments = []
+        for frag, (offset, shape, dtype) in zip(entry['x']['fragments'], entry['arrays']):
+            image = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf, offset=offset)
+            image.flags.writeable = False
+            fragments.append(dict(frag, image=image))
+
+        # metadata is copied, callers may modify it as with a regular dataset
+        x = dict(entry['x'], fragments=fragments)
+        data = pickle.loads(pickle.dumps(entry['data']))
+        return x, data
+
+    def close(self) -> None:
+        """Detach from the server. Views returned so far must not be used after this."""
+        if self._closed:
+            return
+        self._closed = True
+        if os.getpid() == self._pid:
+            self._clients.remove(self._pid)
+        self._clients.release()
+        self._clients.shm.close()
+        for segment in self._segments.values():
+            try:
+                segment.close()
+            except BufferError:
+                # views still alive, the mapping goes away with the process
+                pass
+        self._segments = {}
+        atexit.unregister(self.close)
+
+
+def main() -> None:
+
+    from .dataset import RePAIRDataset
+
+    argparser = argparse.ArgumentParser(description="Serve a decoded RePAIR dataset from shared memory")
+    argparser.add_argument('--dataset_path', type=str, required=True, help="Path to RePAIR dataset root folder")
+    argparser.add_argument('--name', type=str, required=True, help="Name of the shared memory dataset, used by the clients")
+    argparser.add_argument('--version', type=str, default=None, help="Dataset version")
+    argparser.add_argument('--split', type=str, default=None, help="Dataset split")
+    argparser.add_argument('--channels', type=str, default='rgba', help="Fragment channels: rgba, alpha or mask")
+    argparser.add_argument('--no-managed-mode', dest='managed_mode', action='store_false', help='Do not use managed_mode dataset')
+    args = argparser.parse_args()
+
+    dataset = RePAIRDataset(args.dataset_path,
+                            version=args.version,
+                            variant='2D_SOLVED',
+                            split=args.split,
+                            managed_mode=args.managed_mode,
+                            supervised_mode=True,
+                            channels=args.channels)
+
+    with SharedDatasetServer(dataset, name=args.name) as server:
+        print(f"Serving {len(dataset)} puzzles ({server.nbytes / 2**20:.1f} MB) as '{server.name}', Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
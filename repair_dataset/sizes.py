@@ -0,0 +1,158 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import json
+import math
+import os
+import struct
+import threading
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from .utils import alpha_channel, _center_and_pad_placement
+
+INDEX_VERSION = 2
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def image_size(path: Union[str, Path]) -> Tuple[int, int]:
+    """(w, h) of an image from its header, without decoding it."""
+    with open(path, 'rb') as f:
+        head = f.read(24)
+    if head[:8] == _PNG_SIGNATURE and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    # other formats: PIL only parses the header on open
+    with Image.open(path) as image:
+        return image.size
+
+
+def padded_size_bound(w: int, h: int) -> int:
+    """Upper bound of the side of the centered and padded fragment of a (w, h) image: the centroid is inside it."""
+    return 2 * math.ceil(math.hypot(w - 1, h - 1)) + 1
+
+
+def alpha_bbox(path: Union[str, Path]) -> Optional[Tuple[int, int, int, int]]:
+    """Bbox of the non transparent pixels of an image (None if empty). Decodes the image."""
+    with Image.open(path) as image:
+        return alpha_channel(image).getbbox()
+
+
+def padded_size(path: Union[str, Path]) -> int:
+    """Exact side of the centered and padded fragment, as returned in supervised mode. Decodes the image."""
+    with Image.open(path) as image:
+        return _center_and_pad_placement(alpha_channel(image))[1]
+
+
+def _stamp(path: Union[str, Path]) -> List[int]:
+    st = Path(path).stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+class SizeIndex:
+    """
+    Per-fragment sizes of the puzzles of a 2D_SOLVED dataset, read from the image headers.
+
+    For every fragment: source `width` and `height`, file `bytes` and `padded`, the side of the centered and
+    padded image. `padded` is an upper bound computed from the header, or the exact value if the index was
+    built with `exact=True` (one decode per fragment, then persisted). The header says nothing of full canvas
+    fragments (v2), their bound comes from the `bbox` of the alpha channel, decoded once and persisted too.
+    """
+
+    def __init__(self, puzzles: Dict[str, List[str]], fragments: Dict[str, dict]) -> None:
+        self.puzzles = puzzles
+        self.fragments = fragments
+
+    def __len__(self) -> int:
+        return len(self.puzzles)
+
+    @classmethod
+    def build(cls, puzzles: Dict[str, List[dict]], index_path: Union[str, Path, None] = None,
+              exact: bool = False, max_workers: int = 8) -> 'SizeIndex':
+        """
+        Args:
+            puzzles (dict): puzzle name -> fragment dicts with 'full_name' and 'image_path', in puzzle order, and
+                'full_canvas' (optional, False by default) for the fragments drawn on the whole solution canvas.
+            index_path (str or Path, optional): JSON file where entries are persisted, only changed files are read again.
+            exact (bool): compute the exact padded sizes instead of the header bound.
+        """
+        stored = {}
+        if index_path is not None and Path(index_path).exists():
+            with open(index_path, 'r') as f:
+                content = json.load(f)
+            if content.get('version') == INDEX_VERSION:
+                stored = content['fragments']
+
+        entries, todo = {}, []
+        for frags in puzzles.values():
+            for frag in frags:
+                entry = stored.get(frag['full_name'])
+                stamp = _stamp(frag['image_path'])
+                full_canvas = frag.get('full_canvas', False)
+                if (entry is not None and entry['stamp'] == stamp and (entry['exact'] or not exact)
+                        and (entry['exact'] or entry['bbox'] is not None or not full_canvas)):
+                    entries[frag['full_name']] = entry
+                else:
+                    todo.append((frag, stamp))
+
+        def measure(item):
+            frag, stamp = item
+            w, h = image_size(frag['image_path'])
+            bbox = None
+            if exact:
+                padded = padded_size(frag['image_path'])
+            elif frag.get('full_canvas', False):
+                bbox = alpha_bbox(frag['image_path']) or (0, 0, 1, 1)
+                padded = padded_size_bound(bbox[2] - bbox[0], bbox[3] - bbox[1])
+            else:
+                padded = padded_size_bound(w, h)
+            return {'stamp': stamp, 'width': w, 'height': h, 'bytes': stamp[0], 'padded': padded, 'exact': exact,
+                    'bbox': None if bbox is None else list(bbox)}
+
+        if len(todo) > 0:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                measured = list(tqdm(executor.map(measure, todo), total=len(todo), desc="Reading fragment sizes"))
+            for (frag, _), entry in zip(todo, measured):
+                entries[frag['full_name']] = entry
+
+            if index_path is not None:
+                stored.update(entries)
+                index_path = Path(index_path)
+                index_path.parent.mkdir(parents=True, exist_ok=True)
+                # datasets of several processes may build the index at the same time
+                tmp = index_path.with_name(f"{index_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                with open(tmp, 'w') as f:
+                    json.dump({'version': INDEX_VERSION, 'fragments': stored}, f)
+                tmp.replace(index_path)
+
+        return cls({name: [frag['full_name'] for frag in frags] for name, frags in puzzles.items()}, entries)
+
+    def puzzle_table(self, names: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Per-puzzle arrays, in the order of `names` (all the puzzles by default): 'n_fragments', 'max_padded',
+        'padded_pixels' (sum of the padded areas), 'pixels' (decoded source pixels) and 'bytes' (file bytes).
+        """
+        names = list(self.puzzles) if names is None else list(names)
+        table = {k: np.zeros(len(names), dtype=np.int64) for k in ['n_fragments', 'max_padded', 'padded_pixels', 'pixels', 'bytes']}
+        for p, name in enumerate(names):
+            frags = [self.fragments[f] for f in self.puzzles[name]]
+            table['n_fragments'][p] = len(frags)
+            table['max_padded'][p] = max((f['padded'] for f in frags), default=0)
+            table['padded_pixels'][p] = sum(f['padded'] ** 2 for f in frags)
+            table['pixels'][p] = sum(f['width'] * f['height'] for f in frags)
+            table['bytes'][p] = sum(f['bytes'] for f in frags)
+        table['names'] = np.array(names, dtype=object)
+        return table
+
+    def fragment_table(self, names: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """Per-fragment arrays of the puzzles `names`: 'full_names', 'padded', 'pixels' and 'bytes'."""
+        names = list(self.puzzles) if names is None else list(names)
+        full_names = [f for name in names for f in self.puzzles[name]]
+        frags = [self.fragments[f] for f in full_names]
+        return {
+            'full_names': np.array(full_names, dtype=object),
+            'padded': np.array([f['padded'] for f in frags], dtype=np.int64),
+            'pixels': np.array([f['width'] * f['height'] for f in frags], dtype=np.int64),
+            'bytes': np.array([f['bytes'] for f in frags], dtype=np.int64),
+        }
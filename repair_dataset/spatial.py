@@ -0,0 +1,243 @@
+from typing import Dict, List, Optional, Tuple, Union
+from pathlib import Path
+from itertools import product
+import os
+import threading
+
+import numpy as np
+
+
+def load_obj_vertices(obj_path: Union[str, Path]) -> np.ndarray:
+    """Read the vertex positions of a Wavefront .obj file as a float64 (n, 3) array."""
+    with open(obj_path, 'r') as f:
+        rows = [line.split()[1:4] for line in f if line.startswith('v ')]
+    if len(rows) == 0:
+        return np.zeros((0, 3), dtype=np.float64)
+    return np.array(rows, dtype=np.float64)
+
+
+def load_obj_mesh(obj_path: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read the vertex positions (float64 (n, 3)) and the triangles (int64 (m, 3), 0-based) of a Wavefront .obj file.
+    Polygons are split in fans, texture and normal indices are dropped.
+    """
+    rows, faces = [], []
+    with open(obj_path, 'r') as f:
+        for line in f:
+            if line.startswith('v '):
+                rows.append(line.split()[1:4])
+            elif line.startswith('f '):
+                # 'v', 'v/vt', 'v//vn' or 'v/vt/vn', negative indices count back from the last vertex
+                idx = [int(tok.split('/', 1)[0]) for tok in line.split()[1:]]
+                idx = [i - 1 if i > 0 else len(rows) + i for i in idx]
+                faces.extend([idx[0], idx[k], idx[k + 1]] for k in range(1, len(idx) - 1))
+
+    vertices = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    faces = np.array(faces, dtype=np.int64).reshape(-1, 3)
+    if len(faces) > 0 and (faces.min() < 0 or faces.max() >= len(vertices)):
+        raise RuntimeError(f"Faces of {obj_path} refer to missing vertices.")
+    return vertices, faces
+
+
+class VoxelIndex:
+    """
+    Voxel hash over a point cloud.
+
+    Points are sorted by the key of the cubic cell they fall in, so every occupied
+    cell is a contiguous run of `points`. Radius queries with r <= cell_size only
+    need to look at the 27 cells around the query point.
+    """
+
+    # offset applied to cell coordinates before packing them in a single int64 key
+    _OFFSET = 1 << 20
+    _BITS = 21
+
+    def __init__(self, points: np.ndarray, cell_size: float) -> None:
+        if cell_size <= 0:
+            raise RuntimeError("cell_size must be positive")
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.cell_size = float(cell_size)
+
+        keys = self._keys(self._cells(points))
+        order = np.argsort(keys, kind='stable')
+
+        self.points = points[order]
+        self.order = order
+        self.keys, self.starts, self.counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+        if len(points) > 0:
+            self.bbox_min = self.points.min(axis=0)
+            self.bbox_max = self.points.max(axis=0)
+        else:
+            self.bbox_min = np.full(3, np.inf)
+            self.bbox_max = np.full(3, -np.inf)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def _cells(self, points: np.ndarray) -> np.ndarray:
+        return np.floor(points / self.cell_size).astype(np.int64)
+
+    @classmethod
+    def _keys(cls, cells: np.ndarray) -> np.ndarray:
+        c = cells + cls._OFFSET
+        if np.any(c < 0) or np.any(c >= (1 << cls._BITS)):
+            raise RuntimeError("Point cloud too large for the selected cell_size")
+        return (c[:, 0] << (2 * cls._BITS)) | (c[:, 1] << cls._BITS) | c[:, 2]
+
+    def query_pairs(self, query: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return all the (query_idx, point_idx) pairs closer than `radius`.
+
+        Indices in `point_idx` refer to the original (unsorted) order of the points.
+        """
+        if radius > self.cell_size:
+            raise RuntimeError(f"radius {radius} larger than cell_size {self.cell_size}")
+
+        query = np.asarray(query, dtype=np.float64).reshape(-1, 3)
+        if len(query) == 0 or len(self.points) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        q_cells = self._cells(query)
+        r2 = radius * radius
+
+        q_out, p_out = [], []
+        for offset in product((-1, 0, 1), repeat=3):
+            keys = self._keys(q_cells + np.array(offset, dtype=np.int64))
+            pos = np.searchsorted(self.keys, keys)
+            pos = np.minimum(pos, len(self.keys) - 1)
+            hit = self.keys[pos] == keys
+            if not np.any(hit):
+                continue
+
+            q_idx = np.nonzero(hit)[0]
+            starts = self.starts[pos[hit]]
+            counts = self.counts[pos[hit]]
+
+            # expand every (query point, cell) into the points of that cell
+            q_rep = np.repeat(q_idx, counts)
+            run_start = np.repeat(np.cumsum(counts) - counts, counts)
+            p_rep = np.repeat(starts, counts) + np.arange(counts.sum()) - run_start
+
+            d = self.points[p_rep] - query[q_rep]
+            close = np.einsum('ij,ij->i', d, d) <= r2
+            q_out.append(q_rep[close])
+            p_out.append(p_rep[close])
+
+        if len(q_out) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        return np.concatenate(q_out), self.order[np.concatenate(p_out)]
+
+    def save(self, path: Union[str, Path], **extra) -> None:
+        np.savez(path,
+                 points=self.points,
+                 order=self.order,
+                 cell_size=self.cell_size,
+                 **extra)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'VoxelIndex':
+        with np.load(path) as npz:
+            points = npz['points']
+            order = npz['order']
+            cell_size = float(npz['cell_size'])
+        # points are stored already sorted, so rebuilding the index is a single pass
+        index = cls(points, cell_size)
+        index.order = order[index.order]
+        return index
+
+
+def _source_stamp(path: Path) -> np.ndarray:
+    st = path.stat()
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def fragment_index(obj_path: Union[str, Path], cell_size: float, cache_dir: Union[str, Path, None] = None) -> VoxelIndex:
+    """
+    Build (or load from `cache_dir`) the voxel index of a fragment mesh.
+
+    Cached indexes are keyed by the exact cell size and invalidated when the .obj changes.
+    """
+    obj_path = Path(obj_path)
+    cell_size = float(cell_size)
+
+    cache_file = None
+    if cache_dir is not None:
+        # repr round trips, close cell sizes never share a file
+        cache_file = Path(cache_dir) / f"{obj_path.stem}.vox_{cell_size!r}.npz"
+        if cache_file.exists():
+            with np.load(cache_file) as npz:
+                valid = np.array_equal(npz['stamp'], _source_stamp(obj_path)) and float(npz['cell_size']) == cell_size
+            if valid:
+                return VoxelIndex.load(cache_file)
+
+    index = VoxelIndex(load_obj_vertices(obj_path), cell_size)
+
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_name(f"{cache_file.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        index.save(tmp, stamp=_source_stamp(obj_path))
+        tmp.replace(cache_file)
+
+    return index
+
+
+def find_contacts(fragments: List[dict],
+                  threshold: float,
+                  cache_dir: Union[str, Path, None] = None,
+                  indexes: Optional[Dict[str, VoxelIndex]] = None) -> List[dict]:
+    """
+    Find the fragments touching each other in the solved pose.
+
+    Args:
+        fragments (list of dict): fragments as returned by `getitem_3dsolved`, each with 'name' and 'obj'.
+        threshold (float): maximum vertex distance for two surfaces to be in contact.
+        cache_dir (str or Path, optional): where to cache the per-fragment indexes.
+        indexes (dict, optional): already built indexes by fragment name, with cell_size >= threshold.
+
+    Returns:
+        list of dict: one entry per contacting pair, with the fragment names in 'pair' and the
+        vertex indices of the contact surfaces in 'points_a' and 'points_b'.
+    """
+    if indexes is None:
+        indexes = {}
+    for frag in fragments:
+        if frag['name'] not in indexes:
+            indexes[frag['name']] = fragment_index(frag['obj'], threshold, cache_dir)
+
+    names = [frag['name'] for frag in fragments]
+    if len(names) < 2:
+        return []
+
+    # bounding box prefilter, only overlapping (up to the threshold) boxes can be in contact
+    lo = np.stack([indexes[n].bbox_min for n in names]) - threshold
+    hi = np.stack([indexes[n].bbox_max for n in names]) + threshold
+    overlap = np.all((lo[:, None, :] <= hi[None, :, :]) & (lo[None, :, :] <= hi[:, None, :]), axis=-1)
+    ii, jj = np.nonzero(np.triu(overlap, k=1))
+
+    contacts = []
+    for i, j in zip(ii, jj):
+        index_a, index_b = indexes[names[i]], indexes[names[j]]
+
+        # query the smaller cloud against the larger index
+        if len(index_a) <= len(index_b):
+            q, p = index_b.query_pairs(index_a.points, threshold)
+            idx_a, idx_b = index_a.order[q], p
+        else:
+            q, p = index_a.query_pairs(index_b.points, threshold)
+            idx_a, idx_b = p, index_b.order[q]
+
+        if len(idx_a) == 0:
+            continue
+
+        contacts.append({
+            'pair': (names[i], names[j]),
+            'points_a': np.unique(idx_a),
+            'points_b': np.unique(idx_b),
+        })
+
+    return contacts
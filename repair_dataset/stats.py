@@ -0,0 +1,172 @@
+from typing import Callable, Dict, Optional
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import json
+import threading
+import time
+
+
+class SampleStats:
+    """Timings and counters of a single sample load. Created by `LoadStats.begin_sample`."""
+
+    __slots__ = ('name', 'stages', 'bytes_read', 'pixels', 'image_bytes', '_t0', '_parent')
+
+    def __init__(self, name: str, parent: Optional['LoadStats'] = None) -> None:
+        self.name = name
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.bytes_read = 0
+        self.pixels = 0
+        self.image_bytes = 0
+        self._parent = parent
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - t0
+
+    def add_read(self, n_bytes: int) -> None:
+        self.bytes_read += n_bytes
+
+    def add_decoded(self, image) -> None:
+        self.pixels += image.width * image.height
+
+    def add_output(self, image) -> None:
+        # memory held by the sample, bands are 8 bit in all the modes we produce
+        if hasattr(image, 'nbytes'):
+            self.image_bytes += image.nbytes
+        else:
+            self.image_bytes += image.width * image.height * len(image.getbands())
+
+    def end(self) -> dict:
+        record = {
+            'name': self.name,
+            'total_s': time.perf_counter() - self._t0,
+            'stages_s': dict(self.stages),
+            'bytes_read': self.bytes_read,
+            'pixels_decoded': self.pixels,
+            'image_bytes': self.image_bytes,
+        }
+        if self._parent is not None:
+            self._parent._add(record)
+        return record
+
+
+class _NullSampleStats:
+    """Stand-in used when stats are disabled, every call is a no-op."""
+
+    __slots__ = ()
+
+    _ctx = nullcontext()
+
+    def stage(self, name: str):
+        return self._ctx
+
+    def add_read(self, n_bytes: int) -> None:
+        pass
+
+    def add_decoded(self, image) -> None:
+        pass
+
+    def add_output(self, image) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NULL_SAMPLE_STATS = _NullSampleStats()
+
+
+class LoadStats:
+    """
+    Aggregated per-stage statistics of the samples loaded by a `RePAIRDataset`.
+
+    Stages of the 2D_SOLVED loader are 'read_json', 'read_image' (filesystem), 'decode' (PNG decode),
+    'convert' (conversion to RGBA, or alpha plane extraction), 'center_pad', 'rotate' and 'contour'.
+    'image_bytes' is the size of the images returned by the samples, summed and as the largest sample
+    ('max_sample_image_bytes'); it is not the memory of the process, which also holds decode buffers.
+    """
+
+    def __init__(self, callback: Optional[Callable[[dict], None]] = None) -> None:
+        self.callback = callback
+        # samples may end in several threads (e.g. the async API)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.samples = 0
+        self.total_s = 0.0
+        self.stages_s: Dict[str, float] = defaultdict(float)
+        self.bytes_read = 0
+        self.pixels_decoded = 0
+        self.image_bytes = 0
+        self.max_sample_image_bytes = 0
+
+    def begin_sample(self, name: str) -> SampleStats:
+        return SampleStats(name, self)
+
+    def _add(self, record: dict) -> None:
+        with self._lock:
+            self.samples += 1
+            self.total_s += record['total_s']
+            for stage, t in record['stages_s'].items():
+                self.stages_s[stage] += t
+            self.bytes_read += record['bytes_read']
+            self.pixels_decoded += record['pixels_decoded']
+            self.image_bytes += record['image_bytes']
+            self.max_sample_image_bytes = max(self.max_sample_image_bytes, record['image_bytes'])
+
+        if self.callback is not None:
+            self.callback(record)
+
+    def to_dict(self) -> dict:
+        n = max(self.samples, 1)
+        return {
+            'samples': self.samples,
+            'total_s': self.total_s,
+            'mean_sample_s': self.total_s / n,
+            'stages_s': dict(self.stages_s),
+            'mean_stages_s': {k: v / n for k, v in self.stages_s.items()},
+            'bytes_read': self.bytes_read,
+            'pixels_decoded': self.pixels_decoded,
+            'image_bytes': self.image_bytes,
+            'max_sample_image_bytes': self.max_sample_image_bytes,
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix: str = 'repair_dataset', labels: Optional[Dict[str, str]] = None) -> str:
+        """Prometheus text exposition format, ready for a textfile collector or a /metrics endpoint."""
+
+        def fmt(extra: Optional[Dict[str, str]] = None) -> str:
+            all_labels = dict(labels or {})
+            all_labels.update(extra or {})
+            if not all_labels:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in sorted(all_labels.items())) + '}'
+
+        lines = [
+            f'# TYPE {prefix}_samples_total counter',
+            f'{prefix}_samples_total{fmt()} {self.samples}',
+            f'# TYPE {prefix}_load_seconds_total counter',
+            f'{prefix}_load_seconds_total{fmt()} {self.total_s}',
+            f'# TYPE {prefix}_stage_seconds_total counter',
+        ]
+        for stage, t in sorted(self.stages_s.items()):
+            lines.append(f'{prefix}_stage_seconds_total{fmt({"stage": stage})} {t}')
+        lines += [
+            f'# TYPE {prefix}_read_bytes_total counter',
+            f'{prefix}_read_bytes_total{fmt()} {self.bytes_read}',
+            f'# TYPE {prefix}_decoded_pixels_total counter',
+            f'{prefix}_decoded_pixels_total{fmt()} {self.pixels_decoded}',
+            f'# TYPE {prefix}_image_bytes_total counter',
+            f'{prefix}_image_bytes_total{fmt()} {self.image_bytes}',
+            f'# TYPE {prefix}_max_sample_image_bytes gauge',
+            f'{prefix}_max_sample_image_bytes{fmt()} {self.max_sample_image_bytes}',
+        ]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,222 @@
+from typing import List, Optional, Sequence, Tuple, Union
+from pathlib import Path
+import argparse
+import json
+import math
+import re
+
+import numpy as np
+from PIL import Image
+
+from .splits.splits import train_split, test_split
+from .utils import centroid_rgba
+
+# puzzles whose v2 positions have y flipped in the Zenodo archive, fixed by patch_2ds_v2_0_1
+FLIPPED_V2_PUZZLES = (
+    'puzzle_0000031_RP_group_30',
+    'puzzle_0000062_RP_group_61',
+    'puzzle_0000059_RP_group_58',
+)
+
+
+def _voronoi_labels(size: Tuple[int, int], n: int, rng: np.random.Generator) -> np.ndarray:
+    w, h = size
+    seeds = rng.uniform((0, 0), (w, h), size=(n, 2))
+
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    # wobbly boundaries, so that fragments do not have straight edges
+    amp = 0.04 * min(w, h)
+    phase = rng.uniform(0, 2 * np.pi, size=4)
+    xs_ = xs + amp * np.sin(ys / (0.11 * h) + phase[0]) + 0.5 * amp * np.sin(ys / (0.04 * h) + phase[1])
+    ys_ = ys + amp * np.sin(xs / (0.13 * w) + phase[2]) + 0.5 * amp * np.sin(xs / (0.05 * w) + phase[3])
+
+    labels = np.zeros((h, w), dtype=np.int32)
+    best = np.full((h, w), np.inf, dtype=np.float32)
+    for i, (sx, sy) in enumerate(seeds):
+        d = (xs_ - sx) ** 2 + (ys_ - sy) ** 2
+        closer = d < best
+        labels[closer] = i
+        best[closer] = d[closer]
+
+    # round silhouette, as for a broken fresco
+    r = ((xs - w / 2) / (w / 2)) ** 2 + ((ys - h / 2) / (h / 2)) ** 2
+    labels[r > 1.0] = -1
+
+    return labels
+
+
+def _texture(size: Tuple[int, int], rng: np.random.Generator) -> np.ndarray:
+    w, h = size
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    base = rng.uniform(60, 200, size=3)
+    grad = rng.uniform(-60, 60, size=(2, 3))
+    rgb = base + xs[..., None] / w * grad[0] + ys[..., None] / h * grad[1]
+    rgb += rng.normal(0, 12, size=(h, w, 3))
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def _adjacency(labels: np.ndarray) -> List[List[int]]:
+    pairs = set()
+    for a, b in [(labels[:, :-1], labels[:, 1:]), (labels[:-1, :], labels[1:, :])]:
+        edge = (a != b) & (a >= 0) & (b >= 0)
+        for i, j in zip(a[edge], b[edge]):
+            pairs.add((int(min(i, j)), int(max(i, j))))
+    return [list(p) for p in sorted(pairs)]
+
+
+def default_puzzle_names(n: int) -> List[str]:
+    """First `n` real puzzle names, so that splits and per-puzzle patches apply to the synthetic data."""
+    names = sorted(train_split + test_split)
+    if n > len(names):
+        names += [f"puzzle_{i:07d}_RP_group_{i}" for i in range(1000, 1000 + n - len(names))]
+    return names[:n]
+
+
+def make_puzzle(puzzle_folder: Union[str, Path],
+                n_fragments: int,
+                fragment_size: int,
+                metadata_version: int = 2,
+                seed: Optional[int] = None) -> None:
+    """Write a single procedurally generated puzzle folder in the RePAIR 2D_SOLVED layout."""
+
+    rng = np.random.default_rng(seed)
+    puzzle_folder = Path(puzzle_folder)
+    puzzle_folder.mkdir(parents=True, exist_ok=True)
+
+    side = int(fragment_size * math.sqrt(n_fragments))
+    size = (side + int(rng.integers(0, side // 4 + 1)), side)
+
+    labels = _voronoi_labels(size, n_fragments, rng)
+    rgb = _texture(size, rng)
+
+    alpha = np.where(labels >= 0, 255, 0).astype(np.uint8)
+    preview = Image.fromarray(np.dstack([rgb, alpha]), mode='RGBA')
+    preview.save(puzzle_folder / 'preview.png')
+
+    adjacency = _adjacency(labels)
+
+    # adjacency preview: just the fragment labels
+    palette = rng.integers(0, 255, size=(n_fragments + 1, 3), dtype=np.uint8)
+    palette[-1] = 255
+    Image.fromarray(palette[labels], mode='RGB').save(puzzle_folder / 'adjacency_preview.png')
+
+    fragments = []
+    for i in range(n_fragments):
+        frag_alpha = np.where(labels == i, 255, 0).astype(np.uint8)
+        if not frag_alpha.any():
+            continue
+
+        name = f"RPf_{i:05d}"
+        img = Image.fromarray(np.dstack([rgb, frag_alpha]), mode='RGBA')
+        x, y = centroid_rgba(img)
+
+        if metadata_version == 2:
+            img.save(puzzle_folder / f"{name}.png")
+            # as in the archive, so that the v2.0.1 patch has something to fix
+            y_ = size[1] - y if puzzle_folder.name in FLIPPED_V2_PUZZLES else y
+            fragments.append({
+                'idx': i,
+                'filename': f"{name}.obj",
+                'pixel_position': [x, y_, 0.0],
+                'position': [x, y_, 0.0],
+                'tol_angle': 0.0,
+            })
+        else:
+            img.crop(img.split()[-1].getbbox()).save(puzzle_folder / f"{name}.png")
+            fragments.append({
+                'name': name,
+                'idx': i,
+                'filename': f"{name}.png",
+                'position_2d': [x, y, 0.0],
+            })
+
+    # adjacency refers to positions in the fragment list, empty Voronoi cells are skipped
+    position = {frag['idx']: k for k, frag in enumerate(fragments)}
+    adjacency = [[position[a], position[b]] for a, b in adjacency]
+
+    if metadata_version == 2:
+        data = {
+            'transform': np.eye(3).tolist(),
+            'fragments': fragments,
+            'adjacency': adjacency,
+        }
+    else:
+        data = {
+            'name': puzzle_folder.name,
+            'metadata_version': 3,
+            'fragments': fragments,
+            'solution_size': size,
+            'adjacency': adjacency,
+        }
+
+    with open(puzzle_folder / 'data.json', 'w') as f:
+        json.dump(data, f, indent=4)
+
+
+def make_synthetic_dataset(data_path: Union[str, Path],
+                           n_puzzles: int = 8,
+                           n_fragments: Union[int, Tuple[int, int]] = (4, 12),
+                           fragment_size: Union[int, Tuple[int, int]] = (64, 160),
+                           metadata_version: int = 2,
+                           names: Optional[Sequence[str]] = None,
+                           seed: int = 0) -> Path:
+    """
+    Write a procedurally generated 2D_SOLVED dataset with the same on-disk layout as the real one.
+
+    Args:
+        data_path (str or Path): output folder, puzzle folders are created directly inside it.
+        n_puzzles (int): number of puzzles, ignored if `names` is given.
+        n_fragments (int or tuple): fragments per puzzle, or a (min, max) range.
+        fragment_size (int or tuple): approximate fragment side in pixels, or a (min, max) range.
+        metadata_version (int): 2 writes the Zenodo layout ('pixel_position', '.obj' filenames,
+            full canvas fragments, y flipped in the `FLIPPED_V2_PUZZLES`), 3 writes the v3 layout
+            (cropped fragments, centroid 'position_2d').
+        names (list of str, optional): puzzle folder names, defaults to the real puzzle names.
+        seed (int): random seed, the same seed always produces the same dataset.
+
+    Returns:
+        Path: the dataset folder.
+    """
+    if metadata_version not in (2, 3):
+        raise ValueError(f"Unsupported metadata version {metadata_version}")
+
+    data_path = Path(data_path)
+    data_path.mkdir(parents=True, exist_ok=True)
+
+    if names is None:
+        names = default_puzzle_names(n_puzzles)
+
+    for k, name in enumerate(names):
+        # puzzles of the same RP group get the same seed, hence the same fragments
+        match = re.search(r'RP_group_(\d+)', name)
+        puzzle_seed = seed * 100003 + (int(match.group(1)) if match else 50000 + k)
+
+        rng = np.random.default_rng(puzzle_seed)
+        n = n_fragments if isinstance(n_fragments, int) else int(rng.integers(n_fragments[0], n_fragments[1] + 1))
+        s = fragment_size if isinstance(fragment_size, int) else int(rng.integers(fragment_size[0], fragment_size[1] + 1))
+        make_puzzle(data_path / name, n, s, metadata_version, seed=puzzle_seed)
+
+    return data_path
+
+
+def main() -> None:
+
+    argparser = argparse.ArgumentParser(description="Generate a synthetic RePAIR 2D_SOLVED dataset")
+    argparser.add_argument('output_path', type=str, help="Output folder")
+    argparser.add_argument('--puzzles', type=int, default=8, help="Number of puzzles")
+    argparser.add_argument('--fragments', type=int, nargs=2, default=(4, 12), help="Min and max fragments per puzzle")
+    argparser.add_argument('--size', type=int, nargs=2, default=(64, 160), help="Min and max fragment size in pixels")
+    argparser.add_argument('--metadata-version', type=int, default=2, choices=[2, 3], help="Metadata version")
+    argparser.add_argument('--seed', type=int, default=0, help="Random seed")
+    args = argparser.parse_args()
+
+    make_synthetic_dataset(args.output_path,
+                           n_puzzles=args.puzzles,
+                           n_fragments=tuple(args.fragments),
+                           fragment_size=tuple(args.size),
+                           metadata_version=args.metadata_version,
+                           seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
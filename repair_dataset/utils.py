@@ -1,10 +1,14 @@
-from typing import Tuple
+from typing import Tuple, Union
+from pathlib import Path
+import io
 import math
 import warnings
 
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+from .stats import NULL_SAMPLE_STATS
+
 def centroid_rgba(img) -> Tuple[float, float]:
     a = np.array(img)[:, :, 3]        # alpha channel
     ys, xs = np.where(a > 0)          # foreground pixels
@@ -14,6 +18,26 @@ def centroid_rgba(img) -> Tuple[float, float]:
     cy = round(ys.mean(),2)
     return cx, cy
 
+def load_image(image_path: Union[str, Path], stats=NULL_SAMPLE_STATS) -> Image.Image:
+    if stats is NULL_SAMPLE_STATS:
+        # no accounting, let PIL read the file itself instead of going through an in-memory copy
+        image = Image.open(image_path)
+        image.load()
+        return image
+
+    # read and decode separately, so that filesystem latency and PNG decode are accounted apart
+    with stats.stage('read_image'):
+        with open(image_path, 'rb') as f:
+            buf = f.read()
+    stats.add_read(len(buf))
+
+    with stats.stage('decode'):
+        image = Image.open(io.BytesIO(buf))
+        image.load()
+    stats.add_decoded(image)
+
+    return image
+
 def concat_pil_img(images, axis=0) -> Image.Image:
     """Concatenate a list of PIL images along the specified axis (0 for vertical, 1 for horizontal)."""
     widths, heights = zip(*(i.size for i in images))
@@ -51,6 +75,8 @@ def create_image_grid(data, grid_size=None, padding=10, font_size=20):
         
     Returns:
         PIL.Image: The resulting grid image.
+
+    The whole grid is held in memory, see `repair_dataset.sheets` for dataset-wide contact sheets.
     """
     
     if not data:
@@ -71,8 +97,9 @@ def create_image_grid(data, grid_size=None, padding=10, font_size=20):
     # Load a default font
     font = ImageFont.load_default()
     
-    # Determine height for text
-    text_height = max(font.getbbox(img_dict['name'])[3] for img_dict in data)
+    # Determine height for text, measuring each name once
+    bboxes = [font.getbbox(img_dict['name']) for img_dict in data]
+    text_height = max(bbox[3] for bbox in bboxes)
     
     # Create a blank canvas
     grid_width = cols * max_width + (cols + 1) * padding
@@ -89,7 +116,7 @@ def create_image_grid(data, grid_size=None, padding=10, font_size=20):
         
         # Draw the name centered above the image
         text = img_dict['name']
-        text_width = font.getbbox(text)[2]
+        text_width = bboxes[idx][2]
         text_x = x + (max_width - text_width) // 2
         text_y = y
         draw.text((text_x, text_y), text, fill="black", font=font)
@@ -100,17 +127,14 @@ def create_image_grid(data, grid_size=None, padding=10, font_size=20):
     
     return grid_image
 
-def center_and_pad_rgba(img: Image.Image) -> Image.Image:
+def _center_and_pad_placement(alpha: Image.Image) -> Tuple[tuple, int, int, int]:
     # --- 1. Tight bbox using PIL ---
-    alpha = img.split()[-1]
     bbox = alpha.getbbox()
     if bbox is None:
         raise ValueError("Empty image")
 
-    cropped = img.crop(bbox)
-
     # --- 2. Get opaque pixel coordinates ---
-    a = np.array(cropped.split()[-1], dtype=np.float32)
+    a = np.array(alpha.crop(bbox), dtype=np.float32)
     ys, xs = np.nonzero(a > 0)
 
     # --- 3. Centroid (alpha-weighted optional) ---
@@ -131,7 +155,39 @@ def center_and_pad_rgba(img: Image.Image) -> Image.Image:
     tx = int(np.floor(C - cx))
     ty = int(np.floor(C - cy))
 
+    return bbox, size, tx, ty
+
+def center_and_pad_rgba(img: Image.Image) -> Image.Image:
+    bbox, size, tx, ty = _center_and_pad_placement(img.split()[-1])
+
+    cropped = img.crop(bbox)
     canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
     canvas.paste(cropped, (tx, ty), cropped)
 
     return canvas
+
+def center_and_pad_alpha(alpha: Image.Image) -> Image.Image:
+    """Same as `center_and_pad_rgba`, on the alpha plane only ('L' image)."""
+    bbox, size, tx, ty = _center_and_pad_placement(alpha)
+
+    cropped = alpha.crop(bbox)
+    canvas = Image.new("L", (size, size), 0)
+    # pasting with itself as mask, as for RGBA, so that the resulting alpha is identical
+    canvas.paste(cropped, (tx, ty), cropped)
+
+    return canvas
+
+def alpha_channel(img: Image.Image) -> Image.Image:
+    """Alpha plane of an image as 'L', converting only when the mode has no alpha band."""
+    if img.mode in ('RGBA', 'LA', 'La', 'RGBa', 'PA'):
+        return img.getchannel('A')
+    return img.convert('RGBA').getchannel('A')
+
+def pack_mask(alpha: Image.Image) -> np.ndarray:
+    """Binary mask (alpha > 0) packed 8 pixels per byte along the rows, shape (h, ceil(w / 8))."""
+    return np.packbits(np.asarray(alpha) > 0, axis=-1)
+
+def unpack_mask(packed: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Inverse of `pack_mask`, `size` is the (w, h) of the original image. Returns a bool array."""
+    w, h = size
+    return np.unpackbits(packed, axis=-1, count=w).astype(bool)[:h]
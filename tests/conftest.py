@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from repair_dataset import RePAIRDataset
+from repair_dataset.synthetic import make_synthetic_dataset
+
+VERSIONS = {2: '2', 3: '3-beta.1'}
+
+
+@pytest.fixture(scope='session', params=[2, 3], ids=['v2', 'v3'])
+def synthetic_root(request, tmp_path_factory):
+    """A small synthetic 2D_SOLVED dataset, in the v2 and v3 layouts."""
+    root = tmp_path_factory.mktemp(f"synthetic_v{request.param}")
+    make_synthetic_dataset(root, n_puzzles=4, n_fragments=(4, 8), fragment_size=(48, 96), metadata_version=request.param)
+    return root, VERSIONS[request.param]
+
+
+@pytest.fixture
+def open_dataset(synthetic_root):
+    """Opens the synthetic dataset (unmanaged) with the given options."""
+    root, version = synthetic_root
+
+    def open_(**kwargs):
+        return RePAIRDataset(root, version=version, variant='2D_SOLVED', managed_mode=False, **kwargs)
+    return open_
+
+
+def write_sphere_obj(path, n_rings, n_segments, center=(0.0, 0.0, 0.0), header=True):
+    """A UV sphere .obj (with its .mtl and .png), optionally with the vertex and face counts in the header."""
+    u = np.linspace(0, np.pi, n_rings)
+    v = np.linspace(0, 2 * np.pi, n_segments, endpoint=False)
+    u, v = np.meshgrid(u, v, indexing='ij')
+    vertices = np.stack([np.sin(u) * np.cos(v), np.sin(u) * np.sin(v), np.cos(u)], axis=-1).reshape(-1, 3) + center
+    faces = []
+    for i in range(n_rings - 1):
+        for j in range(n_segments):
+            a, b = i * n_segments + j, i * n_segments + (j + 1) % n_segments
+            faces += [[a, a + n_segments, b], [b, a + n_segments, b + n_segments]]
+
+    with open(path, 'w') as f:
+        if header:
+            f.write(f"# vertices {len(vertices)}\n# faces {len(faces)}\n")
+        f.write(f"mtllib {path.stem}.mtl\n")
+        f.write(''.join(f"v {x:.6f} {y:.6f} {z:.6f}\n" for x, y, z in vertices))
+        f.write(''.join(f"f {a + 1} {b + 1} {c + 1}\n" for a, b, c in faces))
+    path.with_suffix('.mtl').write_text('newmtl material\n')
+    Image.new('RGB', (4, 4)).save(path.with_suffix('.png'))
+    return len(vertices), len(faces)
+
+
+@pytest.fixture(scope='session')
+def solved3d_root(tmp_path_factory):
+    """A small synthetic 3D_SOLVED dataset, fragments are spheres in a row."""
+    root = tmp_path_factory.mktemp('synthetic_3d')
+    for p in range(2):
+        folder = root / f"puzzle_{p:07d}_RP_group_{p}"
+        folder.mkdir()
+        for k in range(3 + p):
+            write_sphere_obj(folder / f"RPf_{k:05d}.obj", 20 + 10 * k, 30, center=(2.5 * k, 0.0, 0.0), header=k != 1)
+    return root
+
+
+@pytest.fixture
+def open_dataset_3d(solved3d_root):
+    """Opens the synthetic 3D dataset (unmanaged) with the given options."""
+    def open_(**kwargs):
+        return RePAIRDataset(solved3d_root, version='2', variant='3D_SOLVED', managed_mode=False, **kwargs)
+    return open_
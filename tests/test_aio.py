@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+
+def _same_sample(a, b):
+    (x, data), (x2, data2) = a, b
+    assert data == data2 and x['name'] == x2['name']
+    assert all(np.array_equal(np.asarray(f['image']), np.asarray(f2['image']))
+               for f, f2 in zip(x['fragments'], x2['fragments']))
+
+
+def _blocking_loads(dataset):
+    """Replace the loads of `dataset` with ones that wait until stopped, recording the stopped ones."""
+    started, stopped = threading.Event(), []
+
+    def load(key, cancelled=None):
+        started.set()
+        while not cancelled():
+            threading.Event().wait(0.01)
+        stopped.append(key)
+        raise asyncio.CancelledError()
+    dataset._getitem = load
+    return started, stopped
+
+
+def test_aget_matches_getitem(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+
+    async def main():
+        samples = [await dataset.aget(k) for k in range(len(dataset))]
+        by_name = await dataset.aget(samples[0][0]['name'])
+        await dataset.aclose()
+        return samples, by_name
+    samples, by_name = asyncio.run(main())
+    for k, sample in enumerate(samples):
+        _same_sample(sample, dataset[k])
+    _same_sample(by_name, samples[0])
+
+
+def test_concurrent_requests_share_a_load(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+    calls = []
+    getitem = dataset._getitem
+
+    def counted(key, cancelled=None):
+        calls.append(key)
+        return getitem(key, cancelled)
+    dataset._getitem = counted
+
+    async def main():
+        name = dataset.puzzle_folders_list[0].name
+        results = await asyncio.gather(dataset.aget(0), dataset.aget(name), dataset.aget(0))
+        await dataset.aclose()
+        return results
+    first, *others = asyncio.run(main())
+    assert len(calls) == 1 and all(other is first for other in others)
+
+
+@pytest.mark.parametrize('concurrency', [1, 2, 8])
+def test_aiter_in_order(open_dataset, tmp_path, concurrency):
+    dataset = open_dataset(cache_dir=tmp_path)
+    keys = list(range(len(dataset)))[::-1]
+
+    async def main():
+        names = [x['name'] async for x in dataset.aiter(concurrency, keys=keys)]
+        everything = [x['name'] async for x in dataset.aiter(concurrency)]
+        await dataset.aclose()
+        return names, everything
+    names, everything = asyncio.run(main())
+    assert names == [dataset[k]['name'] for k in keys]
+    assert everything == [dataset[k]['name'] for k in range(len(dataset))]
+
+
+def test_aiter_invalid_concurrency(open_dataset, tmp_path):
+    dataset = open_dataset(cache_dir=tmp_path)
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            async for _ in dataset.aiter(0):
+                pass
+        await dataset.aclose()
+    asyncio.run(main())
+
+
+def test_cancellation(open_dataset, tmp_path):
+    dataset = open_dataset(cache_dir=tmp_path, async_workers=2)
+    started, stopped = _blocking_loads(dataset)
+
+    async def main():
+        first = asyncio.ensure_future(dataset.aget(0))
+        second = asyncio.ensure_future(dataset.aget(0))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        # the load goes on while one request still waits for it
+        first.cancel()
+        await asyncio.sleep(0.1)
+        assert not stopped and not second.done()
+        # and stops once the last one is cancelled
+        second.cancel()
+        for _ in range(100):
+            if stopped:
+                break
+            await asyncio.sleep(0.01)
+        await dataset.aclose()
+        return first, second
+    first, second = asyncio.run(main())
+    assert first.cancelled() and second.cancelled() and len(stopped) == 1
+
+
+def test_aclose_stops_the_loads(open_dataset, tmp_path):
+    dataset = open_dataset(cache_dir=tmp_path, async_workers=1)
+    started, stopped = _blocking_loads(dataset)
+
+    async def main():
+        # one running, one queued
+        running = asyncio.ensure_future(dataset.aget(0))
+        queued = asyncio.ensure_future(dataset.aget(1))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        await dataset.aclose()
+        await asyncio.gather(running, queued, return_exceptions=True)
+        return running, queued
+    running, queued = asyncio.run(main())
+    assert running.cancelled() and queued.cancelled()
+    assert len(stopped) == 1 and dataset._async_loader is None
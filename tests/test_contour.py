@@ -0,0 +1,35 @@
+import numpy as np
+
+from repair_dataset.contour import marching_squares, polygon_area
+
+
+def disk(size, center, radius):
+    yy, xx = np.mgrid[:size, :size]
+    return (yy - center[1]) ** 2 + (xx - center[0]) ** 2 < radius ** 2
+
+
+def test_disk_is_one_loop_with_its_area():
+    loops = marching_squares(disk(100, (50, 50), 30) * 255.0)
+    assert len(loops) == 1
+    assert abs(abs(polygon_area(loops[0])) - np.pi * 30 ** 2) / (np.pi * 30 ** 2) < 0.01
+    # vertices lie between pixel centers, on the boundary of the mask
+    r = np.hypot(loops[0][:, 0] - 50, loops[0][:, 1] - 50)
+    assert np.all(np.abs(r - 30) < 1.0)
+
+
+def test_holes_come_after_outer_boundaries_reversed():
+    alpha = (disk(100, (50, 50), 30) & ~disk(100, (50, 50), 10)) * 255.0
+    outer, hole = marching_squares(alpha)
+    assert abs(polygon_area(outer)) > abs(polygon_area(hole))
+    assert np.sign(polygon_area(outer)) == -np.sign(polygon_area(hole))
+
+
+def test_separate_components_and_borders():
+    # touching the image border, the padding closes the loops
+    alpha = np.zeros((40, 60))
+    alpha[:, :10] = 255
+    alpha[10:20, 30:50] = 255
+    loops = marching_squares(alpha)
+    assert len(loops) == 2
+    # the corners are cut by a quarter pixel triangle each
+    assert np.allclose(sorted(abs(polygon_area(l)) for l in loops), [200 - 0.5, 400 - 0.5])
@@ -0,0 +1,67 @@
+import shutil
+
+import numpy as np
+from PIL import Image
+
+from repair_dataset.dedup import DecodedCache, FragmentHashIndex, content_hash
+
+
+def _fragments(root):
+    return [{'full_name': f"{p.parent.name}/{p.stem}", 'image_path': p} for p in sorted(root.glob('*/*.png'))]
+
+
+def test_index(synthetic_root, tmp_path):
+    root, _ = synthetic_root
+    # a puzzle and a copy of it under another name
+    source = sorted(p for p in root.iterdir() if p.is_dir())[0]
+    data = tmp_path / 'data'
+    shutil.copytree(source, data / source.name)
+    shutil.copytree(source, data / 'puzzle_copy')
+
+    path = tmp_path / 'hashes.json'
+    index = FragmentHashIndex.build(_fragments(data), path)
+    assert len(index) == len(_fragments(data))
+    duplicates = index.duplicates()
+    assert len(duplicates) == len(list((data / 'puzzle_copy').glob('*.png')))
+    for digest, names in duplicates.items():
+        assert [n.split('/')[0] for n in names] == [source.name, 'puzzle_copy']
+        assert content_hash(data / f"{names[0]}.png") == digest
+
+    report = index.cross_split_duplicates([source.name], ['puzzle_copy'])
+    assert len(report) == len(duplicates) and all(len(r['a']) == len(r['b']) == 1 for r in report)
+    assert index.cross_split_duplicates([source.name], []) == []
+    assert not any('.tmp' in p.name for p in tmp_path.iterdir())
+
+    # only changed files are hashed again
+    changed = sorted((data / 'puzzle_copy').glob('*.png'))[0]
+    Image.new('RGBA', (3, 3), (1, 2, 3, 255)).save(changed)
+    rebuilt = FragmentHashIndex.build(_fragments(data), path)
+    name = f"puzzle_copy/{changed.stem}"
+    assert rebuilt[name] == content_hash(changed) != index[name]
+    assert len(rebuilt.duplicates()) == len(duplicates) - 1
+
+
+def test_decoded_cache():
+    images = [Image.new('RGBA', (10, 10), (k, 0, 0, 255)) for k in range(5)]
+    cache = DecodedCache(max_bytes=3 * 400)
+    for k, image in enumerate(images[:3]):
+        cache.put(k, image)
+    assert cache.get(0) is images[0]
+    # least recently used first: 1 goes
+    cache.put(3, images[3])
+    assert cache.get(1) is None and cache.get(0) is images[0] and cache.size == 3 * 400
+    # larger than the whole cache, never stored
+    cache.put('big', Image.new('RGBA', (20, 20)))
+    assert cache.get('big') is None
+
+
+def test_memory_cache_returns_copies(open_dataset, tmp_path):
+    expected = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path, memory_cache_mb=64)
+    for _ in range(2):
+        for k in range(len(dataset)):
+            x, _ = dataset[k]
+            for frag, frag2 in zip(x['fragments'], expected[k][0]['fragments']):
+                assert np.array_equal(np.asarray(frag['image']), np.asarray(frag2['image']))
+                # callers may modify what they get
+                frag['image'].paste((255, 0, 255, 255), (0, 0, 4, 4))
@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+import pytest
+
+from repair_dataset.features import FeatureStore
+
+CALLS = []
+
+
+def area(image, frag):
+    return np.array([np.count_nonzero(np.asarray(image.getchannel('A')))], dtype=np.int64)
+
+
+def counted_histogram(image, frag):
+    CALLS.append(frag['full_name'])
+    return np.histogram(np.asarray(image.getchannel('A')), bins=4, range=(0, 256))[0].reshape(2, 2)
+
+
+def test_compute_and_read(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+    dataset.register_feature('area', area, version=1)
+    with pytest.raises(RuntimeError):
+        dataset.feature('area')
+    dataset.compute_features(max_workers=2)
+
+    store = dataset.feature('area')
+    for k in range(len(dataset)):
+        x, _ = dataset[k]
+        for frag in x['fragments']:
+            assert store[frag['full_name']].tolist() == area(frag['image'], frag).tolist()
+    assert not any(p.name.endswith(('.tmp', '.old')) for p in store.path.parent.iterdir())
+
+
+def test_only_changed_fragments_are_computed(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+    dataset.register_feature('histogram', counted_histogram, version='a')
+    CALLS.clear()
+    dataset.compute_features(use_processes=False)
+    n = len(CALLS)
+    assert n == len(dataset.fragment_hashes().groups())
+    assert dataset.feature('histogram')[CALLS[0]].shape == (2, 2)
+
+    dataset.compute_features(use_processes=False)
+    assert len(CALLS) == n
+
+    # a new version does not reuse the stored values
+    dataset.register_feature('histogram', counted_histogram, version='b')
+    dataset.compute_features(use_processes=False)
+    assert len(CALLS) == 2 * n
+
+    # names and versions are folder names
+    dataset.register_feature('histogram', counted_histogram, version='../b')
+    with pytest.raises(RuntimeError):
+        dataset.compute_features(use_processes=False)
+
+
+def test_concurrent_writers(tmp_path):
+    path = tmp_path / 'store'
+    errors = []
+
+    def write(k):
+        try:
+            values = {'h': np.full((3,), k, dtype=np.float32)}
+            FeatureStore.write(path, values, {'frag_a': 'h', 'frag_b': 'h'}, {'feature_version': '1'})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    store = FeatureStore(path)
+    assert store['frag_a'].tolist() == store['frag_b'].tolist()
+    assert store['frag_a'][0] in range(8)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['store', 'store.lock']
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from repair_dataset.fetch import Downloader, fetch_file, is_verified, serve_mirror
+
+PIECE = 64 * 2**10
+
+
+class RecordingSession(requests.Session):
+    """Session listing the byte ranges it requested."""
+
+    def __init__(self):
+        super().__init__()
+        self.ranges = []
+
+    def get(self, url, **kwargs):
+        self.ranges.append(kwargs.get('headers', {}).get('Range'))
+        return super().get(url, **kwargs)
+
+
+@pytest.fixture
+def payload():
+    # not a multiple of the piece size, the last piece is short
+    return bytes(range(256)) * (7 * PIECE // 256) + b'tail'
+
+
+@pytest.fixture
+def mirror(tmp_path, payload):
+    served = tmp_path / 'served'
+    served.mkdir()
+    (served / 'archive.zip').write_bytes(payload)
+    server = serve_mirror(served, host='127.0.0.1', port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def md5(data):
+    return 'md5:' + hashlib.md5(data).hexdigest()
+
+
+def test_parallel_download(tmp_path, mirror, payload):
+    session = RecordingSession()
+    dest = Downloader(connections=4, piece_size=PIECE, session=session).download(f"{mirror}/archive.zip", tmp_path / 'out.zip', md5(payload))
+
+    assert dest.read_bytes() == payload
+    assert not (tmp_path / 'out.zip.part').exists() and not (tmp_path / 'out.zip.part.json').exists()
+    # the probe, then one range request per piece
+    assert len(session.ranges) == 1 + 8
+
+
+def test_resume_downloads_only_missing_pieces(tmp_path, mirror, payload):
+    url = f"{mirror}/archive.zip"
+    dest = tmp_path / 'out.zip'
+    # an interrupted run: pieces 0 and 3 on disk, the rest of the file garbage
+    part = bytearray(b'\xff' * len(payload))
+    for k in (0, 3):
+        part[k * PIECE:(k + 1) * PIECE] = payload[k * PIECE:(k + 1) * PIECE]
+    (tmp_path / 'out.zip.part').write_bytes(bytes(part))
+    (tmp_path / 'out.zip.part.json').write_text(json.dumps({'url': url, 'size': len(payload), 'piece_size': PIECE, 'done': [0, 3]}))
+
+    session = RecordingSession()
+    Downloader(connections=2, piece_size=PIECE, session=session).download(url, dest, md5(payload))
+
+    assert dest.read_bytes() == payload
+    requested = sorted(int(r.split('=')[1].split('-')[0]) // PIECE for r in session.ranges[1:])
+    assert requested == [1, 2, 4, 5, 6, 7]
+
+
+def test_checksum_mismatch(tmp_path, mirror, payload):
+    dest = tmp_path / 'out.zip'
+    with pytest.raises(RuntimeError, match='Checksum mismatch'):
+        Downloader(connections=4, piece_size=PIECE).download(f"{mirror}/archive.zip", dest, md5(b'something else'))
+
+    assert not dest.exists()
+    assert not (tmp_path / 'out.zip.part').exists() and not (tmp_path / 'out.zip.part.json').exists()
+
+
+def test_folder_mirror_is_filled(tmp_path, mirror, payload):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+
+    # missing from the folder mirror: downloaded from the HTTP mirror, then copied into the folder
+    dest = fetch_file('http://127.0.0.1:9/unreachable', 'archive.zip', tmp_path / 'a', checksum=md5(payload),
+                      mirrors=[str(shared), mirror])
+    assert dest.read_bytes() == payload
+    assert (shared / 'archive.zip').read_bytes() == payload
+
+    # the next user copies it from the folder
+    dest = fetch_file('http://127.0.0.1:9/unreachable', 'archive.zip', tmp_path / 'b', checksum=md5(payload),
+                      mirrors=[str(shared)])
+    assert dest.read_bytes() == payload
+
+
+def test_verified_record(tmp_path, mirror, payload):
+    dest = fetch_file(f"{mirror}/archive.zip", 'archive.zip', tmp_path, checksum=md5(payload), mirrors=[])
+    assert is_verified(dest, md5(payload))
+    assert not is_verified(dest, md5(b'other'))
+
+    # a changed file is hashed again, and not trusted
+    dest.write_bytes(b'corrupted')
+    assert not is_verified(dest, md5(payload))
+    fetch_file(f"{mirror}/archive.zip", 'archive.zip', tmp_path, checksum=md5(payload), mirrors=[])
+    assert dest.read_bytes() == payload
+
+
+def test_pieces_out_of_order(tmp_path, mirror, payload):
+    # the first piece arrives last, the others are hashed from disk once it is there
+    class SlowFirstPiece(RecordingSession):
+        def get(self, url, **kwargs):
+            if kwargs.get('headers', {}).get('Range') == f'bytes=0-{PIECE - 1}':
+                time.sleep(0.3)
+            return super().get(url, **kwargs)
+
+    dest = Downloader(connections=4, piece_size=PIECE, session=SlowFirstPiece()).download(
+        f"{mirror}/archive.zip", tmp_path / 'out.zip', md5(payload))
+    assert dest.read_bytes() == payload
+
+
+def test_corrupted_folder_mirror_is_skipped(tmp_path, mirror, payload):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    (shared / 'archive.zip').write_bytes(payload[:-1] + b'!')
+
+    dest = fetch_file(f"{mirror}/archive.zip", 'archive.zip', tmp_path / 'a', checksum=md5(payload), mirrors=[str(shared)])
+    assert dest.read_bytes() == payload
+    assert sorted(p.name for p in (tmp_path / 'a').iterdir()) == ['archive.zip', 'archive.zip.verified.json']
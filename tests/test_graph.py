@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pytest
+
+from repair_dataset.graph import AdjacencyIndex, parse_adjacency
+
+
+def test_parse_adjacency_formats_agree():
+    edges = [[2, 0], [0, 1], [1, 2], [1, 0], [3, 3]]
+    dense = np.zeros((4, 4), dtype=int)
+    for i, j in edges:
+        dense[i, j] = 1
+    as_dict = {'0': [1], '2': [0, 1]}
+
+    expected = ([0, 0, 1], [1, 2, 2])
+    for adjacency in (edges, dense.tolist(), as_dict):
+        i, j = parse_adjacency(adjacency, 4)
+        assert (i.tolist(), j.tolist()) == expected
+
+    with pytest.raises(RuntimeError):
+        parse_adjacency([[0, 4]], 4)
+
+
+def test_csr_matches_the_metadata(open_dataset, tmp_path):
+    dataset = open_dataset()
+    folders = dataset.puzzle_folders_list
+    index = AdjacencyIndex.build(folders, tmp_path / 'adjacency.npz')
+
+    for p, folder in enumerate(folders):
+        with open(folder / 'data.json') as f:
+            data = json.load(f)
+        n = len(data['fragments'])
+        dense = np.zeros((n, n), dtype=bool)
+        for i, j in data['adjacency']:
+            dense[i, j] = dense[j, i] = True
+
+        assert np.array_equal(index.to_dense(p), dense)
+        for i in range(n):
+            assert index.neighbors(folder.name, i).tolist() == np.nonzero(dense[i])[0].tolist()
+        assert index.degrees(p).tolist() == dense.sum(axis=1).tolist()
+    assert index.n_edges == sum(int(index.to_dense(p).sum()) // 2 for p in range(len(folders)))
+
+
+def test_index_is_reused_until_a_puzzle_changes(open_dataset, tmp_path):
+    folders = open_dataset().puzzle_folders_list
+    path = tmp_path / 'adjacency.npz'
+    first = AdjacencyIndex.build(folders, path)
+    again = AdjacencyIndex.build(folders, path)
+    assert np.array_equal(first.indices, again.indices) and np.array_equal(first.indptr, again.indptr)
+
+    # drop an edge of the first puzzle
+    data_file = folders[0] / 'data.json'
+    original = data_file.read_text()
+    try:
+        data = json.loads(original)
+        i, j = data['adjacency'].pop(0)
+        data_file.write_text(json.dumps(data))
+        changed = AdjacencyIndex.build(folders, path)
+        assert j not in changed.neighbors(0, i).tolist()
+        assert changed.n_edges == first.n_edges - 1
+        assert np.array_equal(changed.to_dense(1), first.to_dense(1))
+    finally:
+        data_file.write_text(original)
+
+
+def test_subset_and_components(open_dataset):
+    index = open_dataset().adjacency()
+    names = index.names[::-1]
+    subset = index.subset(names)
+    for p, name in enumerate(names):
+        assert np.array_equal(subset.to_dense(p), index.to_dense(name))
+    # synthetic puzzles are connected tilings
+    assert index.n_components().tolist() == [1] * len(index)
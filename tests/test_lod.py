@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from repair_dataset import lod
+from repair_dataset.lod import MeshLODCache, build_lods, cluster_vertices, decimate
+from repair_dataset.spatial import load_obj_mesh
+
+from conftest import write_sphere_obj
+
+TARGETS = (500, 100)
+
+
+def _check_mesh(vertices, faces):
+    assert faces.min() >= 0 and faces.max() < len(vertices)
+    # every vertex is used, no face collapsed or repeated
+    assert len(np.unique(faces)) == len(vertices)
+    assert np.all((faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2]))
+    assert len(np.unique(np.sort(faces, axis=1), axis=0)) == len(faces)
+
+
+def test_cluster_vertices(tmp_path):
+    write_sphere_obj(tmp_path / 'sphere.obj', 30, 40)
+    vertices, faces = load_obj_mesh(tmp_path / 'sphere.obj')
+    merged, merged_faces, error = cluster_vertices(vertices, faces, 0.2)
+    _check_mesh(merged, merged_faces)
+    assert len(merged) < len(vertices) and 0 < error < 0.2 * np.sqrt(3)
+    # a fine grid only merges the vertices at the same place (the poles of the sphere)
+    same, same_faces, zero = cluster_vertices(vertices, faces, 1e-4)
+    _check_mesh(same, same_faces)
+    assert zero == 0 and len(same) == len(np.unique(vertices, axis=0))
+    assert np.allclose(np.unique(same, axis=0), np.unique(vertices, axis=0))
+
+
+def test_levels(tmp_path):
+    write_sphere_obj(tmp_path / 'sphere.obj', 30, 40)
+    vertices, faces = load_obj_mesh(tmp_path / 'sphere.obj')
+    levels = build_lods(vertices, faces, TARGETS)
+    assert len(levels) == len(TARGETS) + 1 and levels[0]['error'] == 0
+    assert np.array_equal(levels[0]['vertices'], vertices) and np.array_equal(levels[0]['faces'], faces)
+    for level, target in zip(levels[1:], TARGETS):
+        _check_mesh(level['vertices'], level['faces'])
+        assert 0 < len(level['faces']) <= target and level['error'] > 0
+    assert levels[1]['cell_size'] <= levels[2]['cell_size']
+
+    # already small enough
+    small = decimate(vertices, faces, len(faces))
+    assert small['error'] == 0 and small['cell_size'] == 0 and np.array_equal(small['faces'], faces)
+
+
+def test_cache(tmp_path, monkeypatch):
+    obj = tmp_path / 'data' / 'puzzle_0000000' / 'RPf_00000.obj'
+    obj.parent.mkdir(parents=True)
+    write_sphere_obj(obj, 30, 40)
+    built = []
+
+    def counted(*args, **kwargs):
+        built.append(args)
+        return build_lods(*args, **kwargs)
+    monkeypatch.setattr(lod, 'build_lods', counted)
+
+    cache = MeshLODCache(tmp_path / 'lod', TARGETS)
+    assert len(cache) == len(TARGETS) + 1
+    full = cache.load(obj, 0)
+    vertices, faces = load_obj_mesh(obj)
+    assert full['vertices'].dtype == np.float32 and full['faces'].dtype == np.uint16
+    assert np.allclose(full['vertices'], vertices, atol=1e-6) and np.array_equal(full['faces'], faces)
+    assert full['lod_error'] == 0
+    coarse = cache.load(obj, 2)
+    assert len(coarse['faces']) <= TARGETS[1] and coarse['lod_error'] == cache.errors(obj)[2] > 0
+    assert len(built) == 1
+    assert [p.name for p in cache.path(obj).parent.iterdir()] == ['RPf_00000.lod.npz']
+
+    # the same targets share the file, other ones and a changed mesh do not
+    MeshLODCache(tmp_path / 'lod', TARGETS).build([obj])
+    assert len(built) == 1
+    MeshLODCache(tmp_path / 'lod', (300,)).build([obj])
+    assert len(built) == 2
+    write_sphere_obj(obj, 10, 12)
+    assert len(cache.load(obj, 0)['faces']) == len(load_obj_mesh(obj)[1]) and len(built) == 3
+
+    with pytest.raises(RuntimeError):
+        cache.load(obj, 3)
+    with pytest.raises(RuntimeError):
+        MeshLODCache(tmp_path / 'lod', (100, 500))
+
+
+def test_dataset_levels(open_dataset_3d, tmp_path):
+    full = open_dataset_3d(cache_dir=tmp_path, lod=0, lod_targets=TARGETS)
+    coarse = open_dataset_3d(cache_dir=tmp_path, lod=2, lod_targets=TARGETS)
+    for k in range(len(full)):
+        for frag, frag2 in zip(full[k]['fragments'], coarse[k]['fragments']):
+            vertices, faces = load_obj_mesh(frag['obj'])
+            assert np.array_equal(frag['faces'], faces) and frag['lod_error'] == 0
+            assert len(frag2['faces']) <= TARGETS[1] < len(faces)
+            # every original vertex is within the error bound of the simplified ones
+            distances = np.linalg.norm(vertices[:, None] - frag2['vertices'][None], axis=-1).min(axis=1)
+            assert distances.max() <= frag2['lod_error'] + 1e-5
+
+    with pytest.raises(RuntimeError):
+        open_dataset_3d(cache_dir=tmp_path, lod=3, lod_targets=TARGETS)
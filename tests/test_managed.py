@@ -0,0 +1,80 @@
+import hashlib
+import types
+import zipfile
+
+import pytest
+
+from repair_dataset.managed import prepare_dataset, prepared_here, read_status
+
+
+@pytest.fixture
+def remote(tmp_path):
+    # the archive sits in a folder mirror, nothing goes over the network
+    archives = tmp_path / 'archives'
+    archives.mkdir()
+    with zipfile.ZipFile(archives / 'data.zip', 'w') as zf:
+        zf.writestr('root/README.txt', 'loose file')
+        for p in range(1, 5):
+            zf.writestr(f'root/puzzle_{p:07d}/data.json', f'{{"puzzle": {p}}}')
+            zf.writestr(f'root/puzzle_{p:07d}/frag.png', bytes([p]) * 100)
+    checksum = 'md5:' + hashlib.md5((archives / 'data.zip').read_bytes()).hexdigest()
+    return types.SimpleNamespace(url='http://127.0.0.1:9/data.zip', filename='data.zip', checksum=checksum,
+                                 root_folder='root', mirrors=[str(archives)])
+
+
+def prepare(root, remote, **kwargs):
+    return prepare_dataset(root, 'TEST_v1', remote, 'TEST/v1', mirrors=remote.mirrors, **kwargs)
+
+
+def test_foreign_folder_is_left_untouched(tmp_path, remote):
+    # e.g. extracted by datman, without our STATUS file
+    data_path = tmp_path / 'data' / 'TEST' / 'v1'
+    (data_path / '.cache').mkdir(parents=True)
+    (data_path / 'puzzle_0000001').mkdir()
+    (data_path / 'puzzle_0000001' / 'data.json').write_text('{}')
+
+    for from_scratch in (False, True):
+        with pytest.raises(RuntimeError, match='not prepared by repair_dataset'):
+            prepare(tmp_path / 'data', remote, from_scratch=from_scratch)
+    assert (data_path / '.cache').is_dir()
+    assert (data_path / 'puzzle_0000001' / 'data.json').read_text() == '{}'
+    assert not prepared_here(data_path)
+
+
+def test_from_scratch_recreates_own_folder(tmp_path, remote):
+    data_path = prepare(tmp_path / 'data', remote)
+    assert prepared_here(data_path) and read_status(data_path)['complete']
+    (data_path / 'puzzle_0000002' / 'frag.png').write_bytes(b'edited')
+
+    prepare(tmp_path / 'data', remote)
+    assert (data_path / 'puzzle_0000002' / 'frag.png').read_bytes() == b'edited'
+
+    prepare(tmp_path / 'data', remote, from_scratch=True)
+    assert (data_path / 'puzzle_0000002' / 'frag.png').read_bytes() == bytes([2]) * 100
+
+
+def tree(path):
+    return {str(p.relative_to(path)): p.read_bytes() for p in sorted(path.rglob('*')) if p.is_file() and p.name != 'STATUS.json'}
+
+
+def test_incremental_extraction_matches_full(tmp_path, remote):
+    seen = []
+
+    def patch(staging):
+        # patches run once per puzzle, on the newly extracted ones only
+        for folder in staging.glob('puzzle_*'):
+            seen.append(folder.name)
+            (folder / 'patched').write_text(folder.name)
+
+    full = prepare(tmp_path / 'full', remote, patches=[patch])
+
+    seen.clear()
+    part = prepare(tmp_path / 'part', remote, patches=[patch], puzzles=['puzzle_0000002', 'puzzle_0000004'])
+    assert sorted(p.name for p in part.glob('puzzle_*')) == ['puzzle_0000002', 'puzzle_0000004']
+    assert not read_status(part)['complete']
+    prepare(tmp_path / 'part', remote, patches=[patch], puzzles=['puzzle_0000004', 'puzzle_0000001'])
+    prepare(tmp_path / 'part', remote, patches=[patch])
+
+    assert sorted(seen) == ['puzzle_0000001', 'puzzle_0000002', 'puzzle_0000003', 'puzzle_0000004']
+    assert read_status(part)['complete']
+    assert tree(part) == tree(full)
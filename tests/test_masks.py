@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from repair_dataset.utils import pack_mask, unpack_mask
+
+
+@pytest.mark.parametrize('size', [(1, 1), (7, 3), (8, 8), (33, 17)])
+def test_pack_round_trip(size):
+    rng = np.random.default_rng(0)
+    alpha = Image.fromarray(rng.integers(0, 3, size[::-1], dtype=np.uint8) * 100, mode='L')
+    packed = pack_mask(alpha)
+    assert packed.dtype == np.uint8 and packed.shape == (size[1], -(-size[0] // 8))
+    assert np.array_equal(unpack_mask(packed, size), np.asarray(alpha) > 0)
+
+
+@pytest.mark.parametrize('rotations', [{}, {'apply_random_rotations': True, 'rotation_seed': 4}])
+def test_channels_match_rgba(open_dataset, rotations):
+    rgba = open_dataset(supervised_mode=True, **rotations)
+    alpha = open_dataset(supervised_mode=True, channels='alpha', **rotations)
+    mask = open_dataset(supervised_mode=True, channels='mask', **rotations)
+    for k in range(len(rgba)):
+        (x, data), (xa, data_a), (xm, data_m) = rgba[k], alpha[k], mask[k]
+        assert data == data_a == data_m
+        for frag, frag_a, frag_m in zip(x['fragments'], xa['fragments'], xm['fragments']):
+            expected = np.asarray(frag['image'].getchannel('A'))
+            assert frag_a['image'].mode == 'L'
+            assert np.array_equal(np.asarray(frag_a['image']), expected)
+            assert tuple(frag_m['image_size']) == frag['image'].size
+            assert np.array_equal(unpack_mask(frag_m['image'], frag_m['image_size']), expected > 0)
+
+
+def test_invalid_channels(open_dataset):
+    with pytest.raises(RuntimeError):
+        open_dataset(supervised_mode=True, channels='rgb')
+    with pytest.raises(RuntimeError):
+        open_dataset(channels='alpha')
@@ -0,0 +1,79 @@
+import numpy as np
+
+from repair_dataset.pairs import relative_poses, render_pair
+from repair_dataset.poses import pose_matrices
+
+
+def test_relative_poses_compose():
+    rng = np.random.default_rng(0)
+    a = np.column_stack([rng.uniform(0, 500, (50, 2)), rng.uniform(0, 360, 50)])
+    b = np.column_stack([rng.uniform(0, 500, (50, 2)), rng.uniform(0, 360, 50)])
+    relative = relative_poses(a, b)
+
+    # the pose of a applied to the relative pose gives the pose of b
+    m = pose_matrices(a)
+    xy = np.einsum('nij,nj->ni', m[:, :, :2], relative[:, :2]) + m[:, :, 2]
+    assert np.allclose(xy, b[:, :2])
+    assert np.allclose(np.mod(a[:, 2] + relative[:, 2], 360), b[:, 2])
+    assert np.allclose(pose_matrices(relative), np.einsum('nij,njk->nik', np.transpose(m[:, :, :2], (0, 2, 1)),
+                                                          pose_matrices(b) - np.concatenate([np.zeros((50, 2, 2)), m[:, :, 2:]], -1)))
+
+
+def test_pair_index(open_dataset):
+    dataset = open_dataset(supervised_mode=True)
+    pairs = dataset.pair_index()
+    adjacency = dataset.adjacency()
+    assert len(pairs) == adjacency.n_edges
+    assert np.all(pairs.i < pairs.j)
+    assert np.all(adjacency.is_adjacent(pairs.puzzle, pairs.i, pairs.j))
+
+    batch = pairs.sample(64, negative_fraction=0.25, seed=0)
+    assert batch['label'].sum() == 48 and np.all((batch['index'] >= 0) == (batch['label'] == 1))
+    assert np.array_equal(adjacency.is_adjacent(batch['puzzle'], batch['i'], batch['j']), batch['label'] == 1)
+    assert np.allclose(batch['relative'][:48], pairs.relative[batch['index'][:48]])
+
+
+def _centroid(alpha):
+    ys, xs = np.mgrid[0:alpha.shape[0], 0:alpha.shape[1]]
+    w = alpha.astype(np.float64)
+    return np.array([(xs * w).sum(), (ys * w).sum()]) / w.sum()
+
+
+def test_crops_place_b_at_the_relative_pose(open_dataset):
+    # with random rotations, the relative angles are not all 0
+    dataset = open_dataset(supervised_mode=True, apply_random_rotations=True, rotation_seed=0)
+    adjacency = dataset.adjacency()
+    for k in range(len(dataset)):
+        x, data = dataset[k]
+        fragments = x['fragments']
+        poses = np.array([gt['position_2d'] for gt in data['fragments']])
+        i, j = adjacency.edges(x['name'])
+        for a, b in zip(i, j):
+            relative = relative_poses(poses[a], poses[b])[0]
+            crop, scale = render_pair(fragments[a]['image'], fragments[b]['image'], relative, size=128, channels='alpha')
+            assert crop.shape == (128, 128, 2) and 0 < scale <= 1
+            if min(np.count_nonzero(crop[..., 0]), np.count_nonzero(crop[..., 1])) < 50:
+                continue
+            # centroids are at the image centers (up to the rounding of centering), b at `relative` from a
+            offset = (_centroid(crop[..., 1]) - _centroid(crop[..., 0])) / scale
+            assert np.allclose(offset, relative[:2], atol=1.5 / scale)
+
+
+def test_crop_store(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+    store = dataset.pair_crops(size=64, max_workers=2)
+    assert len(store) == len(dataset.pair_index())
+    assert store.crops.shape == (len(store), 64, 64, 4) and not store.crops.flags.writeable
+    assert np.all((store.scales > 0) & (store.scales <= 1))
+    assert sorted(p.name for p in (tmp_path / 'pairs').iterdir()) == sorted([store.path.name, store.path.stem + '.scales.npy'])
+
+    pair = store.index[0]
+    x, _ = dataset[pair['puzzle']]
+    expected, scale = render_pair(x['fragments'][pair['i']]['image'], x['fragments'][pair['j']]['image'], pair['relative'], 64)
+    assert np.array_equal(store[0], expected) and store.scales[0] == scale
+
+    # built once
+    stamp = store.path.stat().st_mtime_ns
+    again = dataset.pair_crops(size=64)
+    assert again.path == store.path and store.path.stat().st_mtime_ns == stamp
+    assert np.array_equal(again.scales, store.scales)
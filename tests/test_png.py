@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from repair_dataset.png import PNGStreamWriter
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_bands_round_trip(tmp_path, mode):
+    rng = np.random.default_rng(0)
+    channels = len(mode)
+    image = rng.integers(0, 256, size=(97, 61, channels), dtype=np.uint8).squeeze()
+    path = tmp_path / 'out.png'
+    with PNGStreamWriter(path, 61, 97, mode=mode) as writer:
+        # bands of any height, images and arrays
+        for start, stop in [(0, 1), (1, 40), (40, 41), (41, 97)]:
+            band = image[start:stop]
+            writer.write(Image.fromarray(band, mode) if start % 2 else band)
+
+    with Image.open(path) as decoded:
+        assert decoded.mode == mode
+        assert np.array_equal(np.asarray(decoded), image)
+
+
+def test_bands_are_converted(tmp_path):
+    band = Image.new('RGBA', (8, 4), (10, 20, 30, 255))
+    with PNGStreamWriter(tmp_path / 'out.png', 8, 4, mode='RGB') as writer:
+        writer.write(band)
+    with Image.open(tmp_path / 'out.png') as decoded:
+        assert decoded.getpixel((3, 2)) == (10, 20, 30)
+
+
+def test_row_count_is_checked(tmp_path):
+    with pytest.raises(RuntimeError, match='More rows'):
+        with PNGStreamWriter(tmp_path / 'a.png', 4, 2, mode='L') as writer:
+            writer.write(np.zeros((3, 4), dtype=np.uint8))
+    with pytest.raises(RuntimeError, match='Only 1 rows'):
+        with PNGStreamWriter(tmp_path / 'b.png', 4, 2, mode='L') as writer:
+            writer.write(np.zeros((1, 4), dtype=np.uint8))
+    with pytest.raises(RuntimeError, match='width'):
+        with PNGStreamWriter(tmp_path / 'c.png', 4, 2, mode='L') as writer:
+            writer.write(np.zeros((2, 5), dtype=np.uint8))
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+
+import numpy as np
+from PIL import Image
+
+from repair_dataset.poses import (PoseTable, centroid_to_topleft, compose_rotations, flip_y, get_poses,
+                                  padded_centroids, pose_matrices, reframe, scale_poses, set_poses,
+                                  to_degrees, to_radians, topleft_to_centroid)
+from repair_dataset.utils import centroid_rgba
+
+
+def _random_poses(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(0, 1000, (n, 2)), rng.uniform(0, 360, n)])
+
+
+def test_converters_round_trip():
+    poses = _random_poses(20)
+    heights = np.random.default_rng(1).integers(100, 2000, 20)
+    assert np.allclose(to_degrees(to_radians(poses)), poses)
+    assert np.allclose(flip_y(flip_y(poses, heights), heights), poses)
+    assert np.allclose(flip_y(flip_y(poses, 500, negate_angle=True), 500, negate_angle=True), poses)
+    assert np.allclose(scale_poses(scale_poses(poses, 0.25), 4), poses)
+    assert np.allclose(compose_rotations(compose_rotations(poses, 30), 330), np.column_stack([poses[:, :2], poses[:, 2] % 360]))
+
+    centroids = np.random.default_rng(2).uniform(0, 50, (20, 2))
+    assert np.allclose(topleft_to_centroid(centroid_to_topleft(poses, centroids), centroids, poses[:, 2]), poses)
+    # moving the reference point there and back
+    other = np.random.default_rng(3).uniform(0, 50, (20, 2))
+    assert np.allclose(reframe(reframe(poses, centroids, other), other, centroids), poses)
+    # inputs are never modified
+    assert np.array_equal(poses, _random_poses(20))
+
+    frags = [{'position_2d': list(p)} for p in poses]
+    set_poses(frags, scale_poses(poses, 2))
+    assert np.allclose(get_poses(frags), poses * [2, 2, 1])
+    assert get_poses([{'pixel_position': [1, 2, 3]}]).tolist() == [[1, 2, 3]]
+
+
+def test_pose_matrices_follow_pil():
+    # a point of a fragment image rotated with Image.rotate lands where the pose matrix puts it
+    image = Image.new('L', (41, 41))
+    image.putpixel((30, 20), 255)
+    pose = np.array([100.0, 200.0, 90.0])
+    rotated = np.asarray(image.rotate(pose[2]))
+    y, x = np.argwhere(rotated == 255)[0]
+    local = np.array([30, 20]) - padded_centroids((41, 41))[0]
+    placed = pose_matrices(pose)[0] @ np.append(local, 1)
+    assert np.allclose(placed, pose[:2] + (np.array([x, y]) - padded_centroids((41, 41))[0]))
+
+    # without rotation, the top-left corner as reference point is the paste position
+    unrotated = np.array([100.0, 200.0, 0.0])
+    assert np.allclose(reframe(unrotated, padded_centroids((41, 41)), [0, 0])[0, :2],
+                       centroid_to_topleft(unrotated, padded_centroids((41, 41)))[0])
+
+
+def test_table_matches_the_metadata(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+    table = dataset.pose_table()
+    assert table.names == [p.name for p in dataset.puzzle_folders_list]
+    for k in range(len(dataset)):
+        x, data = dataset[k]
+        assert np.allclose(table[x['name']], get_poses(data['fragments']))
+        assert table.solution_sizes[k].tolist() == list(data['solution_size'])
+    assert np.array_equal(table.heights(), table.solution_sizes[table.puzzle_of, 1])
+
+    # v3 'position_2d' is the centroid of the cropped image pasted at its top-left corner
+    x, data = dataset[0]
+    with open(f"{data['path']}/data.json") as f:
+        meta = json.load(f)
+    if 'metadata_version' in meta:
+        frag = meta['fragments'][0]
+        image = Image.open(f"{data['path']}/{frag['filename']}")
+        topleft = centroid_to_topleft(frag['position_2d'], [centroid_rgba(image)])[0]
+        assert np.all(topleft >= -1) and np.all(topleft + image.size <= np.array(meta['solution_size']) + 1)
+
+
+def test_table_persistence(open_dataset, tmp_path):
+    # a copy, data.json files are edited
+    folders = []
+    for folder in open_dataset().puzzle_folders_list:
+        folders.append(tmp_path / 'data' / folder.name)
+        shutil.copytree(folder, folders[-1])
+    path = tmp_path / 'poses.npz'
+    table = PoseTable.build(folders, path)
+    loaded = PoseTable.load(path)
+    assert loaded.names == table.names and np.array_equal(loaded.poses, table.poses)
+    assert np.array_equal(loaded.offsets, table.offsets) and np.array_equal(loaded.solution_sizes, table.solution_sizes)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['data', 'poses.npz']
+
+    # an edited data.json is parsed again
+    data_file = folders[0] / 'data.json'
+    with open(data_file) as f:
+        data = json.load(f)
+    key = 'position_2d' if 'position_2d' in data['fragments'][0] else 'pixel_position'
+    data['fragments'][0][key][0] += 10.0
+    with open(data_file, 'w') as f:
+        json.dump(data, f)
+    os.utime(data_file, ns=(0, 1))
+    rebuilt = PoseTable.build(folders, path)
+    assert rebuilt[0][0, 0] == table[0][0, 0] + 10.0
+    assert np.array_equal(rebuilt.poses[table.offsets[1]:], table.poses[table.offsets[1]:])
+    assert np.array_equal(PoseTable.load(path).poses, rebuilt.poses)
+
+    subset = table.subset(table.names[::-1])
+    assert subset.names == table.names[::-1] and np.array_equal(subset[0], table[-1])
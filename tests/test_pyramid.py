@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from repair_dataset.pyramid import downscale_centered, scale_to_factor
+
+
+def _alpha_centroid(image):
+    alpha = np.asarray(image.getchannel('A'), dtype=np.float64)
+    ys, xs = np.mgrid[0:alpha.shape[0], 0:alpha.shape[1]]
+    return np.array([(xs * alpha).sum(), (ys * alpha).sum()]) / alpha.sum()
+
+
+def test_scale_to_factor():
+    assert [scale_to_factor(s) for s in (1, 0.5, 0.25, 0.125)] == [1, 2, 4, 8]
+    for scale in (0, 0.3, 2, 1 / 16):
+        with pytest.raises(RuntimeError):
+            scale_to_factor(scale)
+
+
+@pytest.mark.parametrize('factor', [2, 4, 8])
+def test_downscale_keeps_the_center(factor):
+    # a centered disk
+    ys, xs = np.mgrid[0:101, 0:101]
+    a = np.zeros((101, 101, 4), dtype=np.uint8)
+    a[(xs - 50) ** 2 + (ys - 50) ** 2 <= 30 ** 2] = (200, 100, 50, 255)
+    image = Image.fromarray(a, mode='RGBA')
+
+    small = downscale_centered(image, factor)
+    assert small.width == small.height and small.width % 2 == 1
+    center = (small.width - 1) / 2
+    assert np.allclose(_alpha_centroid(small), center, atol=0.05)
+    assert downscale_centered(image, 1) is image
+
+
+def test_downscaled_dataset(open_dataset, tmp_path):
+    full = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+    half = open_dataset(supervised_mode=True, scale=0.5, cache_dir=tmp_path)
+    assert not any('.tmp' in p.name for p in (tmp_path / 'pyramid').rglob('*'))
+
+    for k in range(len(full)):
+        (x, data), (x2, data2) = full[k], half[k]
+        for frag, frag2, gt, gt2 in zip(x['fragments'], x2['fragments'], data['fragments'], data2['fragments']):
+            assert frag2['image'].width == 2 * -(-frag['image'].width // 4) + 1
+            assert np.allclose(np.asarray(gt2['position_2d'][:2]), np.asarray(gt['position_2d'][:2]) / 2)
+            assert gt2['position_2d'][2] == gt['position_2d'][2]
+
+
+def test_levels_are_built_once(open_dataset, tmp_path):
+    open_dataset(supervised_mode=True, scale=0.25, cache_dir=tmp_path)
+    files = sorted((tmp_path / 'pyramid').rglob('*.png'))
+    assert len(files) > 0
+    stamps = [p.stat().st_mtime_ns for p in files]
+
+    open_dataset(supervised_mode=True, scale=0.125, cache_dir=tmp_path)
+    assert sorted((tmp_path / 'pyramid').rglob('*.png')) == files
+    assert [p.stat().st_mtime_ns for p in files] == stamps
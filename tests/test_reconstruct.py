@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from repair_dataset.reconstruct import TiledSolution, reassemble_2d, reassemble_2d_tiled
+
+
+@pytest.fixture
+def solved(open_dataset):
+    # fragments with random rotations and the matching ground truth poses
+    dataset = open_dataset(supervised_mode=True, apply_random_rotations=True, rotation_seed=0)
+    puzzles = []
+    for k in range(len(dataset)):
+        x, data = dataset[k]
+        puzzles.append([dict(frag, position_2d=gt['position_2d']) for frag, gt in zip(x['fragments'], data['fragments'])])
+    return puzzles
+
+
+@pytest.mark.parametrize('tile_size', [37, 64, 4096])
+def test_tiled_is_pixel_identical(solved, tile_size):
+    for fragments in solved:
+        full = np.asarray(reassemble_2d(fragments))
+        tiled = TiledSolution([f['image'] for f in fragments], [f['position_2d'] for f in fragments], tile_size=tile_size)
+        assert np.array_equal(np.asarray(tiled.image()), full)
+
+
+def test_streamed_and_reduced(solved, tmp_path):
+    for fragments in solved:
+        full = reassemble_2d(fragments)
+        # fragments may also be loaders
+        loaders = [dict(f, image=lambda image=f['image']: image) for f in fragments]
+        for factor in (1, 4):
+            path = tmp_path / f'solution_{factor}.png'
+            reassemble_2d_tiled(loaders, path, tile_size=64, factor=factor)
+            expected = full.reduce(factor) if factor > 1 else full
+            with Image.open(path) as streamed:
+                assert np.array_equal(np.asarray(streamed), np.asarray(expected))
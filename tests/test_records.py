@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from repair_dataset.records import Fragment, Puzzle
+
+
+def _same_sample(a, b):
+    (x, data), (x2, data2) = a, b
+    assert data == data2
+    assert x['name'] == x2['name'] and len(x['fragments']) == len(x2['fragments'])
+    for frag, frag2 in zip(x['fragments'], x2['fragments']):
+        assert frag.keys() == frag2.keys()
+        for key in frag:
+            if key in ('image', 'contour'):
+                assert np.array_equal(np.asarray(frag[key]), np.asarray(frag2[key]))
+            else:
+                assert frag[key] == frag2[key]
+
+
+def test_unsupervised_round_trip(open_dataset):
+    plain = open_dataset()
+    records = open_dataset(return_records=True)
+    for k in range(len(plain)):
+        puzzle = records[k]
+        assert isinstance(puzzle, Puzzle)
+        assert puzzle.to_dict() == plain[k]
+
+
+@pytest.mark.parametrize('options', [{}, {'channels': 'mask'}, {'contours': True, 'apply_random_rotations': True, 'rotation_seed': 1}])
+def test_supervised_round_trip(open_dataset, tmp_path, options):
+    plain = open_dataset(supervised_mode=True, cache_dir=tmp_path, **options)
+    records = open_dataset(supervised_mode=True, return_records=True, cache_dir=tmp_path, **options)
+    for k in range(len(plain)):
+        expected = plain[k]
+        _same_sample(records[k].to_supervised(), expected)
+        _same_sample(Puzzle.from_dict(expected[1], expected[0]).to_supervised(), expected)
+
+
+def test_fragment_views(open_dataset):
+    puzzle = open_dataset(supervised_mode=True, return_records=True)[0]
+    assert not hasattr(puzzle, '__dict__') and not hasattr(puzzle[0], '__dict__')
+    assert puzzle.positions.dtype == np.float64 and puzzle.positions.shape == (len(puzzle), 3)
+    assert [f.full_name for f in puzzle] == [f"{puzzle.name}/{name}" for name in puzzle.fragment_names]
+
+    last = puzzle[-1]
+    assert isinstance(last, Fragment) and last.i == len(puzzle) - 1
+    assert last.image_size == last.image.size
+    assert np.array_equal(last.position_2d, puzzle.positions[-1])
+    with pytest.raises(IndexError):
+        puzzle[len(puzzle)]
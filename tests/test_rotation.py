@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from repair_dataset.rotation import RotationEngine, rotate_exact
+
+
+def _images(dataset):
+    return [[np.asarray(frag['image']) for frag in dataset[k][0]['fragments']] for k in range(len(dataset))]
+
+
+def _angles(dataset):
+    return [[gt['position_2d'][2] for gt in dataset[k][1]['fragments']] for k in range(len(dataset))]
+
+
+def test_angles_depend_on_seed_and_epoch_only():
+    frags = [{'full_name': f'frag_{k}'} for k in range(20)]
+    a, b = RotationEngine(seed=3, step=15), RotationEngine(seed=3, step=15)
+    assert [a.angle(f) for f in frags] == [b.angle(f) for f in reversed(frags)][::-1]
+    assert all(a.angle(f) % 15 == 0 and 0 <= a.angle(f) < 360 for f in frags)
+
+    b.set_epoch(1)
+    assert [a.angle(f) for f in frags] != [b.angle(f) for f in frags]
+    assert [a.angle(f) for f in frags] != [RotationEngine(seed=4, step=15).angle(f) for f in frags]
+
+
+def test_invalid_parameters():
+    with pytest.raises(RuntimeError):
+        RotationEngine(step=7)
+    with pytest.raises(RuntimeError):
+        RotationEngine(mode='cubic')
+    with pytest.raises(RuntimeError):
+        RotationEngine(step=90, cache_dir='rotations')
+
+
+def test_same_seed_same_samples(open_dataset):
+    first = open_dataset(supervised_mode=True, apply_random_rotations=True, rotation_seed=7)
+    second = open_dataset(supervised_mode=True, apply_random_rotations=True, rotation_seed=7)
+    assert _angles(first) == _angles(second)
+    assert all(np.array_equal(a, b) for x, y in zip(_images(first), _images(second)) for a, b in zip(x, y))
+
+    second.set_epoch(1)
+    assert _angles(first) != _angles(second)
+
+
+def test_replay(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, apply_random_rotations=True, rotation_seed=11)
+    dataset.set_epoch(2)
+    angles = _angles(dataset)
+    dataset.save_rotations(tmp_path / 'rotations.json')
+
+    # another seed, the recorded angles win
+    replayed = open_dataset(supervised_mode=True, apply_random_rotations=True, rotation_seed=12)
+    replayed.replay_rotations(tmp_path / 'rotations.json')
+    replayed.set_epoch(2)
+    assert _angles(replayed) == angles
+
+
+def test_cache_hits(open_dataset, tmp_path, monkeypatch):
+    options = dict(supervised_mode=True, apply_random_rotations=True, rotation_seed=5, rotation_step=90,
+                   cache_rotations=True, cache_dir=tmp_path)
+    expected = _images(open_dataset(**options))
+
+    dataset = open_dataset(**options)
+    dataset.precompute_rotations(max_workers=4)
+    cached = sorted(p.name for p in (tmp_path / 'rotations').rglob('*.png'))
+    assert len(cached) == 4 * len(set(p.split('_')[0] for p in cached))
+    assert not any('.tmp' in p for p in cached)
+
+    # every variant is stored: samples are lookups, nothing is rotated
+    def fail(*args, **kwargs):
+        raise AssertionError("rotated instead of read from the cache")
+    monkeypatch.setattr(RotationEngine, '_rotate', fail)
+    for epoch in range(3):
+        dataset.set_epoch(epoch)
+        _images(dataset)
+    dataset.set_epoch(0)
+    assert all(np.array_equal(a, b) for x, y in zip(_images(dataset), expected) for a, b in zip(x, y))
+
+
+def test_rotate_exact_matches_pil_on_right_angles():
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (31, 31, 4), dtype=np.uint8), mode='RGBA')
+    image.putalpha(255)
+    for angle in (90, 180, 270):
+        assert np.array_equal(np.asarray(rotate_exact(image, angle)), np.asarray(image.rotate(angle)))
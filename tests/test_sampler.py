@@ -0,0 +1,66 @@
+import pytest
+
+BUDGET = 8 * 300 ** 2
+
+
+@pytest.fixture
+def dataset(open_dataset, tmp_path):
+    return open_dataset(supervised_mode=True, cache_dir=tmp_path)
+
+
+def test_exact_sizes(dataset):
+    sizes = dataset.fragment_sizes(exact=True)
+    bounds = dataset.fragment_sizes(exact=False)
+    for k in range(len(dataset)):
+        x, _ = dataset[k]
+        for frag in x['fragments']:
+            assert sizes.fragments[frag['full_name']]['padded'] == frag['image'].width
+            assert bounds.fragments[frag['full_name']]['padded'] >= frag['image'].width
+
+
+@pytest.mark.parametrize('unit', ['puzzles', 'fragments'])
+@pytest.mark.parametrize('cost', ['pixels', 'tokens'])
+def test_every_item_once_within_budget(dataset, unit, cost):
+    budget = BUDGET if cost == 'pixels' else 12
+    sampler = dataset.batch_sampler(budget, unit=unit, cost=cost, n_buckets=2, max_batch_size=3)
+    for epoch in range(3):
+        sampler.set_epoch(epoch)
+        batches = sampler.batches()
+        items = sorted(k for batch in batches for k in batch)
+        assert items == list(range(len(sampler.items)))
+        for batch in batches:
+            assert len(batch) <= 3
+            assert len(batch) == 1 or sampler.batch_cost(batch) <= budget
+    assert 0 < sampler.stats()['efficiency'] <= 1
+
+
+def test_order_depends_on_seed_and_epoch(dataset):
+    a = dataset.batch_sampler(BUDGET, unit='fragments', seed=1)
+    b = dataset.batch_sampler(BUDGET, unit='fragments', seed=1)
+    first = list(a)
+    assert first == list(b)
+    # iterating to the end moves to the next epoch
+    assert a.epoch == 1 and list(a) != first
+    assert list(dataset.batch_sampler(BUDGET, unit='fragments', seed=3)) != first
+
+
+def test_resume(dataset):
+    sampler = dataset.batch_sampler(BUDGET, unit='fragments', seed=2, max_batch_size=2)
+    sampler.set_epoch(3)
+    expected = list(sampler)
+    assert len(expected) > 3
+
+    sampler.set_epoch(3)
+    it = iter(sampler)
+    head = [next(it), next(it), next(it)]
+    # a prefetching loader ran one batch ahead of training
+    state = sampler.state_dict(batches_consumed=2)
+
+    resumed = dataset.batch_sampler(BUDGET, unit='fragments', seed=0, max_batch_size=2)
+    resumed.load_state_dict(state)
+    assert head[:2] + list(resumed) == expected
+    assert resumed.epoch == 4
+
+    other = dataset.shard(2, 0).batch_sampler(BUDGET, unit='fragments')
+    with pytest.raises(RuntimeError):
+        other.load_state_dict(state)
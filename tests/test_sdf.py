@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from repair_dataset.sdf import edt, signed_distance
+
+
+def brute_edt(mask):
+    ys, xs = np.nonzero(mask)
+    if len(ys) == 0:
+        return np.full(mask.shape, np.inf)
+    yy, xx = np.mgrid[:mask.shape[0], :mask.shape[1]]
+    return np.sqrt(((yy[..., None] - ys) ** 2 + (xx[..., None] - xs) ** 2).min(axis=-1))
+
+
+@pytest.mark.parametrize('density', [0.0, 0.005, 0.05, 0.5, 0.97])
+def test_edt_is_exact(density):
+    rng = np.random.default_rng(int(density * 1000))
+    for _ in range(20):
+        h, w = rng.integers(1, 30, size=2)
+        mask = rng.random((h, w)) < density
+        np.testing.assert_allclose(edt(mask), brute_edt(mask))
+
+
+def test_edt_of_a_single_point_is_radial():
+    mask = np.zeros((41, 73), dtype=bool)
+    mask[20, 50] = True
+    yy, xx = np.mgrid[:41, :73]
+    np.testing.assert_allclose(edt(mask), np.hypot(yy - 20, xx - 50))
+
+
+def test_signed_distance_signs():
+    yy, xx = np.mgrid[:64, :64]
+    mask = (yy - 32) ** 2 + (xx - 32) ** 2 < 20 ** 2
+    sdf = signed_distance(mask)
+    assert np.all(sdf[mask] < 0) and np.all(sdf[~mask] > 0)
+    # about the distance to the circle
+    r = np.hypot(yy - 32, xx - 32)
+    assert np.max(np.abs(sdf - (r - 20))[np.abs(r - 20) < 8]) < 1.0
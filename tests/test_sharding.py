@@ -0,0 +1,57 @@
+import pickle
+
+import numpy as np
+import pytest
+
+
+def _names(dataset):
+    return [p.name for p in dataset.puzzle_folders_list]
+
+
+@pytest.mark.parametrize('balance', ['pixels', 'bytes', 'fragments', None])
+@pytest.mark.parametrize('num_shards', [1, 2, 3])
+def test_shards_partition_the_puzzles(open_dataset, tmp_path, balance, num_shards):
+    dataset = open_dataset(cache_dir=tmp_path)
+    for epoch in (0, 1):
+        shards = [dataset.shard(num_shards, rank, balance=balance, seed=5, epoch=epoch) for rank in range(num_shards)]
+        names = [name for shard in shards for name in _names(shard)]
+        assert sorted(names) == sorted(_names(dataset))
+        # every rank computes the same partition
+        assert _names(dataset.shard(num_shards, 0, balance=balance, seed=5, epoch=epoch)) == _names(shards[0])
+        if balance is not None:
+            costs = dict(zip(_names(dataset), dataset.shard_costs(balance)))
+            loads = [sum(costs[name] for name in _names(shard)) for shard in shards]
+            # LPT: no shard is more loaded than another by more than one puzzle
+            assert max(loads) - min(loads) <= max(costs.values())
+
+
+def test_shard_samples(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path)
+    shard = dataset.shard(2, 1)
+    assert len(shard) == len(_names(shard)) and len(dataset) == len(_names(dataset))
+    for k in range(len(shard)):
+        x, data = shard[k]
+        x2, data2 = dataset[x['name']]
+        assert data == data2
+        assert all(np.array_equal(np.asarray(a['image']), np.asarray(b['image']))
+                   for a, b in zip(x['fragments'], x2['fragments']))
+    assert shard.adjacency().names == _names(shard)
+
+    with pytest.raises(RuntimeError):
+        dataset.shard(2, 2)
+    with pytest.raises(RuntimeError):
+        dataset.shard(2, 0, balance='area')
+
+
+def test_pickling(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, cache_dir=tmp_path, memory_cache_mb=16, collect_stats=True)
+    dataset[0]
+    shard = dataset.shard(2, 0)
+    for original in (dataset, shard):
+        copy = pickle.loads(pickle.dumps(original))
+        assert _names(copy) == _names(original)
+        x, data = copy[0]
+        x2, data2 = original[0]
+        assert data == data2
+        assert all(np.array_equal(np.asarray(a['image']), np.asarray(b['image']))
+                   for a, b in zip(x['fragments'], x2['fragments']))
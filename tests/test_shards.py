@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pytest
+
+from repair_dataset.shards import ShardStream, export_shards
+
+
+@pytest.fixture
+def exported(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True)
+    shards = export_shards(dataset, tmp_path / 'shards', samples_per_shard=1)
+    return dataset, tmp_path / 'shards', shards
+
+
+def test_round_trip(exported):
+    dataset, path, shards = exported
+    assert len(shards) == len(dataset)
+    with open(path / 'index.json') as f:
+        assert sum(s['samples'] for s in json.load(f)['shards']) == len(dataset)
+
+    streamed = {x['name']: (x, data) for x, data in ShardStream(path)}
+    assert len(streamed) == len(dataset)
+    for k in range(len(dataset)):
+        x, data = dataset[k]
+        x2, data2 = streamed[x['name']]
+        assert data2['fragments'] == json.loads(json.dumps(data['fragments']))
+        for frag, frag2 in zip(x['fragments'], x2['fragments']):
+            assert np.array_equal(np.asarray(frag['image']), frag2['image'])
+
+
+def test_ranks_partition_the_shards(exported):
+    dataset, path, shards = exported
+    for shuffle in (False, True):
+        names = []
+        for rank in range(2):
+            stream = ShardStream(path, shuffle=shuffle, seed=3, rank=rank, world_size=2)
+            stream.set_epoch(1)
+            names += [x['name'] for x, _ in stream]
+        assert sorted(names) == sorted(dataset[k][0]['name'] for k in range(len(dataset)))
+
+
+def test_shuffle_depends_on_the_epoch(exported):
+    _, path, _ = exported
+    stream = ShardStream(path, shuffle=True, buffer_size=2, seed=0)
+    orders = []
+    for epoch in (0, 0, 1, 2, 3):
+        stream.set_epoch(epoch)
+        orders.append([x['name'] for x, _ in stream])
+    assert orders[0] == orders[1]
+    assert any(order != orders[0] for order in orders[2:])
+
+
+def test_too_few_shards(exported):
+    dataset, path, shards = exported
+    with pytest.raises(RuntimeError):
+        list(ShardStream(path, rank=0, world_size=len(shards) + 1))
+
+    # a shard is closed early when it grows over max_shard_bytes
+    big = export_shards(dataset, path.parent / 'big', samples_per_shard=len(dataset))
+    assert len(big) == 1
+    small = export_shards(dataset, path.parent / 'small', samples_per_shard=len(dataset), max_shard_bytes=1)
+    assert len(small) == len(dataset)
@@ -0,0 +1,72 @@
+import json
+import shutil
+
+import numpy as np
+from PIL import Image
+
+from repair_dataset.sheets import ContactSheetRenderer
+
+RED = (220, 30, 30)
+
+
+def _renderer(**kwargs):
+    return ContactSheetRenderer(cell_size=(384, 192), cols=2, max_workers=2, **kwargs)
+
+
+def _red_pixels(cell):
+    return int(np.count_nonzero(np.all(np.asarray(cell) == RED, axis=-1)))
+
+
+def test_pages_and_single_image(open_dataset, tmp_path):
+    folders = open_dataset().puzzle_folders_list
+    renderer = _renderer()
+    pages = renderer.save_pages(folders, tmp_path / 'pages', rows_per_page=1)
+    single = renderer.save_image(folders, tmp_path / 'sheet.png')
+    assert [p.name for p in pages] == ['page_0000.png', 'page_0001.png']
+
+    with Image.open(single) as image:
+        sheet = np.asarray(image)
+    assert sheet.shape == (2 * renderer.row_height + renderer.padding, renderer.sheet_width, 3)
+    # the pages are the rows of the single image, with the bottom padding
+    rows = []
+    for page in pages:
+        with Image.open(page) as image:
+            assert image.size == (renderer.sheet_width, renderer.row_height + renderer.padding)
+            rows.append(np.asarray(image)[:renderer.row_height])
+    assert np.array_equal(np.concatenate(rows), sheet[:2 * renderer.row_height])
+
+
+def test_difference_of_a_moved_fragment(open_dataset, tmp_path):
+    source = open_dataset().puzzle_folders_list[0]
+    moved = tmp_path / source.name
+    shutil.copytree(source, moved)
+    with open(moved / 'data.json') as f:
+        data = json.load(f)
+    key = 'position_2d' if 'position_2d' in data['fragments'][0] else 'pixel_position'
+    data['fragments'][0][key][0] += 40
+    with open(moved / 'data.json', 'w') as f:
+        json.dump(data, f)
+
+    renderer = _renderer()
+    solved, wrong = renderer.render_cell(source), renderer.render_cell(moved)
+    assert solved.size == wrong.size == renderer.cell_size
+    # the solution matches the preview, up to the resampling of the borders
+    assert _red_pixels(wrong) > 10 * max(1, _red_pixels(solved))
+
+
+def test_rows_are_rendered_ahead_of_the_writer_only(open_dataset, monkeypatch):
+    folders = open_dataset().puzzle_folders_list * 10
+    renderer = _renderer()
+    rendered = []
+    render_cell = renderer.render_cell
+
+    def counted(folder):
+        rendered.append(folder)
+        return render_cell(folder)
+    monkeypatch.setattr(renderer, 'render_cell', counted)
+
+    rows = renderer.rows(folders)
+    band = next(rows)
+    assert band.size == (renderer.sheet_width, renderer.row_height)
+    assert len(rendered) <= 2 * max(renderer.max_workers, renderer.cols) + renderer.cols
+    rows.close()
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+shared_memory = pytest.importorskip('multiprocessing.shared_memory')
+
+
+@pytest.fixture
+def server(open_dataset):
+    with open_dataset(supervised_mode=True).serve(max_workers=2) as server:
+        yield server
+
+
+def test_client_sees_the_decoded_samples(open_dataset, server):
+    local = open_dataset(supervised_mode=True)
+    client = open_dataset(supervised_mode=True, shared_memory=server.name)
+    assert len(client) == len(local)
+    for k in range(len(local)):
+        (x, data), (y, shared) = local[k], client[k]
+        assert shared['name'] == data['name']
+        for a, b in zip(x['fragments'], y['fragments']):
+            assert np.array_equal(np.asarray(a['image']), b['image'])
+            assert not b['image'].flags.writeable
+
+
+def test_clients_are_counted(open_dataset, server):
+    assert server.clients() == []
+    client = open_dataset(supervised_mode=True, shared_memory=server.name)
+    assert server.clients() == [os.getpid()]
+
+    # another process attaches, reads and exits without detaching: its slot is freed once it is gone
+    code = ("import sys; from repair_dataset.shm import SharedDatasetClient; "
+            f"c = SharedDatasetClient({server.name!r}); c[0]; print(len(c))")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert int(out.stdout) == len(client)
+    assert server.clients() == [os.getpid()]
+
+    client._shared.close()
+    assert server.clients() == []
+
+
+def test_options_must_match(open_dataset, server):
+    with pytest.raises(RuntimeError, match='options'):
+        open_dataset(supervised_mode=True, shared_memory=server.name, channels='alpha')
+
+
+def test_segments_are_gone_after_close(open_dataset):
+    server = open_dataset(supervised_mode=True).serve(max_workers=2)
+    name = server.name
+    server.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
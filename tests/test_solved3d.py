@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from repair_dataset.getters import solved3d_getter
+from repair_dataset.getters.solved3d_getter import getitem_3dsolved, load_index_3dsolved
+
+from conftest import write_sphere_obj
+
+
+def _count_scans(monkeypatch):
+    scanned = []
+    index_puzzle = solved3d_getter._index_puzzle_3dsolved
+
+    def counted(puzzle_folder):
+        scanned.append(puzzle_folder.name)
+        return index_puzzle(puzzle_folder)
+    monkeypatch.setattr(solved3d_getter, '_index_puzzle_3dsolved', counted)
+    return scanned
+
+
+def test_samples_match_a_folder_scan(open_dataset_3d, tmp_path):
+    dataset = open_dataset_3d(cache_dir=tmp_path)
+    assert len(dataset) == 2
+    for k in range(len(dataset)):
+        data = dataset[k]
+        scanned = getitem_3dsolved(data['path'], False)
+        assert [f['name'] for f in data['fragments']] == sorted(f['name'] for f in scanned['fragments'])
+        for frag, frag2 in zip(data['fragments'], scanned['fragments']):
+            assert {key: frag[key] for key in frag2} == frag2
+            assert frag['size'] == sum(os.path.getsize(frag[ext]) for ext in ['obj', 'mtl', 'png'])
+    assert dataset.fragment_counts() == {p.name: len(dataset[p.name]['fragments']) for p in dataset.puzzle_folders_list}
+
+    with pytest.raises(RuntimeError):
+        open_dataset_3d(supervised_mode=True)
+
+
+def test_counts_with_and_without_header(tmp_path):
+    folder = tmp_path / 'puzzle_0000000'
+    folder.mkdir()
+    expected = [write_sphere_obj(folder / f"RPf_{k:05d}.obj", 12, 16, header=k == 0) for k in range(2)]
+    index = load_index_3dsolved([folder])
+    assert [(f['n_vertices'], f['n_faces']) for f in index[folder.name]['fragments']] == expected
+
+
+def test_index_built_once(solved3d_root, tmp_path, monkeypatch):
+    # a copy, files are edited
+    folders = []
+    for folder in sorted(p for p in solved3d_root.iterdir() if p.is_dir()):
+        folders.append(tmp_path / 'data' / folder.name)
+        folders[-1].mkdir(parents=True)
+        for file in folder.iterdir():
+            (folders[-1] / file.name).write_bytes(file.read_bytes())
+    path = tmp_path / 'index.json'
+    scanned = _count_scans(monkeypatch)
+
+    index = load_index_3dsolved(folders, path)
+    assert sorted(scanned) == [f.name for f in folders]
+    assert not any('.tmp' in p.name for p in tmp_path.iterdir())
+    scanned.clear()
+    assert load_index_3dsolved(folders, path) == index and scanned == []
+
+    # a mesh edited in place only rescans its puzzle
+    obj = folders[1] / 'RPf_00000.obj'
+    n_vertices, n_faces = write_sphere_obj(obj, 8, 8)
+    rebuilt = load_index_3dsolved(folders, path)
+    assert scanned == [folders[1].name]
+    assert (rebuilt[folders[1].name]['fragments'][0]['n_vertices'], rebuilt[folders[1].name]['fragments'][0]['n_faces']) == (n_vertices, n_faces)
+    assert rebuilt[folders[0].name] == index[folders[0].name]
+
+    # so does a fragment added, and a missing file is an error
+    scanned.clear()
+    write_sphere_obj(folders[0] / 'RPf_00009.obj', 8, 8)
+    assert len(load_index_3dsolved(folders, path)[folders[0].name]['fragments']) == len(index[folders[0].name]['fragments']) + 1
+    assert scanned == [folders[0].name]
+    (folders[0] / 'RPf_00009.mtl').unlink()
+    with pytest.raises(RuntimeError):
+        load_index_3dsolved(folders, path)
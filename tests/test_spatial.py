@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from repair_dataset.spatial import VoxelIndex, find_contacts, fragment_index, load_obj_mesh
+
+
+def _write_obj(path, vertices, faces=()):
+    with open(path, 'w') as f:
+        f.write(''.join(f'v {x!r} {y!r} {z!r}\n' for x, y, z in vertices))
+        f.write(''.join(f'f {a + 1}/{a + 1} {b + 1}//{b + 1} {c + 1} {d + 1}\n' for a, b, c, d in faces))
+    return path
+
+
+def _brute_pairs(query, points, radius):
+    d = np.linalg.norm(query[:, None] - points[None], axis=-1)
+    return set(zip(*np.nonzero(d <= radius)))
+
+
+@pytest.mark.parametrize('cell_size', [0.05, 0.2])
+def test_query_pairs_match_brute_force(cell_size):
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-1, 1, (500, 3))
+    query = rng.uniform(-1, 1, (200, 3))
+    index = VoxelIndex(points, cell_size)
+
+    q, p = index.query_pairs(query, cell_size)
+    assert set(zip(q, p)) == _brute_pairs(query, points, cell_size)
+    assert len(set(zip(q, p))) == len(q)
+    assert np.array_equal(index.points, points[index.order])
+
+    with pytest.raises(RuntimeError):
+        index.query_pairs(query, 2 * cell_size)
+    with pytest.raises(RuntimeError):
+        VoxelIndex(points, 0)
+
+
+def test_save_and_load(tmp_path):
+    rng = np.random.default_rng(1)
+    points = rng.uniform(-1, 1, (300, 3))
+    query = rng.uniform(-1, 1, (50, 3))
+    index = VoxelIndex(points, 0.1)
+    index.save(tmp_path / 'index.npz')
+    loaded = VoxelIndex.load(tmp_path / 'index.npz')
+
+    assert np.array_equal(loaded.order, index.order)
+    assert set(zip(*loaded.query_pairs(query, 0.1))) == set(zip(*index.query_pairs(query, 0.1)))
+
+
+def test_fragment_index_cache(tmp_path):
+    rng = np.random.default_rng(2)
+    obj = _write_obj(tmp_path / 'frag.obj', rng.uniform(-1, 1, (100, 3)))
+    cache = tmp_path / 'cache'
+
+    # close cell sizes are cached apart
+    a = fragment_index(obj, 0.1, cache)
+    b = fragment_index(obj, 0.1000001, cache)
+    assert len(list(cache.glob('*.npz'))) == 2
+    assert fragment_index(obj, 0.1, cache).cell_size == a.cell_size == 0.1
+    assert fragment_index(obj, 0.1000001, cache).cell_size == b.cell_size == 0.1000001
+    assert not any('.tmp' in p.name for p in cache.iterdir())
+
+    # a changed mesh is indexed again
+    _write_obj(obj, rng.uniform(-1, 1, (120, 3)))
+    assert len(fragment_index(obj, 0.1, cache)) == 120
+
+
+def test_load_obj_mesh(tmp_path):
+    # quads are split in two triangles, all the index formats are read
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=np.float64)
+    obj = _write_obj(tmp_path / 'quad.obj', vertices, [(0, 1, 2, 3)])
+    v, f = load_obj_mesh(obj)
+    assert np.array_equal(v, vertices)
+    assert f.tolist() == [[0, 1, 2], [0, 2, 3]]
+
+
+def test_find_contacts(tmp_path):
+    rng = np.random.default_rng(3)
+    # two touching slabs and a far away one
+    a = rng.uniform((0, 0, 0), (1, 1, 1), (1000, 3))
+    b = rng.uniform((1.01, 0, 0), (2, 1, 1), (800, 3))
+    c = rng.uniform((5, 5, 5), (6, 6, 6), (200, 3))
+    fragments = [{'name': name, 'obj': _write_obj(tmp_path / f'{name}.obj', points)}
+                 for name, points in [('a', a), ('b', b), ('c', c)]]
+
+    threshold = 0.1
+    contacts = find_contacts(fragments, threshold, cache_dir=tmp_path / 'cache')
+    assert [contact['pair'] for contact in contacts] == [('a', 'b')]
+
+    close = _brute_pairs(a, b, threshold)
+    assert set(contacts[0]['points_a']) == {i for i, _ in close}
+    assert set(contacts[0]['points_b']) == {j for _, j in close}
+
+    # cached indexes give the same result
+    again = find_contacts(fragments, threshold, cache_dir=tmp_path / 'cache')
+    assert all(np.array_equal(x['points_a'], y['points_a']) for x, y in zip(contacts, again))
@@ -0,0 +1,71 @@
+import json
+import pickle
+
+import pytest
+
+from repair_dataset.stats import LoadStats
+
+
+def test_counters(open_dataset):
+    records = []
+    dataset = open_dataset(supervised_mode=True, collect_stats=True, stats_callback=records.append)
+    samples = [dataset[k] for k in range(len(dataset))]
+    stats = dataset.stats()
+
+    assert stats['samples'] == len(records) == len(dataset)
+    assert [r['name'] for r in records] == [x['name'] for x, _ in samples]
+    assert {'read_json', 'read_image', 'decode'} <= set(stats['stages_s'])
+    assert stats['total_s'] >= sum(stats['stages_s'].values()) * 0.99
+
+    images = [[frag['image'] for frag in x['fragments']] for x, _ in samples]
+    sizes = [sum(image.width * image.height * len(image.getbands()) for image in sample) for sample in images]
+    assert [r['image_bytes'] for r in records] == sizes
+    assert stats['image_bytes'] == sum(sizes)
+    assert stats['max_sample_image_bytes'] == max(sizes)
+    assert stats['bytes_read'] > 0 and stats['pixels_decoded'] > 0
+
+    dataset.reset_stats()
+    assert dataset.stats()['samples'] == 0
+
+
+def test_export(open_dataset, tmp_path):
+    dataset = open_dataset(supervised_mode=True, collect_stats=True)
+    dataset[0]
+    dataset.export_stats(tmp_path / 'stats.json')
+    with open(tmp_path / 'stats.json') as f:
+        assert json.load(f) == json.loads(json.dumps(dataset.stats()))
+
+    dataset.export_stats(tmp_path / 'stats.prom', format='prometheus')
+    lines = (tmp_path / 'stats.prom').read_text().splitlines()
+    values = {line.split(' ')[0]: float(line.split(' ')[1]) for line in lines if not line.startswith('#')}
+    labels = f'{{dataset="{dataset.variant_version}",split="all"}}'
+    assert values[f'repair_dataset_samples_total{labels}'] == 1
+    assert values[f'repair_dataset_image_bytes_total{labels}'] == dataset.stats()['image_bytes']
+
+    with pytest.raises(RuntimeError):
+        dataset.export_stats(tmp_path / 'stats.csv', format='csv')
+
+
+def test_disabled_and_pickled(open_dataset):
+    with pytest.raises(RuntimeError):
+        open_dataset().stats()
+
+    # statistics start empty in another process
+    dataset = open_dataset(collect_stats=True)
+    dataset[0]
+    copy = pickle.loads(pickle.dumps(dataset))
+    assert copy.stats()['samples'] == 0
+    assert dataset.stats()['samples'] == 1
+
+
+def test_sample_stats():
+    stats = LoadStats()
+    sample = stats.begin_sample('puzzle')
+    with sample.stage('decode'):
+        pass
+    with sample.stage('decode'):
+        pass
+    sample.add_read(10)
+    record = sample.end()
+    assert record['bytes_read'] == 10 and set(record['stages_s']) == {'decode'}
+    assert stats.to_dict()['samples'] == 1
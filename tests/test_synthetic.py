@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+from PIL import Image
+
+from repair_dataset.graph import parse_adjacency
+from repair_dataset.patches import patch_2ds_v2_0_1
+from repair_dataset.reconstruct import TiledSolution
+from repair_dataset.synthetic import FLIPPED_V2_PUZZLES, make_synthetic_dataset
+
+
+def _grow(mask):
+    # 8-neighborhood dilation by one pixel
+    g = mask.copy()
+    g[1:] |= mask[:-1]
+    g[:-1] |= mask[1:]
+    g[:, 1:] |= g[:, :-1].copy()
+    g[:, :-1] |= g[:, 1:].copy()
+    return g
+
+
+def test_adjacent_fragments_touch(open_dataset):
+    # adjacency indices are positions in the 'fragments' list: adjacent fragments touch once reassembled
+    dataset = open_dataset(supervised_mode=True)
+    for k in range(len(dataset)):
+        x, data = dataset[k]
+        size = tuple(data['solution_size'])
+        masks = []
+        for frag, gt in zip(x['fragments'], data['fragments']):
+            placed = TiledSolution([frag['image']], [gt['position_2d']], size, crop=False).image()
+            masks.append(np.asarray(placed.getchannel('A')) > 0)
+
+        with open(f"{data['path']}/data.json") as f:
+            i, j = parse_adjacency(json.load(f)['adjacency'], len(masks))
+        assert len(i) > 0
+        for a, b in zip(i, j):
+            assert np.any(_grow(masks[a]) & masks[b]), (data['name'], a, b)
+
+
+def test_solution_matches_the_preview(open_dataset):
+    # the ground truth poses put the fragments back on the preview, without overlaps
+    dataset = open_dataset(supervised_mode=True)
+    for k in range(len(dataset)):
+        x, data = dataset[k]
+        size = tuple(data['solution_size'])
+        preview = np.asarray(Image.open(f"{data['path']}/preview.png").convert('RGBA').getchannel('A')) > 0
+        count = np.zeros(preview.shape, dtype=np.int64)
+        for frag, gt in zip(x['fragments'], data['fragments']):
+            placed = TiledSolution([frag['image']], [gt['position_2d']], size, crop=False).image()
+            count += np.asarray(placed.getchannel('A')) > 0
+
+        assert np.mean(count > 1) < 0.01
+        assert np.mean((count > 0) != preview) < 0.01
+
+
+def test_v2_0_1_patch_fixes_the_flipped_puzzles(tmp_path):
+    names = list(FLIPPED_V2_PUZZLES) + ['puzzle_0000001_RP_group_0']
+    v2 = make_synthetic_dataset(tmp_path / 'v2', names=names, n_fragments=4, fragment_size=48, metadata_version=2)
+    v3 = make_synthetic_dataset(tmp_path / 'v3', names=names, n_fragments=4, fragment_size=48, metadata_version=3)
+
+    def positions(root, key):
+        out = {}
+        for name in names:
+            with open(root / name / 'data.json') as f:
+                out[name] = np.array([frag[key][:2] for frag in json.load(f)['fragments']], dtype=np.float64)
+        return out
+
+    expected = positions(v3, 'position_2d')
+    before = positions(v2, 'pixel_position')
+    for name in names:
+        assert np.allclose(before[name], expected[name]) == (name not in FLIPPED_V2_PUZZLES)
+
+    patch_2ds_v2_0_1(v2)
+    after = positions(v2, 'pixel_position')
+    for name in names:
+        assert np.allclose(after[name], expected[name])